@@ -1,11 +1,12 @@
 import argparse
 import logging
 import sys
+from functools import partial
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 
 import uvicorn
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch, Elasticsearch
 from pydantic import IPvAnyAddress
 from pydantic_core import ValidationError
 from typing_extensions import TypeVar
@@ -17,20 +18,32 @@ from benchmarks.core.config import ConfigParser, Builder
 from benchmarks.core.experiments.experiments import Experiment, ExperimentBuilder
 from benchmarks.deluge.agent.api import DelugeAgentConfig
 from benchmarks.deluge.config import DelugeExperimentConfig
+from benchmarks.logging.compression import Compression
 from benchmarks.logging.logging import (
     basic_log_parser,
-    LogSplitter,
     LogSplitterFormats,
     ConfigToLogAdapters,
+    LogParser,
 )
-from benchmarks.logging.sources.logstash import LogstashSource
+from benchmarks.logging.log_file import split_log_file
+from benchmarks.logging.sources.caching import CachingLogSource, DEFAULT_CACHE_SIZE
+from benchmarks.logging.sources.logstash import AsyncLogstashSource, LogstashSource
 from benchmarks.logging.sources.sources import (
     FSOutputManager,
     split_logs_in_source,
     LogSource,
     ChainedLogSource,
+    ConcurrentChainedLogSource,
+)
+from benchmarks.logging.sources.sorting import (
+    DEFAULT_MEMORY_BUDGET,
+    SortingLogSource,
+)
+from benchmarks.logging.sources.sqlite import SQLiteLogSource
+from benchmarks.logging.sources.vector_flat_file import (
+    VectorFlatFileSource,
+    VectorTailSource,
 )
-from benchmarks.logging.sources.vector_flat_file import VectorFlatFileSource
 
 experiment_config_parser = ConfigParser[ExperimentBuilder]()
 experiment_config_parser.register(DelugeExperimentConfig)
@@ -77,7 +90,16 @@ def cmd_describe_experiment(args):
     print(experiment_config_parser.experiment_types[args.type].schema_json(indent=2))
 
 
-def cmd_parse_single_log(log: Path, output: Path):
+def cmd_parse_single_log(
+    log: Path,
+    output: Path,
+    workers: int = 1,
+    default_format: LogSplitterFormats = LogSplitterFormats.csv,
+    passthrough: bool = False,
+    incremental: bool = False,
+    compression: Optional[Compression] = None,
+    compact_timestamps: bool = False,
+):
     if not log.exists():
         print(f"Log file {log} does not exist.")
         sys.exit(-1)
@@ -88,28 +110,51 @@ def cmd_parse_single_log(log: Path, output: Path):
 
     output.mkdir(exist_ok=True)
 
-    def output_factory(event_type: str, format: LogSplitterFormats):
-        return (output / f"{event_type}.{format.value}").open("w", encoding="utf-8")
-
-    with (
-        log.open("r", encoding="utf-8") as istream,
-        LogSplitter(output_factory) as splitter,
-    ):
-        for adapted_config in config_adapters.adapted_types():
-            splitter.set_format(adapted_config, LogSplitterFormats.jsonl)
-        splitter.split(log_parser.parse(istream))
+    split_log_file(
+        log,
+        output,
+        _log_parser,
+        formats=[
+            (adapted_config, LogSplitterFormats.jsonl)
+            for adapted_config in config_adapters.adapted_types()
+        ],
+        default_format=default_format,
+        passthrough=passthrough,
+        workers=workers,
+        incremental=incremental,
+        compression=compression,
+        compact_timestamps=compact_timestamps,
+    )
 
 
-def cmd_split_log_source(source: LogSource, group_id: str, output_dir: Path):
+def cmd_split_log_source(
+    source: LogSource,
+    group_id: str,
+    output_dir: Path,
+    default_format: LogSplitterFormats = LogSplitterFormats.csv,
+    passthrough: bool = False,
+    compression: Optional[Compression] = None,
+    compact_timestamps: bool = False,
+    experiment_workers: int = 0,
+    split_processes: int = 0,
+    flush_interval: Optional[float] = None,
+):
     if not output_dir.parent.exists():
         print(f"Folder {output_dir.parent} does not exist.")
         sys.exit(-1)
 
+    if flush_interval is not None and compression is not None:
+        print(
+            "Compressed outputs can only be read once complete, so --flush-interval cannot be combined "
+            "with --compress."
+        )
+        sys.exit(-1)
+
     output_dir.mkdir(exist_ok=True)
 
     with (
         source as log_source,
-        FSOutputManager(output_dir) as output_manager,
+        FSOutputManager(output_dir, compression=compression) as output_manager,
     ):
         split_logs_in_source(
             log_source,
@@ -120,6 +165,12 @@ def cmd_split_log_source(source: LogSource, group_id: str, output_dir: Path):
                 (adapted_config, LogSplitterFormats.jsonl)
                 for adapted_config in config_adapters.adapted_types()
             ],
+            default_format=default_format,
+            passthrough=passthrough,
+            compact_timestamps=compact_timestamps,
+            experiment_workers=experiment_workers,
+            split_processes=split_processes,
+            flush_interval=flush_interval,
         )
 
 
@@ -171,32 +222,155 @@ def _configure_logstash_source(args, structured_only=True):
 
     urllib3.disable_warnings()
 
-    return LogstashSource(
-        Elasticsearch(args.es_url, verify_certs=False),
+    if args.chronological and args.slices is not None and args.slices > 1:
+        print("Logs can only be read chronologically from a single slice.")
+        sys.exit(-1)
+
+    # Lines with entry types the parser does not know about would get discarded anyway.
+    entry_types = sorted(log_parser.entry_types.keys()) if structured_only else None
+    options = dict(
         chronological=args.chronological,
         structured_only=structured_only,
         slices=args.slices,
+        entry_types=entry_types,
+    )
+    source = (
+        AsyncLogstashSource(
+            AsyncElasticsearch(args.es_url, verify_certs=False), **options
+        )
+        if args.async_client
+        else LogstashSource(Elasticsearch(args.es_url, verify_certs=False), **options)
+    )
+    if args.cache_dir is None:
+        return source
+
+    return CachingLogSource(
+        source,
+        args.cache_dir,
+        max_size=args.cache_size * 1024**2,
+        invalidate=args.invalidate_cache,
+        # Which logs come back, and in which order, does not depend on the client or on slicing.
+        namespace=f"{args.es_url} structured_only={structured_only} "
+        f"chronological={args.chronological} entry_types={entry_types}",
     )
 
 
 def _configure_vector_source(args):
+    if args.follow:
+        if len(args.source_file) > 1 or args.chronological:
+            print(
+                "Only single log source files can be followed, and not chronologically."
+            )
+            sys.exit(-1)
+        return VectorTailSource(
+            args.source_file[0],
+            app_name="codex-benchmarks",
+            idle_timeout=args.idle_timeout,
+        )
+
     for source_file in args.source_file:
         if not source_file.exists():
             print(f"Log source file {args.source_file} does not exist.")
             sys.exit(-1)
-
-    return ChainedLogSource(
-        [
-            VectorFlatFileSource(
-                app_name="codex-benchmarks",
-                file=source_file.open(encoding="utf-8"),
-                sorted=args.chronological,
+        if args.chronological and Compression.from_path(source_file) is not None:
+            print(
+                f"Log source file {source_file} is compressed, and cannot be read in chronological order."
             )
-            for source_file in args.source_file
-        ]
+            sys.exit(-1)
+
+    factories = [
+        partial(
+            VectorFlatFileSource.from_path,
+            source_file,
+            app_name="codex-benchmarks",
+            sorted=args.chronological,
+            index=not args.no_index,
+        )
+        for source_file in args.source_file
+    ]
+
+    if args.workers > 1 and len(factories) > 1:
+        # Reading Vector dumps is mostly JSON parsing, so threads would not help much.
+        return ConcurrentChainedLogSource(
+            factories, workers=args.workers, processes=True
+        )
+
+    return ChainedLogSource([factory() for factory in factories])
+
+
+def _configure_sqlite_source(args, structured_only: bool) -> SQLiteLogSource:
+    if not args.database.exists():
+        print(f"Log database {args.database} does not exist.")
+        sys.exit(-1)
+    return _sqlite_source(args, args.database, structured_only)
+
+
+def _sqlite_source(args, database: Path, structured_only: bool) -> SQLiteLogSource:
+    return SQLiteLogSource(
+        database,
+        chronological=args.chronological,
+        # Lines with entry types the parser does not know about would get discarded anyway.
+        entry_types=sorted(log_parser.entry_types.keys()) if structured_only else None,
     )
 
 
+def _stored_source(args, structured_only: bool) -> LogSource:
+    if args.store is None:
+        return args.source(args, structured_only)
+
+    store = _sqlite_source(args, args.store, structured_only)
+    if args.refresh_store or not store.has_group(args.group_id):
+        # Groups get marked as stored in full, so they must be stored unfiltered, whatever later reads of
+        # them filter on.
+        with args.source(args, False) as source:
+            store.ingest(source, args.group_id)
+    return store
+
+
+def _sorted_source(args, source: LogSource) -> LogSource:
+    if not args.external_sort:
+        return source
+    return SortingLogSource(source, memory_budget=args.sort_memory * 1024**2)
+
+
+def _log_parser() -> LogParser:
+    # Worker processes get the parser through this (picklable) factory.
+    return log_parser
+
+
+def _add_output_arguments(command: argparse.ArgumentParser):
+    command.add_argument(
+        "--format",
+        type=str,
+        choices=[output_format.value for output_format in LogSplitterFormats],
+        help="Output format for parsed log entries. Experiment configurations are always "
+        "output as JSONL. Parquet requires pyarrow to be installed.",
+        default=LogSplitterFormats.csv.value,
+    )
+    command.add_argument(
+        "--passthrough",
+        action="store_true",
+        help="Copy structured entries which are output as JSONL straight from the logs, validating "
+        "only a sample of them.",
+    )
+    command.add_argument(
+        "--compress",
+        type=str,
+        choices=[compression.name for compression in Compression],
+        help="Compress CSV and JSONL outputs. zstd requires the zstd extra (zstandard).",
+        default=None,
+    )
+    command.add_argument(
+        "--compact-timestamps",
+        action="store_true",
+        help="Write timestamps onto CSV outputs as integer nanoseconds since the Unix epoch.",
+    )
+
+
+def _output_compression(args) -> Optional[Compression]:
+    return Compression[args.compress] if args.compress else None
+
+
 def _init_logging():
     import logging
 
@@ -261,12 +435,38 @@ def main():
     single_log_cmd = log_subcommands.add_parser(
         "single", help="Parse a single log file."
     )
-    single_log_cmd.add_argument("log", type=Path, help="Path to the log file.")
+    single_log_cmd.add_argument(
+        "log",
+        type=Path,
+        help="Path to the log file. Can be compressed with gzip or zstd.",
+    )
     single_log_cmd.add_argument(
         "output_dir", type=Path, help="Path to an output folder."
     )
+    single_log_cmd.add_argument(
+        "--workers",
+        type=int,
+        help="Number of worker processes to parse the log file with.",
+        default=1,
+    )
+    single_log_cmd.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only parse what got appended to the log file since the last incremental run, and append it "
+        "to the existing outputs. Not supported for Parquet outputs.",
+    )
+    _add_output_arguments(single_log_cmd)
     single_log_cmd.set_defaults(
-        func=lambda args: cmd_parse_single_log(args.log, args.output_dir)
+        func=lambda args: cmd_parse_single_log(
+            args.log,
+            args.output_dir,
+            workers=args.workers,
+            default_format=LogSplitterFormats(args.format),
+            passthrough=args.passthrough,
+            incremental=args.incremental,
+            compression=_output_compression(args),
+            compact_timestamps=args.compact_timestamps,
+        )
     )
 
     log_source_cmd = log_subcommands.add_parser(
@@ -288,15 +488,68 @@ def main():
         help="Splits logs for the entire group into the specified folder.",
     )
 
+    log_source_cmd.add_argument(
+        "--external-sort",
+        action="store_true",
+        help="Sort logs chronologically by spilling sorted runs onto disk. Works with any source, and "
+        "with any ordering of lines within sources.",
+    )
+    log_source_cmd.add_argument(
+        "--sort-memory",
+        type=int,
+        default=DEFAULT_MEMORY_BUDGET // 1024**2,
+        help="Memory budget for --external-sort, in megabytes.",
+    )
+    log_source_cmd.add_argument(
+        "--store",
+        type=Path,
+        default=None,
+        help="Stores logs for the group in this SQLite database, unless they are there already, and reads "
+        "them from it. Later runs can then read them with the sqlite source.",
+    )
+    log_source_cmd.add_argument(
+        "--refresh-store",
+        action="store_true",
+        help="Stores logs for the group in the --store database even if they are there already.",
+    )
+    log_source_cmd.add_argument(
+        "--flush-interval",
+        type=float,
+        default=None,
+        help="Flushes outputs every this many seconds, so that CSV and JSONL outputs can be read while logs "
+        "are still being split. Parquet outputs get a row group per flush, and can only be read once "
+        "complete. Meant for sources which follow logs as they get written, like vector --follow. Cannot "
+        "be combined with --compress.",
+    )
+    log_source_cmd.add_argument(
+        "--split-processes",
+        type=int,
+        default=0,
+        help="Splits logs in this many worker processes, sharded by experiment, while they get retrieved in "
+        "the main process. Cannot be combined with --experiment-workers.",
+    )
+
     single_or_split.set_defaults(
         func=lambda args: cmd_dump_single_experiment(
-            args.source(args, False), args.group_id, args.experiment_id
+            _sorted_source(args, _stored_source(args, False)),
+            args.group_id,
+            args.experiment_id,
         )
         if args.experiment_id
         else cmd_split_log_source(
-            args.source(args, True), args.group_id, args.output_dir
+            _sorted_source(args, _stored_source(args, True)),
+            args.group_id,
+            args.output_dir,
+            default_format=LogSplitterFormats(args.format),
+            passthrough=args.passthrough,
+            compression=_output_compression(args),
+            compact_timestamps=args.compact_timestamps,
+            experiment_workers=args.experiment_workers,
+            split_processes=args.split_processes,
+            flush_interval=args.flush_interval,
         )
     )
+    _add_output_arguments(log_source_cmd)
 
     source_type = log_source_cmd.add_subparsers(required=True)
     es_source = source_type.add_parser("logstash", help="Logstash source.")
@@ -309,8 +562,43 @@ def main():
     es_source.add_argument(
         "--slices",
         type=int,
-        help="Number of scroll slices to use when reading the log.",
-        default=2,
+        help="Number of slices to read the log with. Defaults to the number of shards of the log indexes, "
+        "or to a single slice with --chronological.",
+        default=None,
+    )
+
+    es_source.add_argument(
+        "--async-client",
+        action="store_true",
+        help="Reads all slices on a single event loop with the async ES client, keeping the next page for "
+        "each slice in flight while the current one is being processed.",
+    )
+
+    es_source.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="Caches retrieved logs in this folder, so that later runs for the same group read them from "
+        "local disk rather than from Elasticsearch.",
+    )
+    es_source.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE // 1024**2,
+        help="Maximum size of the log cache, in megabytes. Least recently used logs get evicted past that.",
+    )
+    es_source.add_argument(
+        "--invalidate-cache",
+        action="store_true",
+        help="Drops cached logs for the group and retrieves them again.",
+    )
+
+    es_source.add_argument(
+        "--experiment-workers",
+        type=int,
+        default=0,
+        help="Retrieves and splits experiments with separate queries, this many at a time. By default, "
+        "logs for the whole group get retrieved with a single query.",
     )
 
     es_source.set_defaults(
@@ -321,13 +609,62 @@ def main():
 
     vector_source = source_type.add_parser("vector", help="Vector flat file source.")
     vector_source.add_argument(
-        "source_file", type=Path, help="Vector log file to parse from.", nargs="+"
+        "source_file",
+        type=Path,
+        help="Vector log file to parse from. Can be compressed with gzip or zstd.",
+        nargs="+",
+    )
+    vector_source.add_argument(
+        "--chronological", action="store_true", help="Sort logs chronologically."
+    )
+    vector_source.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of source files to read at once, in separate processes.",
     )
     vector_source.add_argument(
-        "--chronological", action="store_true", help="Sort logs chronologically (slow)."
+        "--follow",
+        action="store_true",
+        help="Follows the log source file as it gets written to, like tail -F, until it goes without new "
+        "lines for --idle-timeout seconds (or until interrupted).",
+    )
+    vector_source.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=None,
+        help="How long to wait for new lines when following, in seconds. Waits indefinitely if omitted.",
+    )
+    vector_source.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Do not build or use sidecar indexes (stored next to uncompressed source files).",
     )
 
-    vector_source.set_defaults(source=lambda args, _: _configure_vector_source(args))
+    vector_source.set_defaults(
+        source=lambda args, _: _configure_vector_source(args),
+        # Vector sources read off of a single file handle, so they cannot be queried concurrently.
+        experiment_workers=0,
+    )
+
+    sqlite_source = source_type.add_parser(
+        "sqlite", help="SQLite log database, as populated with --store."
+    )
+    sqlite_source.add_argument("database", type=Path, help="Path to the database.")
+    sqlite_source.add_argument(
+        "--chronological", action="store_true", help="Sort logs chronologically."
+    )
+    sqlite_source.add_argument(
+        "--experiment-workers",
+        type=int,
+        default=0,
+        help="Splits this many experiments at once, reading each with a separate query.",
+    )
+    sqlite_source.set_defaults(
+        source=lambda args, structured_only: _configure_sqlite_source(
+            args, structured_only
+        )
+    )
 
     ###########################################################################
     #                              Agents                                     #
@@ -1,9 +1,23 @@
 import asyncio
+import multiprocessing
+import pickle
 from concurrent import futures
 from concurrent.futures.thread import ThreadPoolExecutor
-from queue import Queue
+from multiprocessing.process import BaseProcess
+from queue import Empty, Full, Queue
 from time import time, sleep
-from typing import Iterable, Iterator, List, cast, Awaitable, Callable
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    cast,
+)
 
 from typing_extensions import TypeVar
 
@@ -42,6 +56,16 @@ class _End:
     pass
 
 
+class _TaskEnd:
+    def __init__(self, task: int, exception: Optional[BaseException]) -> None:
+        self.task = task
+        self.exception = exception
+
+
+#: How often, in seconds, :func:`pflatmap_processes` checks for worker processes which died unexpectedly.
+_LIVENESS_CHECK_INTERVAL = 5.0
+
+
 T = TypeVar("T")
 
 
@@ -89,6 +113,257 @@ def pflatmap(
         executor.shutdown(wait=True)
 
 
+def pflatmap_processes(
+    tasks: Sequence[Callable[[], Iterable[T]]],
+    workers: int,
+    max_queue_size: int = 0,
+    batch_size: int = 1000,
+) -> Iterator[T]:
+    """
+    Parallel flatmap over separate processes. Like :func:`pflatmap`, but for CPU-bound tasks, which would
+    otherwise contend for the GIL. Items are sent over from worker processes in batches, to amortize the
+    cost of inter-process communication.
+
+    :param tasks: Functions returning the iterables to be run in separate processes. Must be picklable,
+        as must the items they produce.
+    :param workers: Maximum number of processes to run at once.
+    :param max_queue_size: Maximum number of backlogged batches.
+    :param batch_size: Number of items per batch.
+
+    :return: An iterator over the items produced by the tasks.
+    """
+    context = multiprocessing.get_context("spawn")
+    q = context.Queue(max_queue_size)
+    pending = list(enumerate(tasks))
+    processes: Dict[int, BaseProcess] = {}
+    finished: Set[int] = set()
+    dead: Set[int] = set()
+    exceptions: List[BaseException] = []
+
+    def _start() -> None:
+        index, task = pending.pop(0)
+        process = context.Process(
+            target=_produce, args=(q, index, task, batch_size), daemon=True
+        )
+        process.start()
+        processes[index] = process
+
+    completed = False
+    try:
+        for _ in range(min(workers, len(pending))):
+            _start()
+
+        while len(finished) < len(tasks):
+            try:
+                item = q.get(timeout=_LIVENESS_CHECK_INTERVAL)
+            except Empty:
+                _check_alive(processes, finished, dead)
+                continue
+
+            if isinstance(item, _TaskEnd):
+                finished.add(item.task)
+                if item.exception is not None:
+                    exceptions.append(item.exception)
+                if pending:
+                    _start()
+            else:
+                yield from item
+
+        completed = True
+    finally:
+        for process in processes.values():
+            # Workers are only still running if the consumer stopped early, or if something went wrong.
+            if not completed and process.is_alive():
+                process.terminate()
+            process.join()
+
+    if exceptions:
+        raise ExceptionGroup(
+            "One or more computations failed to complete successfully",
+            cast(List[Exception], exceptions),
+        )
+
+
+def _produce(
+    q: multiprocessing.Queue,
+    index: int,
+    task: Callable[[], Iterable[T]],
+    batch_size: int,
+) -> None:
+    exception: Optional[BaseException] = None
+    batch: List[T] = []
+    try:
+        for item in task():
+            batch.append(item)
+            if len(batch) >= batch_size:
+                q.put(batch)
+                batch = []
+    except Exception as err:
+        exception = _picklable(err)
+    finally:
+        if batch:
+            q.put(batch)
+        q.put(_TaskEnd(index, exception))
+
+
+def pshard_processes(
+    items: Iterable[T],
+    consumer: Callable[[Iterator[T]], None],
+    shard: Callable[[T], int],
+    workers: int,
+    max_queue_size: int = 0,
+    batch_size: int = 1000,
+) -> None:
+    """
+    Parallel sharded consumption over separate processes. The reverse of :func:`pflatmap_processes`: items
+    get produced in the current process, and each gets handed over to the worker process its shard maps to.
+    Each worker process runs `consumer` over the items in its shard, in the order they were produced. Items
+    are sent over to worker processes in batches, to amortize the cost of inter-process communication.
+
+    :param items: The items to consume.
+    :param consumer: Consumes the items in a shard. Must be picklable, as must the items.
+    :param shard: Maps an item onto the index of the worker process which should consume it, between `0` and
+        `workers - 1`. Gets called in the current process only.
+    :param workers: Number of processes to run.
+    :param max_queue_size: Maximum number of backlogged batches, per worker process.
+    :param batch_size: Number of items per batch.
+    """
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(max_queue_size) for _ in range(workers)]
+    results = context.Queue()
+    processes: Dict[int, BaseProcess] = {}
+    finished: Set[int] = set()
+    dead: Set[int] = set()
+    exceptions: List[BaseException] = []
+
+    def _collect(block: bool) -> None:
+        while len(finished) < workers:
+            try:
+                end = results.get(block=block, timeout=_LIVENESS_CHECK_INTERVAL)
+            except Empty:
+                _check_alive(processes, finished, dead)
+                if not block:
+                    return
+                continue
+            finished.add(end.task)
+            if end.exception is not None:
+                exceptions.append(end.exception)
+
+    def _put(index: int, item: List[T] | _End) -> None:
+        while True:
+            # Workers which failed stop consuming their queues, so there's no point in feeding the others.
+            _collect(block=False)
+            if exceptions or index in finished:
+                raise _ShardFailed()
+            try:
+                queues[index].put(item, timeout=_LIVENESS_CHECK_INTERVAL)
+                return
+            except Full:
+                continue
+
+    completed = False
+    try:
+        for index in range(workers):
+            processes[index] = context.Process(
+                target=_consume_shard,
+                args=(queues[index], results, index, consumer),
+                daemon=True,
+            )
+            processes[index].start()
+
+        batches: List[List[T]] = [[] for _ in range(workers)]
+        for item in items:
+            index = shard(item)
+            batch = batches[index]
+            batch.append(item)
+            if len(batch) >= batch_size:
+                _put(index, batch)
+                batches[index] = []
+
+        for index, batch in enumerate(batches):
+            if batch:
+                _put(index, batch)
+            _put(index, _End())
+
+        _collect(block=True)
+        completed = True
+    except _ShardFailed:
+        pass
+    finally:
+        for index, process in processes.items():
+            if not completed:
+                # Batches left behind in the queue would otherwise keep us from exiting.
+                queues[index].cancel_join_thread()
+                if process.is_alive():
+                    process.terminate()
+            process.join()
+
+    if exceptions:
+        raise ExceptionGroup(
+            "One or more computations failed to complete successfully",
+            cast(List[Exception], exceptions),
+        )
+
+
+class _ShardFailed(Exception):
+    pass
+
+
+def _consume_shard(
+    q: multiprocessing.Queue,
+    results: multiprocessing.Queue,
+    index: int,
+    consumer: Callable[[Iterator[T]], None],
+) -> None:
+    def _items() -> Iterator[T]:
+        while True:
+            batch = q.get()
+            if isinstance(batch, _End):
+                return
+            yield from batch
+
+    exception: Optional[BaseException] = None
+    try:
+        items = _items()
+        consumer(items)
+        # Consumers which stop early must not leave the producer blocked on a full queue.
+        for _ in items:
+            pass
+    except Exception as err:
+        exception = _picklable(err)
+    finally:
+        results.put(_TaskEnd(index, exception))
+
+
+def _picklable(err: BaseException) -> BaseException:
+    try:
+        pickle.dumps(err)
+        return err
+    except Exception:
+        # Exceptions which cannot be pickled would get dropped on their way to the parent.
+        return RuntimeError(repr(err))
+
+
+def _check_alive(
+    processes: Dict[int, BaseProcess], finished: Set[int], dead: Set[int]
+) -> None:
+    """Raises if a worker process exited without reporting that it finished. Workers may exit right after
+    reporting back, but before we get to their report, so they only count as having died if they are still
+    found exited, and not finished, on the next check. Their report would have come through by then, as
+    there is always another read off of the queue in between, and whatever workers put onto queues gets
+    sent before they exit.
+
+    :param dead: Workers found exited, and not finished, on earlier checks. Gets updated."""
+    for index, process in processes.items():
+        if index in finished or process.is_alive():
+            continue
+        if index in dead:
+            raise RuntimeError(
+                f"Worker process for task {index} died unexpectedly (exit code {process.exitcode})."
+            )
+        dead.add(index)
+
+
 def ensure_successful(futs: Iterable[futures.Future[T]]) -> List[T]:
     future_list = list(futs)
     futures.wait(future_list, return_when=futures.ALL_COMPLETED)
@@ -1,10 +1,23 @@
+import json
+import os
 from concurrent.futures.thread import ThreadPoolExecutor
+from functools import partial
+from itertools import count
+from multiprocessing.process import BaseProcess
+from pathlib import Path
 from threading import Semaphore
-from typing import Iterable
+from typing import Dict, Iterable, Iterator, Set, Tuple, cast
 
 import pytest
 
-from benchmarks.core.concurrency import pflatmap, ensure_successful
+from benchmarks.core import concurrency
+from benchmarks.core.concurrency import (
+    _check_alive,
+    pflatmap,
+    pflatmap_processes,
+    pshard_processes,
+    ensure_successful,
+)
 
 
 @pytest.fixture
@@ -87,3 +100,149 @@ def test_should_raise_exception_when_one_task_fails(executor):
         assert len(e.exceptions) == 5
         for exception in e.exceptions:
             assert str(exception) == "I'm very faulty"
+
+
+def numbers(start: int, count: int) -> Iterable[int]:
+    yield from range(start, start + count)
+
+
+def faulty_numbers() -> Iterable[int]:
+    yield 42
+    raise ValueError("I'm very faulty")
+
+
+def test_should_run_iterators_in_separate_processes():
+    items = list(
+        pflatmap_processes(
+            [partial(numbers, i * 100, 100) for i in range(5)],
+            workers=2,
+            max_queue_size=2,
+            batch_size=7,
+        )
+    )
+
+    assert sorted(items) == list(range(500))
+    # Items from the same task come in order.
+    for i in range(5):
+        assert [item for item in items if item // 100 == i] == list(
+            numbers(i * 100, 100)
+        )
+
+
+def test_should_raise_exceptions_raised_in_processes_at_the_end():
+    actual_vals = set()
+    try:
+        for val in pflatmap_processes(
+            [partial(numbers, 0, 10), faulty_numbers], workers=2
+        ):
+            actual_vals.add(val)
+        assert False, "ValueError was not raised"
+    except* ValueError:
+        pass
+
+    assert actual_vals == set(range(10)) | {42}
+
+
+def test_should_stop_processes_when_consumer_stops_early():
+    it = pflatmap_processes(
+        [partial(numbers, 0, 1_000_000)], workers=1, max_queue_size=1, batch_size=10
+    )
+    assert next(it) == 0
+    # Would hang if the worker were left blocked on a full queue.
+    it.close()
+
+
+def record_shard(output: Path, items: Iterator[Tuple[int, int]]) -> None:
+    recorded = list(items)
+    if recorded:
+        (output / str(recorded[0][0])).write_text(json.dumps(recorded))
+
+
+def fail_on_odd_shards(items: Iterator[Tuple[int, int]]) -> None:
+    for shard, _ in items:
+        if shard % 2 == 1:
+            raise ValueError("I'm very faulty")
+
+
+def consume_first(items: Iterator[Tuple[int, int]]) -> None:
+    next(items)
+
+
+def test_should_consume_shards_in_separate_processes(tmp_path):
+    pshard_processes(
+        ((i % 3, i) for i in range(500)),
+        consumer=partial(record_shard, tmp_path),
+        shard=lambda item: item[0],
+        workers=3,
+        max_queue_size=2,
+        batch_size=7,
+    )
+
+    # Each shard gets all of its items, in order.
+    for shard in range(3):
+        assert json.loads((tmp_path / str(shard)).read_text()) == [
+            [shard, i] for i in range(shard, 500, 3)
+        ]
+
+
+def test_should_stop_producing_once_a_shard_fails():
+    # Would never return if production did not stop.
+    try:
+        pshard_processes(
+            ((i % 2, i) for i in count()),
+            consumer=fail_on_odd_shards,
+            shard=lambda item: item[0],
+            workers=2,
+            max_queue_size=1,
+            batch_size=10,
+        )
+        assert False, "ValueError was not raised"
+    except* ValueError:
+        pass
+
+
+def test_should_not_block_when_consumers_stop_early():
+    pshard_processes(
+        ((0, i) for i in range(10_000)),
+        consumer=consume_first,
+        shard=lambda item: item[0],
+        workers=1,
+        max_queue_size=1,
+        batch_size=10,
+    )
+
+
+class ExitedProcess:
+    exitcode = 0
+
+    def is_alive(self) -> bool:
+        return False
+
+
+def test_should_not_report_workers_which_exit_before_their_report_is_read_as_dead():
+    processes = cast(Dict[int, BaseProcess], {0: ExitedProcess()})
+    dead: Set[int] = set()
+
+    # The worker exited right after reporting back, and its report is still on its way.
+    _check_alive(processes, set(), dead)
+    # The report came through.
+    _check_alive(processes, {0}, dead)
+
+
+def test_should_report_workers_which_exit_without_reporting_back_as_dead():
+    processes = cast(Dict[int, BaseProcess], {0: ExitedProcess()})
+    dead: Set[int] = set()
+
+    _check_alive(processes, set(), dead)
+    with pytest.raises(RuntimeError, match="died unexpectedly"):
+        _check_alive(processes, set(), dead)
+
+
+def exit_abruptly() -> Iterable[int]:
+    os._exit(1)
+
+
+def test_should_raise_when_worker_processes_die(monkeypatch):
+    monkeypatch.setattr(concurrency, "_LIVENESS_CHECK_INTERVAL", 0.1)
+    with pytest.raises(RuntimeError, match="died unexpectedly"):
+        list(pflatmap_processes([exit_abruptly], workers=1))
@@ -0,0 +1,103 @@
+"""Transparent (de)compression of log files and outputs. The codec is chosen by file extension, so that
+compressed logs can be processed as they are, without decompressing them onto disk first."""
+
+import gzip
+import io
+from enum import Enum
+from pathlib import Path
+from typing import IO, Optional, cast
+
+#: Buffer size for compressed streams. Calls into (de)compressors have a high fixed cost, so we want to
+#: make as few of them as possible.
+BUFFER_SIZE = 1024 * 1024
+
+#: Compression level for gzip outputs. Levels above this buy very little in terms of size at a much
+#: higher cost in terms of time; this is the level `gzip` itself uses by default.
+GZIP_LEVEL = 6
+
+#: Compression level for zstd outputs, which is the level `zstd` itself uses by default.
+ZSTD_LEVEL = 3
+
+
+class Compression(Enum):
+    gzip = "gz"
+    zstd = "zst"
+
+    @property
+    def suffix(self) -> str:
+        return f".{self.value}"
+
+    @staticmethod
+    def from_path(path: Path) -> Optional["Compression"]:
+        """Returns the compression a file uses based on its extension, or `None` if it is not compressed."""
+        return _SUFFIXES.get(path.suffix.lower())
+
+
+_SUFFIXES = {
+    ".gz": Compression.gzip,
+    ".gzip": Compression.gzip,
+    ".zst": Compression.zstd,
+    ".zstd": Compression.zstd,
+}
+
+
+def open_file(path: Path, mode: str = "r", encoding: Optional[str] = "utf-8") -> IO:
+    """Opens a file for reading or writing like :meth:`Path.open` would, but decompressing or compressing it
+    on the fly if its extension calls for it. Binary modes require `encoding` to be `None`.
+
+    Compressed files can be appended to, in which case the new content ends up in a separate member (gzip)
+    or frame (zstd); both are read back as a single stream. Compressed files do not support seeking backwards,
+    however."""
+    compression = Compression.from_path(path)
+    if compression is None:
+        return path.open(mode, buffering=BUFFER_SIZE, encoding=encoding)
+
+    binary_mode = mode.replace("t", "").replace("b", "")
+    reading = binary_mode == "r"
+
+    stream: IO
+    if compression == Compression.gzip:
+        # GzipFile buffers 128KiB for reads and 32KiB for writes. Buffered streams only need `readinto` and
+        # `write` off of whatever they wrap, which GzipFile has, so this puts our larger buffer on top of it.
+        raw = cast(
+            io.RawIOBase,
+            gzip.GzipFile(path, f"{binary_mode}b", compresslevel=GZIP_LEVEL),
+        )
+        stream = (
+            io.BufferedReader(raw, BUFFER_SIZE)
+            if reading
+            else io.BufferedWriter(raw, BUFFER_SIZE)
+        )
+    else:
+        zstandard = _zstandard()
+        fileobj = path.open(f"{binary_mode}b")
+        stream = (
+            io.BufferedReader(
+                zstandard.ZstdDecompressor().stream_reader(
+                    fileobj, read_size=BUFFER_SIZE, read_across_frames=True
+                ),
+                BUFFER_SIZE,
+            )
+            if reading
+            else io.BufferedWriter(
+                zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(fileobj),
+                BUFFER_SIZE,
+            )
+        )
+
+    if "b" in mode:
+        return stream
+
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as err:
+        raise ImportError(
+            "Reading or writing zstd-compressed files requires zstandard to be installed "
+            "(e.g. with `poetry install --extras zstd`)."
+        ) from err
+
+    return zstandard
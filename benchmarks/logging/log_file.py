@@ -0,0 +1,541 @@
+"""Parsing and splitting of single log files, like the ones produced by `kubectl logs` when collecting logs
+for an experiment group. Those can get quite large (tens of GB), so we allow splitting them into shards which
+get parsed in parallel."""
+
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import IO, Callable, Dict, Iterator, List, Optional, Set, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+from benchmarks.core.concurrency import ensure_successful
+from benchmarks.logging.compression import BUFFER_SIZE, Compression, open_file
+from benchmarks.logging.logging import (
+    MARKER,
+    LogEntry,
+    LogParser,
+    LogSplitter,
+    LogSplitterFormats,
+)
+
+logger = logging.getLogger(__name__)
+
+#: How many shards to cut the log file into per worker. Having more shards than workers evens out the load
+#: when some parts of the log are denser in structured entries than others.
+SHARDS_PER_WORKER = 4
+
+#: Name of the file, within the output folder, which incremental parsing keeps its checkpoint in.
+CHECKPOINT_FILE = ".checkpoint.json"
+
+#: How many bytes at the head of a log, and right before a checkpoint's offset, get digested to tell whether
+#: the log still matches the checkpoint.
+CHECKPOINT_DIGEST_BYTES = 64 * 1024
+
+_MARKER_BYTES = MARKER.encode("utf-8")
+
+type LogParserFactory = Callable[[], LogParser]
+
+
+def shard_boundaries(
+    log: Path, shards: int, start: int = 0, end: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    """Cuts the `[start, end)` byte range of a log file (the whole file, by default) into (at most) `shards`
+    byte ranges of roughly the same size which are aligned to line boundaries; i.e., every line starting within
+    the range belongs to exactly one shard. `start` must be at the beginning of a line.
+
+    :return: A list of `[start, end)` byte ranges, in file order."""
+    end = log.stat().st_size if end is None else end
+    boundaries = [start]
+    with log.open("rb") as istream:
+        for i in range(1, shards):
+            offset = max(start + (end - start) * i // shards, boundaries[-1])
+            if offset >= end:
+                break
+            istream.seek(offset)
+            # Moves onto the start of the next line.
+            istream.readline()
+            boundaries.append(min(istream.tell(), end))
+    boundaries.append(end)
+
+    return [
+        (start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end
+    ]
+
+
+def marked_lines(log: Path, start: int = 0, end: Optional[int] = None) -> Iterator[str]:
+    """Iterates over the lines which start within the `[start, end)` byte range of a log file and contain
+    the structured log marker. `start` must be at the beginning of a line. The file is memory-mapped and scanned
+    for the marker as bytes, so that only matching lines ever get decoded; this matters as the vast majority of
+    lines in a typical log carry no structured entries.
+
+    Compressed logs can neither be memory-mapped nor read from arbitrary offsets, so those get streamed through
+    in their entirety instead, and do not support byte ranges."""
+    if Compression.from_path(log) is not None:
+        if start != 0 or end is not None:
+            raise ValueError("Byte ranges are not supported for compressed logs.")
+        yield from _streamed_marked_lines(log)
+        return
+
+    size = log.stat().st_size
+    end = size if end is None else end
+    # Empty files cannot be memory-mapped.
+    if size == 0:
+        return
+
+    with (
+        log.open("rb") as istream,
+        mmap.mmap(istream.fileno(), 0, access=mmap.ACCESS_READ) as buffer,
+    ):
+        position = start
+        while position < end:
+            index = buffer.find(_MARKER_BYTES, position)
+            if index == -1:
+                break
+
+            line_start = buffer.rfind(b"\n", position, index) + 1
+            line_start = max(line_start, position)
+            if line_start >= end:
+                break
+
+            line_end = buffer.find(b"\n", index)
+            line_end = size if line_end == -1 else line_end + 1
+
+            yield buffer[line_start:line_end].decode("utf-8")
+            position = line_end
+
+
+def _streamed_marked_lines(log: Path) -> Iterator[str]:
+    with open_file(log, "rb", encoding=None) as istream:
+        for line in istream:
+            if _MARKER_BYTES in line:
+                yield line.decode("utf-8")
+
+
+class SplitterSettings(BaseModel):
+    """Settings for the :class:`LogSplitter`s a log file gets split with. These get shipped onto worker
+    processes, and recorded in checkpoints."""
+
+    formats: List[Tuple[str, LogSplitterFormats]] = []
+    default_format: LogSplitterFormats = LogSplitterFormats.csv
+    passthrough: bool = False
+    compact_timestamps: bool = False
+
+    def splitter(
+        self, output_factory: Callable[[str, LogSplitterFormats], IO]
+    ) -> LogSplitter:
+        splitter = LogSplitter(
+            output_factory,
+            default_format=self.default_format,
+            passthrough=self.passthrough,
+            compact_timestamps=self.compact_timestamps,
+        )
+        for entry_type, output_format in self.formats:
+            splitter.set_format(entry_type, output_format)
+        return splitter
+
+    def output_formats(self) -> List[LogSplitterFormats]:
+        return [self.default_format] + [f for _, f in self.formats]
+
+
+class LogFileCheckpoint(BaseModel):
+    """Records how far into a log file :func:`split_log_file` got, and which outputs it produced, so that
+    parsing can be resumed from there once the log grows."""
+
+    offset: int
+    """Byte offset up to which the log has been parsed. Always at the start of a line."""
+    digest: str
+    """Digest of the log's contents around `offset`, used to tell whether the log is still the one we parsed."""
+    settings: SplitterSettings
+    outputs: Dict[str, int]
+    """Names of the outputs produced so far, relative to the output folder, along with their sizes in bytes as of
+    the checkpoint."""
+
+
+def split_log_file(
+    log: Path,
+    output: Path,
+    log_parser: LogParserFactory,
+    formats: Optional[List[Tuple[Type[LogEntry], LogSplitterFormats]]] = None,
+    default_format: LogSplitterFormats = LogSplitterFormats.csv,
+    passthrough: bool = False,
+    workers: int = 1,
+    incremental: bool = False,
+    compression: Optional[Compression] = None,
+    compact_timestamps: bool = False,
+) -> None:
+    """Parses a single log file and splits its entries into separate files per entry type within `output`.
+
+    When more than one worker is requested, the file is cut into shards at line boundaries which are then parsed
+    in separate processes, each into its own scratch folder. Outputs for the same entry type are then concatenated
+    in shard order, so that entries end up in the same order as they appear in the log.
+
+    In incremental mode, a :class:`LogFileCheckpoint` gets stored in `output` alongside the outputs. Reruns
+    then only parse what got appended to the log since, and append it to the existing outputs. A trailing line
+    which is not yet terminated is assumed to be still in the process of being written, and gets left for the next
+    run. If the log no longer matches the checkpoint (e.g. it got rotated or regenerated) or the output settings
+    changed, the log gets parsed from the start.
+
+    Outputs get appended to before the checkpoint gets saved, so a run which gets interrupted in between leaves rows
+    behind which the checkpoint does not account for. Reruns truncate outputs back to the sizes recorded in the
+    checkpoint, and drop outputs it does not list, before appending to them, so those rows do not get duplicated.
+
+    Logs compressed with gzip or zstd (as told by their extension) get decompressed on the fly. Those have to be
+    read sequentially, however, so they are always parsed by a single worker, and cannot be parsed incrementally.
+
+    :param log: The log file to parse.
+    :param output: An existing folder to place outputs in.
+    :param log_parser: A factory for a suitably configured :class:`LogParser`. Since this gets sent onto worker
+        processes, it must be picklable; i.e., a module-level function.
+    :param formats: An additional format configuration to be fed onto :class:`LogSplitter`.
+    :param default_format: The format to use for entry types which have no format set in `formats`.
+    :param passthrough: Whether to run :class:`LogSplitter` in pass-through mode.
+    :param workers: The number of worker processes to use.
+    :param incremental: Whether to resume parsing from the last checkpoint, and record a new one.
+    :param compression: The compression to apply to text (CSV and JSONL) outputs, if any.
+    :param compact_timestamps: Whether to write timestamps onto CSV outputs as epoch nanoseconds.
+
+    :raises ValueError: if incremental parsing is requested with Parquet or compressed outputs, or on a
+        compressed log.
+    """
+    settings = SplitterSettings(
+        formats=[
+            (entry_type.alias(), output_format)
+            for entry_type, output_format in (formats if formats else [])
+        ],
+        default_format=default_format,
+        passthrough=passthrough,
+        compact_timestamps=compact_timestamps,
+    )
+    checkpoint_file = output / CHECKPOINT_FILE
+
+    if Compression.from_path(log) is not None and workers > 1:
+        logger.warning(f"{log} is compressed and cannot be sharded, using one worker.")
+        workers = 1
+
+    if not incremental:
+        # The checkpoint does not describe the outputs anymore once we overwrite them.
+        checkpoint_file.unlink(missing_ok=True)
+        _split_range(
+            log,
+            0,
+            None,
+            output,
+            log_parser,
+            settings,
+            workers,
+            append=False,
+            compression=compression,
+        )
+        return
+
+    if LogSplitterFormats.parquet in settings.output_formats():
+        raise ValueError("Parquet outputs cannot be produced incrementally.")
+
+    if compression is not None or Compression.from_path(log) is not None:
+        raise ValueError("Compressed logs and outputs cannot be parsed incrementally.")
+
+    start, outputs = _resume(
+        log, checkpoint_file, settings, _output_names(log_parser(), settings)
+    )
+    end = _complete_lines_end(log, start)
+
+    produced = _split_range(
+        log,
+        start,
+        end,
+        output,
+        log_parser,
+        settings,
+        workers,
+        append=start > 0,
+        compression=None,
+    )
+
+    _save_checkpoint(
+        checkpoint_file,
+        LogFileCheckpoint(
+            offset=end,
+            digest=_digest(log, end),
+            settings=settings,
+            outputs={
+                name: (output / name).stat().st_size
+                for name in sorted(set(outputs) | set(produced))
+            },
+        ),
+    )
+
+
+def _split_range(
+    log: Path,
+    start: int,
+    end: Optional[int],
+    output: Path,
+    log_parser: LogParserFactory,
+    settings: SplitterSettings,
+    workers: int,
+    append: bool,
+    compression: Optional[Compression],
+) -> List[str]:
+    """Splits the `[start, end)` byte range of a log file (or all of it past `start`, if `end` is `None`)
+    into `output`.
+
+    :return: The names of the outputs written to."""
+    if end is not None and start >= end:
+        return []
+
+    if workers <= 1:
+        return _split_shard(
+            log,
+            start,
+            end,
+            output,
+            log_parser,
+            settings,
+            append,
+            compression,
+        )
+
+    shards = shard_boundaries(log, workers * SHARDS_PER_WORKER, start, end)
+    shard_outputs = [output / f".shard-{i}" for i in range(len(shards))]
+    logger.info(f"Parsing {log} in {len(shards)} shards with {workers} workers.")
+
+    try:
+        # Forking a process which might be running threads (e.g. from pyarrow) is unsafe, so we spawn instead.
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            ensure_successful(
+                [
+                    executor.submit(
+                        _split_shard,
+                        log,
+                        shard_start,
+                        shard_end,
+                        shard_output,
+                        log_parser,
+                        settings,
+                        False,
+                        None,
+                    )
+                    for (shard_start, shard_end), shard_output in zip(
+                        shards, shard_outputs
+                    )
+                ]
+            )
+
+        logger.info("Merging shard outputs.")
+        return _merge_shards(shard_outputs, output, append, compression)
+    finally:
+        for shard_output in shard_outputs:
+            shutil.rmtree(shard_output, ignore_errors=True)
+
+
+def _split_shard(
+    log: Path,
+    start: int,
+    end: Optional[int],
+    output: Path,
+    log_parser: LogParserFactory,
+    settings: SplitterSettings,
+    append: bool,
+    compression: Optional[Compression],
+) -> List[str]:
+    output.mkdir(exist_ok=True)
+    opened: List[str] = []
+
+    def output_factory(event_type: str, output_format: LogSplitterFormats):
+        path = output / _output_name(event_type, output_format, compression)
+        opened.append(path.name)
+        mode = "a" if append else "w"
+        if output_format.binary:
+            return open_file(path, f"{mode}b", encoding=None)
+        return open_file(path, mode)
+
+    with settings.splitter(output_factory) as splitter:
+        splitter.split_lines(marked_lines(log, start, end), log_parser())
+
+    return opened
+
+
+def _output_name(
+    event_type: str,
+    output_format: LogSplitterFormats,
+    compression: Optional[Compression],
+) -> str:
+    name = f"{event_type}.{output_format.value}"
+    # Binary (i.e. Parquet) outputs come compressed already.
+    if compression is None or output_format.binary:
+        return name
+    return f"{name}{compression.suffix}"
+
+
+def _merge_shards(
+    shard_outputs: List[Path],
+    output: Path,
+    append: bool,
+    compression: Optional[Compression],
+) -> List[str]:
+    """Merges the outputs of shards onto `output`. Shard outputs are never compressed, so that CSV headers can be
+    stripped from them as they are copied; compression, if any, gets applied as they are merged.
+
+    :return: The names of the merged outputs."""
+    # Dicts preserve insertion order, so this gets us the union of all outputs.
+    names = dict.fromkeys(
+        path.name
+        for shard_output in shard_outputs
+        for path in sorted(shard_output.iterdir())
+    )
+
+    merged = []
+    for name in names:
+        parts = [
+            shard_output / name
+            for shard_output in shard_outputs
+            if (shard_output / name).exists()
+        ]
+        event_type, extension = name.rsplit(".", 1)
+        output_format = LogSplitterFormats(extension)
+        target = output / _output_name(event_type, output_format, compression)
+        if output_format.binary:
+            _merge_parquet(parts, target)
+        else:
+            _merge_text(
+                parts,
+                target,
+                skip_header=output_format == LogSplitterFormats.csv,
+                append=append,
+            )
+        merged.append(target.name)
+
+    return merged
+
+
+def _merge_text(
+    parts: List[Path], output: Path, skip_header: bool, append: bool
+) -> None:
+    with open_file(output, "ab" if append else "wb", encoding=None) as ostream:
+        for part in parts:
+            with part.open("rb") as istream:
+                # Only the first part of a fresh output gets to keep its header.
+                if skip_header and ostream.tell() > 0:
+                    istream.readline()
+                shutil.copyfileobj(istream, ostream, BUFFER_SIZE)
+
+
+def _merge_parquet(parts: List[Path], output: Path) -> None:
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for part in parts:
+            part_file = pq.ParquetFile(part)
+            if writer is None:
+                writer = pq.ParquetWriter(
+                    output, part_file.schema_arrow, compression="zstd"
+                )
+            for i in range(part_file.num_row_groups):
+                writer.write_table(part_file.read_row_group(i))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _output_names(parser: LogParser, settings: SplitterSettings) -> Set[str]:
+    """Names of all outputs incremental parsing could produce with a given parser."""
+    formats = dict(settings.formats)
+    return {
+        _output_name(type_tag, formats.get(type_tag, settings.default_format), None)
+        for type_tag in parser.entry_types
+    }
+
+
+def _resume(
+    log: Path,
+    checkpoint_file: Path,
+    settings: SplitterSettings,
+    output_names: Set[str],
+) -> Tuple[int, List[str]]:
+    """Works out where to resume parsing a log from, and rolls outputs back to the state recorded in the
+    checkpoint: outputs get truncated to their recorded sizes, and any of `output_names` which the checkpoint does
+    not list get removed, as those hold rows from a run which did not get to save its checkpoint.
+
+    :return: The offset to resume from, and the outputs produced before that."""
+    if not checkpoint_file.exists():
+        return 0, []
+
+    try:
+        checkpoint = LogFileCheckpoint.model_validate_json(checkpoint_file.read_bytes())
+    except ValidationError:
+        logger.warning(f"Ignoring malformed checkpoint {checkpoint_file}.")
+        return 0, []
+
+    output = checkpoint_file.parent
+    if (
+        checkpoint.settings != settings
+        or checkpoint.offset > log.stat().st_size
+        or checkpoint.digest != _digest(log, checkpoint.offset)
+        or not all(
+            (output / name).exists() and (output / name).stat().st_size >= size
+            for name, size in checkpoint.outputs.items()
+        )
+    ):
+        logger.warning(
+            f"Checkpoint {checkpoint_file} does not match {log} or the current output settings. "
+            "Parsing the log from the start."
+        )
+        for name in checkpoint.outputs:
+            (output / name).unlink(missing_ok=True)
+        return 0, []
+
+    for name, size in checkpoint.outputs.items():
+        if (output / name).stat().st_size > size:
+            logger.warning(
+                f"Discarding rows appended to {name} after the last checkpoint was saved."
+            )
+            os.truncate(output / name, size)
+    for name in output_names - checkpoint.outputs.keys():
+        if (output / name).exists():
+            logger.warning(
+                f"Removing {name}, which was produced after the last checkpoint was saved."
+            )
+            (output / name).unlink()
+
+    logger.info(f"Resuming parsing of {log} from byte {checkpoint.offset}.")
+    return checkpoint.offset, list(checkpoint.outputs)
+
+
+def _save_checkpoint(checkpoint_file: Path, checkpoint: LogFileCheckpoint) -> None:
+    # Writes to a temporary file first, so that we never end up with a partially written checkpoint.
+    scratch = checkpoint_file.with_name(f"{checkpoint_file.name}.tmp")
+    scratch.write_text(checkpoint.model_dump_json(), encoding="utf-8")
+    scratch.replace(checkpoint_file)
+
+
+def _complete_lines_end(log: Path, start: int) -> int:
+    """Returns the offset right past the last newline in the log, or `start` if there are no newlines past it."""
+    if log.stat().st_size <= start:
+        return start
+
+    with (
+        log.open("rb") as istream,
+        mmap.mmap(istream.fileno(), 0, access=mmap.ACCESS_READ) as buffer,
+    ):
+        return max(buffer.rfind(b"\n", start) + 1, start)
+
+
+def _digest(log: Path, offset: int) -> str:
+    """Digests the head of a log and the bytes leading up to `offset`. Logs get appended to, so this tells
+    whether a log is still the one we had parsed up to `offset` without having to read all of it again."""
+    digest = hashlib.sha256()
+    with log.open("rb") as istream:
+        digest.update(istream.read(min(offset, CHECKPOINT_DIGEST_BYTES)))
+        tail = max(offset - CHECKPOINT_DIGEST_BYTES, 0)
+        istream.seek(tail)
+        digest.update(istream.read(offset - tail))
+    return digest.hexdigest()
@@ -1,21 +1,32 @@
 """This module standardizes interfaces for consuming logs from external log sources; i.e. infrastructure
 that stores logs. Such infrastructure might be a simple file system, a service like Logstash, or a database."""
 
+import copyreg
 import datetime
-import json
 import logging
+import re
 from abc import ABC, abstractmethod
-from csv import DictWriter
 from enum import Enum
-from json import JSONDecodeError
-from typing import Type, TextIO, Iterable, Callable, Dict, Tuple, cast, Optional
+from typing import Type, IO, Iterable, Callable, Dict, Tuple, cast, Optional
 
 from pydantic import ValidationError, computed_field, Field, BaseModel
 
 from benchmarks.core.pydantic import SnakeCaseModel
+from benchmarks.logging.writers import (
+    EntryWriter,
+    CSVWriter,
+    JSONLWriter,
+    ParquetWriter,
+)
 
 MARKER = ">>"
 
+#: Default sampling rate for schema validation in pass-through mode (see :class:`LogSplitter`).
+PASSTHROUGH_VALIDATE_EVERY = 100
+
+_TYPE_TAG_KEY = '"entry_type"'
+_TYPE_TAG_VALUE = re.compile(r'\s*:\s*"(?P<type_tag>[^"\\]+)"')
+
 logger = logging.getLogger(__name__)
 
 
@@ -53,21 +64,36 @@ class LogEntry(SnakeCaseModel):
         def recover_instance(self):
             return model.model_validate(self.model_dump())
 
-        adapted = type(
+        adapted = _AdaptedLogEntryMeta(
             f"{model.__name__}LogEntry",
             (
                 LogEntry,
                 model,
             ),
             {
+                "__module__": __name__,
                 "adapt_instance": classmethod(adapt_instance),
                 "recover_instance": recover_instance,
+                "__adapted_model__": model,
             },
         )
 
         return cast(Type[AdaptedLogEntry], adapted)
 
 
+class _AdaptedLogEntryMeta(type(LogEntry)):  # type: ignore[misc]
+    """Metaclass for types created by :meth:`LogEntry.adapt`. Those cannot be pickled by reference, as no module
+    holds them, so they get pickled as the model they adapt instead, and get adapted again when unpickled. This
+    allows parsers for adapted types to be handed over to worker processes."""
+
+
+def _reduce_adapted(adapted: _AdaptedLogEntryMeta):
+    return LogEntry.adapt, (adapted.__adapted_model__,)
+
+
+copyreg.pickle(_AdaptedLogEntryMeta, _reduce_adapted)
+
+
 class AdaptedLogEntry(LogEntry, ABC):
     """Interface extension to adapted :class:`LogEntry`es which allows converting instances from the original model
     into the adapted model and vice-versa."""
@@ -108,20 +134,27 @@ class ConfigToLogAdapters:
 
 
 type Logs = Iterable[LogEntry]
+type RawEntry = Tuple[str, str]
 
 
 class LogParser:
     """:class:`LogParser` will pick up log entries from a stream and parse them into :class:`LogEntry` instances.
     It works by trying to find a special marker (>>) in the log line, and then parsing the JSON that follows it.
     This allows us to flexibly overlay structured logs on top of existing logging frameworks without having to
-    aggressively modify them."""
+    aggressively modify them.
+
+    To keep parsing cheap on large logs, the type tag is read straight off the raw JSON payload, so lines carrying
+    entry types that are not registered get discarded without being decoded. Lines with known type tags are then
+    validated directly from the JSON payload by their entry type's compiled schema."""
 
-    def __init__(self):
-        self.entry_types = {}
+    def __init__(self) -> None:
+        self.entry_types: Dict[str, Type[LogEntry]] = {}
+        self.decoders: Dict[str, Callable[[str], LogEntry]] = {}
         self.warn_counts = 10
 
     def register(self, entry_type: Type[LogEntry]):
         self.entry_types[entry_type.alias()] = entry_type
+        self.decoders[entry_type.alias()] = entry_type.model_validate_json
 
     def parse(self, log: Iterable[str]) -> Logs:
         for line in log:
@@ -131,24 +164,40 @@ class LogParser:
             yield parsed
 
     def parse_single(self, line: str) -> Optional[LogEntry]:
-        marker_len = len(MARKER)
+        raw = self.parse_raw(line)
+        if raw is None:
+            return None
+        return self.validate(*raw)
+
+    def parse_raw(self, line: str) -> Optional[RawEntry]:
+        """Picks up the type tag and JSON payload for a log line carrying a registered entry type, without
+        decoding or validating the payload.
+
+        :return: A `(type_tag, payload)` tuple, or `None` if the line carries no entry of a registered type."""
         index = line.find(MARKER)
         if index == -1:
             return None
 
-        type_tag = ""  # just to calm down mypy
+        payload = line[index + len(MARKER) :]
+        type_tag = _scan_type_tag(payload)
+        if type_tag is None or type_tag not in self.decoders:
+            return None
+
+        return type_tag, payload
+
+    def validate(self, type_tag: str, payload: str) -> Optional[LogEntry]:
+        """Decodes and validates a JSON payload as obtained from :meth:`LogParser.parse_raw`.
+
+        :return: The parsed :class:`LogEntry`, or `None` if the payload is invalid."""
         try:
-            # Should probably test this against a regex for the type tag to see which is faster.
-            json_line = json.loads(line[index + marker_len :])
-            type_tag = json_line.get("entry_type")
-            if not type_tag or (type_tag not in self.entry_types):
-                return None
-            return self.entry_types[type_tag].model_validate(json_line)
-        except JSONDecodeError:
-            pass
+            return self.decoders[type_tag](payload)
         except ValidationError as err:
-            # This is usually something we want to know about, as if the message has a type_tag
-            # that we know, then we should probably be able to parse it.
+            # Malformed JSON is just noise, as it is common to find the marker in lines that
+            # are not structured logs.
+            if err.errors()[0]["type"] == "json_invalid":
+                return None
+            # Schema errors, on the other hand, are usually something we want to know about, as if the
+            # message has a type_tag that we know, then we should probably be able to parse it.
             self.warn_counts -= 1  # avoid flooding everything with warnings
             if self.warn_counts > 0:
                 logger.warning(
@@ -160,61 +209,201 @@ class LogParser:
         return None
 
 
+def entry_type_tag(line: str) -> Optional[str]:
+    """Reads the type tag of the structured entry in a raw log line, if any, without decoding it. Unlike
+    :meth:`LogParser.parse_raw`, this picks up tags for any entry type, registered or not."""
+    index = line.find(MARKER)
+    if index == -1:
+        return None
+    return _scan_type_tag(line[index + len(MARKER) :])
+
+
+def _scan_type_tag(payload: str) -> Optional[str]:
+    """Reads the type tag off a serialized :class:`LogEntry` without decoding it. Since computed fields get
+    serialized last, we look for the last occurrence of the tag so that tags in nested entries are not
+    picked up instead of the outer one."""
+    index = payload.rfind(_TYPE_TAG_KEY)
+    if index == -1:
+        return None
+
+    match = _TYPE_TAG_VALUE.match(payload, index + len(_TYPE_TAG_KEY))
+    return match.group("type_tag") if match else None
+
+
+def _strip_type_tag(payload: str, type_tag: str) -> Optional[str]:
+    """Removes the type tag from a compact JSON payload by string manipulation. Returns `None` if
+    the tag cannot be found in its compact form."""
+    tag = f'{_TYPE_TAG_KEY}:"{type_tag}"'
+    index = payload.rfind(tag)
+    if index == -1:
+        return None
+
+    end = index + len(tag)
+    if payload[index - 1] == ",":
+        return payload[: index - 1] + payload[end:]
+    if payload[end] == ",":
+        return payload[:index] + payload[end + 1 :]
+    return payload[:index] + payload[end:]
+
+
 class LogSplitterFormats(Enum):
     jsonl = "jsonl"
     csv = "csv"
+    parquet = "parquet"
+
+    @property
+    def binary(self) -> bool:
+        """Whether outputs in this format must be opened in binary mode."""
+        return self == LogSplitterFormats.parquet
 
 
 class LogSplitter:
     """:class:`LogSplitter` will split parsed logs into different files based on the entry type.
-    The output format can be set for each entry type."""
+    The output format can be set for each entry type. Outputs for binary formats (see
+    :attr:`LogSplitterFormats.binary`) must be opened in binary mode by the output factory.
+
+    Some writers buffer entries, so outputs are only guaranteed to be complete after a call to
+    :meth:`LogSplitter.flush` or after the splitter is closed.
+
+    When splitting raw log lines (see :meth:`LogSplitter.split_line`), the splitter can operate in pass-through
+    mode, in which JSON payloads for entry types that go into JSONL outputs are written out as they are found in
+    the log instead of being decoded, validated, and then re-serialized. Only one in every `validate_every`
+    payloads (per splitter) then goes through full schema validation, and payloads failing validation get
+    dropped.
+
+    With `compact_timestamps` set, timestamps in CSV outputs are written as integer nanoseconds since the Unix
+    epoch, which are cheaper to write, read, and join on than ISO-8601 strings. Parquet outputs always store
+    timestamps like that, whereas JSONL outputs always store them as strings."""
 
     def __init__(
         self,
-        output_factory=Callable[[str, LogSplitterFormats], TextIO],
+        output_factory=Callable[[str, LogSplitterFormats], IO],
         output_entry_type=False,
+        default_format: LogSplitterFormats = LogSplitterFormats.csv,
+        passthrough: bool = False,
+        validate_every: int = PASSTHROUGH_VALIDATE_EVERY,
+        compact_timestamps: bool = False,
     ) -> None:
         self.output_factory = output_factory
-        self.outputs: Dict[str, Tuple[Callable[[LogEntry], None], TextIO]] = {}
+        self.outputs: Dict[str, EntryWriter] = {}
         self.formats: Dict[str, LogSplitterFormats] = {}
+        self.default_format = default_format
+        self.output_entry_type = output_entry_type
         self.exclude = {"entry_type"} if not output_entry_type else set()
-
-    def set_format(self, entry_type: Type[LogEntry], output_format: LogSplitterFormats):
-        self.formats[entry_type.alias()] = output_format
+        self.passthrough = passthrough
+        self.validate_every = validate_every
+        self.passed_through = 0
+        self.compact_timestamps = compact_timestamps
+
+    def set_format(
+        self, entry_type: Type[LogEntry] | str, output_format: LogSplitterFormats
+    ):
+        """Sets the output format for an entry type, given either as a :class:`LogEntry` subclass or
+        as its type tag."""
+        alias = entry_type if isinstance(entry_type, str) else entry_type.alias()
+        self.formats[alias] = output_format
 
     def split(self, log: Iterable[LogEntry]):
         for entry in log:
             self.split_single(entry)
+        self.flush()
 
     def split_single(self, entry: LogEntry):
-        write, _ = self.outputs.get(entry.entry_type, (None, None))
+        self._writer(type(entry)).write(entry)
+
+    def split_lines(self, lines: Iterable[str], parser: LogParser):
+        """Parses and splits raw log lines. See :meth:`LogSplitter.split_line`."""
+        for line in lines:
+            self.split_line(line, parser)
+        self.flush()
+
+    def split_line(self, line: str, parser: LogParser):
+        """Parses a raw log line with the given :class:`LogParser` and splits the resulting entry, if any. This
+        is where pass-through mode happens, when enabled."""
+        if not self.passthrough:
+            entry = parser.parse_single(line)
+            if entry:
+                self.split_single(entry)
+            return
+
+        raw = parser.parse_raw(line)
+        if raw is None:
+            return
+
+        type_tag, payload = raw
+        # Writers only get created for entries which make it through, so that outputs do not get opened (and
+        # headers written) for entry types with no valid entries.
+        if (
+            self._format(type_tag) != LogSplitterFormats.jsonl
+            or (raw_line := self._passthrough_line(type_tag, payload)) is None
+        ):
+            entry = parser.validate(type_tag, payload)
+            if entry:
+                self.split_single(entry)
+            return
+
+        self.passed_through += 1
+        if (self.validate_every > 0) and (
+            (self.passed_through - 1) % self.validate_every == 0
+        ):
+            if parser.validate(type_tag, payload) is None:
+                return
+
+        cast(JSONLWriter, self._writer(parser.entry_types[type_tag])).write_raw(
+            raw_line
+        )
 
-        if write is None:
-            output_format = self.formats.get(entry.entry_type, LogSplitterFormats.csv)
-            output_stream = self.output_factory(entry.entry_type, output_format)
+    def _passthrough_line(self, type_tag: str, payload: str) -> Optional[str]:
+        payload = payload.rstrip()
+        # Cheaply weeds out truncated lines.
+        if not payload.endswith("}"):
+            return None
+        if self.output_entry_type:
+            return payload
+        return _strip_type_tag(payload, type_tag)
 
-            write = self._formatting_writer(entry, output_stream, output_format)
-            self.outputs[entry.entry_type] = write, output_stream
+    def flush(self, outputs: bool = False):
+        """Writes out entries buffered by writers. With `outputs` set, output streams get flushed as well, so
+        that whatever got split so far can be read off of them (except for Parquet outputs, which are only
+        readable once closed)."""
+        for writer in self.outputs.values():
+            writer.flush()
+            if outputs:
+                writer.output.flush()
 
-        write(entry)
+    def _format(self, type_tag: str) -> LogSplitterFormats:
+        return self.formats.get(type_tag, self.default_format)
 
-    def _formatting_writer(
-        self, entry: LogEntry, output_stream: TextIO, output_format: LogSplitterFormats
-    ) -> Callable[[LogEntry], None]:
-        if output_format == LogSplitterFormats.csv:
-            writer = DictWriter(
-                output_stream, fieldnames=entry.model_dump(exclude=self.exclude).keys()
-            )
-            writer.writeheader()
-            return lambda x: writer.writerow(x.model_dump(exclude=self.exclude))
+    def _writer(self, entry_type: Type[LogEntry]) -> EntryWriter:
+        type_tag = entry_type.alias()
+        writer = self.outputs.get(type_tag)
 
-        elif output_format == LogSplitterFormats.jsonl:
+        if writer is None:
+            output_format = self._format(type_tag)
+            output_stream = self.output_factory(type_tag, output_format)
 
-            def write_jsonl(x: LogEntry):
-                output_stream.write(x.model_dump_json(exclude=self.exclude) + "\n")
+            writer = self._formatting_writer(entry_type, output_stream, output_format)
+            self.outputs[type_tag] = writer
 
-            return write_jsonl
+        return writer
 
+    def _formatting_writer(
+        self,
+        entry_type: Type[LogEntry],
+        output_stream: IO,
+        output_format: LogSplitterFormats,
+    ) -> EntryWriter:
+        if output_format == LogSplitterFormats.csv:
+            return CSVWriter(
+                output_stream,
+                entry_type,
+                self.exclude,
+                compact_timestamps=self.compact_timestamps,
+            )
+        elif output_format == LogSplitterFormats.jsonl:
+            return JSONLWriter(output_stream, entry_type, self.exclude)
+        elif output_format == LogSplitterFormats.parquet:
+            return ParquetWriter(output_stream, entry_type, self.exclude)
         else:
             raise ValueError(f"Unknown output format: {output_format}")
 
@@ -222,8 +411,8 @@ class LogSplitter:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        for _, output in self.outputs.values():
-            output.close()
+        for writer in self.outputs.values():
+            writer.close()
 
 
 type NodeId = str
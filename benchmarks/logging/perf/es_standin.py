@@ -0,0 +1,881 @@
+"""Local stand-in for the subset of the Elasticsearch HTTP API which
+:class:`~benchmarks.logging.sources.logstash.LogstashSource` and
+:class:`~benchmarks.logging.sources.logstash.AsyncLogstashSource` use, so that they can be benchmarked and tested
+without an ES cluster. Serves documents from memory, spread over daily indexes the way Logstash spreads them,
+and can add latency to requests to mimic a remote cluster.
+
+Supports:
+
+* searches, with `bool`, `constant_score`, `term`, `terms`, `range` and `match_all` queries, `_source`
+  filtering, sorting on fields and `_shard_doc`, `search_after`, slicing, and `filter_path`;
+* `min`, `max` and `composite` (over `terms` sources) aggregations;
+* opening and closing points in time, and searching within them;
+* scrolls, and clearing them;
+* index settings (`number_of_shards`).
+
+Text fields get analyzed by lowercasing them and splitting them into runs of letters, digits and underscores,
+which is close enough to the standard analyzer for the type tags we match in log messages.
+
+Run with:
+
+    python -m benchmarks.logging.perf.es_standin [--port PORT] [--latency SECONDS] [--lines N] [...]
+"""
+
+import argparse
+import datetime
+import fnmatch
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from benchmarks.logging.perf.generator import (
+    add_config_arguments,
+    config_from_arguments,
+    logstash_documents,
+)
+from benchmarks.logging.sources.logstash import INDEX_PREFIX
+
+logger = logging.getLogger(__name__)
+
+#: Version reported to clients, which check it against their own.
+ES_VERSION = "8.17.0"
+
+_TOKEN = re.compile(r"[a-z0-9_]+")
+
+_KEEP_ALIVE = re.compile(r"^(\d+)(ms|s|m|h|d)$")
+
+_KEEP_ALIVE_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+_MISSING = object()
+
+type _Matcher = Callable[["_Document"], bool]
+
+type _SortKey = Tuple[int, ...]
+
+
+class _ESError(Exception):
+    def __init__(self, status: int, error_type: str, reason: str) -> None:
+        super().__init__(reason)
+        self.status = status
+        self.error_type = error_type
+        self.reason = reason
+
+    def body(self) -> Dict[str, Any]:
+        error = {"type": self.error_type, "reason": self.reason}
+        return {"error": {"root_cause": [error], **error}, "status": self.status}
+
+
+def _bad_request(reason: str) -> _ESError:
+    return _ESError(400, "parsing_exception", reason)
+
+
+@dataclass(frozen=True)
+class _Document:
+    position: int
+    """Position of the document across all indexes, which stands in for `_shard_doc`."""
+    index: str
+    shard: int
+    timestamp: int
+    """Value of `@timestamp`, in epoch milliseconds."""
+    source: Dict[str, Any]
+    message_tokens: FrozenSet[str]
+
+
+@dataclass
+class _Context:
+    """A point in time or a scroll: a fixed set of indexes, along with when it expires."""
+
+    indexes: FrozenSet[str]
+    expires: float
+    results: Dict[str, List[Tuple[_SortKey, _Document]]] = field(default_factory=dict)
+    """Sorted matches for the queries run within the context, so that paging through them need not run them
+    again. Keyed by the query, sort and slice."""
+    offset: int = 0
+    """How far a scroll has got."""
+    search: Optional[Dict[str, Any]] = None
+    """The search a scroll pages through."""
+
+
+class ElasticsearchStandIn:
+    """Serves a fixed set of documents over (a subset of) the Elasticsearch HTTP API, on a background thread.
+    Requests get served concurrently, each on its own thread, as ES would serve requests from different slices.
+    """
+
+    def __init__(
+        self,
+        documents: Iterable[Dict[str, Any]],
+        shards: int = 1,
+        latency: float = 0.0,
+        hit_latency: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        """
+        :param documents: Documents to serve, which must have an `@timestamp`. Documents get indexed onto the
+            daily index for their timestamp, and spread round-robin over the shards of the index.
+        :param shards: Number of primary shards per index.
+        :param latency: Seconds added to every request, standing in for network round trips and ES overheads.
+        :param hit_latency: Seconds added per document returned, standing in for ES fetching them.
+        :param host: Host to listen on.
+        :param port: Port to listen on. Picks a free one by default.
+        """
+        self.shards = shards
+        self.latency = latency
+        self.hit_latency = hit_latency
+        self.documents = _index(documents, shards)
+        self.indexes = sorted({document.index for document in self.documents})
+        self.requests: Counter[str] = Counter()
+        """Number of requests served, per endpoint."""
+        self._contexts: Dict[str, _Context] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    @property
+    def open_contexts(self) -> int:
+        """Number of points in time and scrolls which are open and have not expired."""
+        with self._lock:
+            self._expire()
+            return len(self._contexts)
+
+    def start(self) -> "ElasticsearchStandIn":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="es-standin", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def handle(
+        self, method: str, path: str, params: Dict[str, str], body: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Serves a request, returning the body of the response. Errors get raised as :class:`_ESError`."""
+        segments = [
+            unquote(segment) for segment in path.strip("/").split("/") if segment
+        ]
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        match (method, segments):
+            case ("GET" | "HEAD", []):
+                return self._count("info", self._info())
+            case ("GET" | "POST", ["_search"]):
+                return self._count("search", self._search(None, params, body))
+            case ("GET" | "POST", [index, "_search"]):
+                return self._count("search", self._search(index, params, body))
+            case ("GET" | "POST", ["_search", "scroll"]):
+                return self._count("scroll", self._scroll(params, body))
+            case ("DELETE", ["_search", "scroll"]):
+                return self._count("clear_scroll", self._clear_scroll(body))
+            case ("POST", [index, "_pit"]):
+                return self._count("open_pit", self._open_pit(index, params))
+            case ("DELETE", ["_pit"]):
+                return self._count("close_pit", self._close_pit(body))
+            case ("GET", [index, "_settings", *name]):
+                return self._count("settings", self._settings(index, params, name))
+        raise _ESError(
+            400,
+            "no_handler_found",
+            f"No handler found for [{method}] /{'/'.join(segments)}",
+        )
+
+    def _count(self, endpoint: str, response: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.requests[endpoint] += 1
+        return response
+
+    def _info(self) -> Dict[str, Any]:
+        return {
+            "name": "es-standin",
+            "cluster_name": "es-standin",
+            "cluster_uuid": "es-standin",
+            "version": {"number": ES_VERSION, "build_flavor": "default"},
+            "tagline": "You Know, for Search",
+        }
+
+    def _search(
+        self, index: Optional[str], params: Dict[str, str], body: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        started = time.monotonic()
+        size = int(body.get("size", params.get("size", 10)))
+        pit = body.get("pit")
+        scroll = params.get("scroll")
+
+        if pit is not None:
+            if index is not None:
+                raise _bad_request("[indices] cannot be used with point in time")
+            with self._lock:
+                context = self._context(pit["id"], "point in time")
+                if "keep_alive" in pit:
+                    context.expires = time.monotonic() + _keep_alive(pit["keep_alive"])
+            matches = self._matches(context, body)
+        else:
+            indexes = self._resolve(index or "*", _flag(params, "ignore_unavailable"))
+            context = _Context(indexes=indexes, expires=0)
+            matches = self._matches(context, body)
+
+        response: Dict[str, Any] = {
+            "timed_out": False,
+            "_shards": self._shards(context),
+        }
+
+        if scroll is not None:
+            context.expires = time.monotonic() + _keep_alive(scroll)
+            context.search = body
+            scroll_id = uuid.uuid4().hex
+            with self._lock:
+                self._contexts[scroll_id] = context
+            response["_scroll_id"] = scroll_id
+            page = self._scroll_page(context, matches, size)
+        else:
+            start = _search_after(body, matches) + int(body.get("from", 0))
+            page = matches[start : start + size]
+
+        response["hits"] = self._hits(matches, page, body)
+        if "aggs" in body or "aggregations" in body:
+            response["aggregations"] = self._aggregations(
+                context.indexes, body.get("aggs", body.get("aggregations", {})), body
+            )
+        if pit is not None:
+            response["pit_id"] = pit["id"]
+
+        self._fetch(len(page))
+        response["took"] = int((time.monotonic() - started) * 1000)
+        return _filter_response(response, params.get("filter_path"))
+
+    def _scroll(self, params: Dict[str, str], body: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.monotonic()
+        scroll_id = body.get("scroll_id", params.get("scroll_id"))
+        with self._lock:
+            context = self._context(scroll_id, "scroll")
+            keep_alive = body.get("scroll", params.get("scroll"))
+            if keep_alive is not None:
+                context.expires = time.monotonic() + _keep_alive(keep_alive)
+
+        search = context.search or {}
+        matches = self._matches(context, search)
+        page = self._scroll_page(context, matches, int(search.get("size", 10)))
+
+        self._fetch(len(page))
+        return _filter_response(
+            {
+                "_scroll_id": scroll_id,
+                "took": int((time.monotonic() - started) * 1000),
+                "timed_out": False,
+                "_shards": self._shards(context),
+                "hits": self._hits(matches, page, search),
+            },
+            params.get("filter_path"),
+        )
+
+    def _clear_scroll(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        scroll_ids = body.get("scroll_id", [])
+        if isinstance(scroll_ids, str):
+            scroll_ids = [scroll_ids]
+        with self._lock:
+            freed = sum(
+                self._contexts.pop(scroll_id, None) is not None
+                for scroll_id in scroll_ids
+            )
+        return {"succeeded": True, "num_freed": freed}
+
+    def _open_pit(self, index: str, params: Dict[str, str]) -> Dict[str, Any]:
+        if "keep_alive" not in params:
+            raise _ESError(
+                400, "action_request_validation_exception", "[keep_alive] is missing"
+            )
+        context = _Context(
+            indexes=self._resolve(index, _flag(params, "ignore_unavailable")),
+            expires=time.monotonic() + _keep_alive(params["keep_alive"]),
+        )
+        pit_id = uuid.uuid4().hex
+        with self._lock:
+            self._contexts[pit_id] = context
+        return {"id": pit_id}
+
+    def _close_pit(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            freed = self._contexts.pop(body.get("id", ""), None) is not None
+        return {"succeeded": True, "num_freed": int(freed)}
+
+    def _settings(
+        self, index: str, params: Dict[str, str], name: List[str]
+    ) -> Dict[str, Any]:
+        patterns = name[0].split(",") if name else ["*"]
+        response = {}
+        for concrete in sorted(
+            self._resolve(index, _flag(params, "ignore_unavailable"))
+        ):
+            settings = {
+                "index.number_of_shards": str(self.shards),
+                "index.number_of_replicas": "0",
+                "index.provided_name": concrete,
+            }
+            selected = {
+                key.removeprefix("index."): value
+                for key, value in settings.items()
+                if any(fnmatch.fnmatchcase(key, pattern) for pattern in patterns)
+            }
+            if selected:
+                response[concrete] = {"settings": {"index": selected}}
+        return response
+
+    def _context(self, context_id: Optional[str], kind: str) -> _Context:
+        self._expire()
+        context = self._contexts.get(context_id or "")
+        if context is None:
+            raise _ESError(
+                404,
+                "search_context_missing_exception",
+                f"No {kind} found for id [{context_id}]",
+            )
+        return context
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for context_id, context in list(self._contexts.items()):
+            if context.expires < now:
+                del self._contexts[context_id]
+
+    def _resolve(self, expression: str, ignore_unavailable: bool) -> FrozenSet[str]:
+        """Resolves a comma-separated list of index names and patterns onto the indexes it refers to. Patterns
+        never fail to resolve, while missing indexes fail unless `ignore_unavailable` is set."""
+        indexes: Set[str] = set()
+        for name in expression.split(","):
+            if name in ("_all", "*") or "*" in name:
+                indexes.update(
+                    index
+                    for index in self.indexes
+                    if name == "_all" or fnmatch.fnmatchcase(index, name)
+                )
+            elif name in self.indexes:
+                indexes.add(name)
+            elif not ignore_unavailable:
+                raise _ESError(
+                    404, "index_not_found_exception", f"no such index [{name}]"
+                )
+        return frozenset(indexes)
+
+    def _matches(
+        self, context: _Context, body: Dict[str, Any]
+    ) -> List[Tuple[_SortKey, _Document]]:
+        """Documents matching the query of a search within a context, along with their sort keys, sorted and
+        restricted to the slice of the search, if any."""
+        sort = _sort_key(body.get("sort", ["_shard_doc"]))
+        slice_ = body.get("slice")
+        key = json.dumps([body.get("query"), body.get("sort"), slice_], sort_keys=True)
+        with self._lock:
+            cached = context.results.get(key)
+        if cached is not None:
+            return cached
+
+        matcher = _matcher(body.get("query", {"match_all": {}}))
+        matches = sorted(
+            (
+                (sort(document), document)
+                for document in self.documents
+                if document.index in context.indexes
+                and _in_slice(document, slice_)
+                and matcher(document)
+            ),
+            key=lambda match: match[0],
+        )
+        with self._lock:
+            context.results[key] = matches
+        return matches
+
+    def _scroll_page(
+        self,
+        context: _Context,
+        matches: List[Tuple[_SortKey, _Document]],
+        size: int,
+    ) -> List[Tuple[_SortKey, _Document]]:
+        with self._lock:
+            page = matches[context.offset : context.offset + size]
+            context.offset += len(page)
+        return page
+
+    def _shards(self, context: _Context) -> Dict[str, int]:
+        shards = len(context.indexes) * self.shards
+        return {"total": shards, "successful": shards, "skipped": 0, "failed": 0}
+
+    def _hits(
+        self,
+        matches: List[Tuple[_SortKey, _Document]],
+        page: List[Tuple[_SortKey, _Document]],
+        body: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        fields = body.get("_source", True)
+        signs = _sort_signs(body.get("sort", ["_shard_doc"]))
+        hits = []
+        for key, document in page:
+            hit: Dict[str, Any] = {
+                "_index": document.index,
+                "_id": str(document.position),
+                "_score": None,
+            }
+            if fields is not False:
+                hit["_source"] = (
+                    document.source
+                    if fields is True
+                    else _project(document.source, _source_fields(fields))
+                )
+            hit["sort"] = [sign * value for sign, value in zip(signs, key)]
+            hits.append(hit)
+
+        return {
+            "total": {"value": len(matches), "relation": "eq"},
+            "max_score": None,
+            "hits": hits,
+        }
+
+    def _aggregations(
+        self,
+        indexes: FrozenSet[str],
+        aggregations: Dict[str, Any],
+        body: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        matcher = _matcher(body.get("query", {"match_all": {}}))
+        documents = [
+            document
+            for document in self.documents
+            if document.index in indexes and matcher(document)
+        ]
+        return {
+            name: _aggregate(aggregation, documents)
+            for name, aggregation in aggregations.items()
+        }
+
+    def _fetch(self, hits: int) -> None:
+        if self.hit_latency > 0 and hits > 0:
+            time.sleep(hits * self.hit_latency)
+
+
+def _index(documents: Iterable[Dict[str, Any]], shards: int) -> List[_Document]:
+    indexed = []
+    per_index: Counter[str] = Counter()
+    for position, source in enumerate(documents):
+        timestamp = datetime.datetime.fromisoformat(source["@timestamp"])
+        index = (
+            f"{INDEX_PREFIX}{timestamp.astimezone(datetime.UTC).strftime('%Y.%m.%d')}"
+        )
+        indexed.append(
+            _Document(
+                position=position,
+                index=index,
+                shard=per_index[index] % shards,
+                timestamp=int(timestamp.timestamp() * 1000),
+                source=source,
+                message_tokens=_analyze(source.get("message", "")),
+            )
+        )
+        per_index[index] += 1
+    return indexed
+
+
+def _analyze(text: Any) -> FrozenSet[str]:
+    return frozenset(_TOKEN.findall(str(text).lower()))
+
+
+def _keep_alive(value: str) -> float:
+    match = _KEEP_ALIVE.match(value)
+    if match is None:
+        raise _ESError(
+            400,
+            "illegal_argument_exception",
+            f"failed to parse setting [keep_alive] with value [{value}]",
+        )
+    return int(match.group(1)) * _KEEP_ALIVE_UNITS[match.group(2)]
+
+
+def _flag(params: Dict[str, str], name: str) -> bool:
+    return params.get(name, "false").lower() == "true"
+
+
+def _lookup(source: Dict[str, Any], path: str) -> Any:
+    """Looks up a field by its dotted path, which may run through keys which have dots of their own (e.g.
+    `pod_labels.app.kubernetes.io/instance`)."""
+    if path in source:
+        return source[path]
+    parts = path.split(".")
+    for split in range(1, len(parts)):
+        value = source.get(".".join(parts[:split]))
+        if isinstance(value, dict):
+            found = _lookup(value, ".".join(parts[split:]))
+            if found is not _MISSING:
+                return found
+    return _MISSING
+
+
+def _field_matcher(field_name: str, accepts: Callable[[Any], bool]) -> _Matcher:
+    """Matches documents with a field for which `accepts` holds. Text fields get matched token by token,
+    while `.keyword` sub-fields get matched on their whole value."""
+    if field_name == "@timestamp":
+        return lambda document: accepts(document.timestamp)
+    if field_name == "message":
+        return lambda document: any(map(accepts, document.message_tokens))
+    if field_name.endswith(".keyword"):
+        path = field_name.removesuffix(".keyword")
+        return lambda document: accepts(_lookup(document.source, path))
+    return lambda document: any(
+        map(accepts, _analyze(_lookup(document.source, field_name)))
+    )
+
+
+def _single(clause: Dict[str, Any], query_type: str) -> Tuple[str, Any]:
+    if len(clause) != 1:
+        raise _bad_request(f"[{query_type}] query doesn't support multiple fields")
+    return next(iter(clause.items()))
+
+
+def _matcher(query: Dict[str, Any]) -> _Matcher:
+    query_type, clause = _single(query, "query")
+    match query_type:
+        case "match_all":
+            return lambda _: True
+        case "constant_score":
+            return _matcher(clause["filter"])
+        case "bool":
+            required = [
+                _matcher(subquery)
+                for occur in ("filter", "must")
+                for subquery in _clauses(clause.get(occur, []))
+            ]
+            excluded = [
+                _matcher(subquery) for subquery in _clauses(clause.get("must_not", []))
+            ]
+            if "should" in clause:
+                raise _bad_request("[bool] should clauses are not supported")
+            return lambda document: all(
+                matches(document) for matches in required
+            ) and not any(matches(document) for matches in excluded)
+        case "term":
+            field_name, value = _single(clause, query_type)
+            if isinstance(value, dict):
+                value = value["value"]
+            return _field_matcher(field_name, lambda actual: actual == value)
+        case "terms":
+            field_name, values = _single(clause, query_type)
+            accepted = set(values)
+            return _field_matcher(field_name, lambda actual: actual in accepted)
+        case "range":
+            field_name, bounds = _single(clause, query_type)
+            if field_name != "@timestamp":
+                raise _bad_request("[range] queries are only supported on [@timestamp]")
+            return _field_matcher(field_name, _range(bounds))
+    raise _bad_request(f"unknown query [{query_type}]")
+
+
+def _clauses(clauses: Any) -> List[Any]:
+    return clauses if isinstance(clauses, list) else [clauses]
+
+
+def _range(bounds: Dict[str, Any]) -> Callable[[Any], bool]:
+    if bounds.get("format", "epoch_millis") != "epoch_millis":
+        raise _bad_request("[range] queries only support the [epoch_millis] format")
+    checks = {
+        "gte": lambda actual, bound: actual >= bound,
+        "gt": lambda actual, bound: actual > bound,
+        "lte": lambda actual, bound: actual <= bound,
+        "lt": lambda actual, bound: actual < bound,
+    }
+    limits = [
+        (checks[name], int(bound)) for name, bound in bounds.items() if name in checks
+    ]
+    return lambda actual: all(check(actual, bound) for check, bound in limits)
+
+
+def _sort_fields(sort: Any) -> List[Tuple[str, int]]:
+    fields = []
+    for spec in _clauses(sort):
+        if isinstance(spec, str):
+            fields.append((spec, 1))
+            continue
+        field_name, order = _single(spec, "sort")
+        if isinstance(order, dict):
+            order = order.get("order", "asc")
+        fields.append((field_name, -1 if order == "desc" else 1))
+    return fields
+
+
+def _sort_signs(sort: Any) -> List[int]:
+    return [sign for _, sign in _sort_fields(sort)]
+
+
+def _sort_key(sort: Any) -> Callable[[_Document], _SortKey]:
+    """Sort keys for documents, with the values of descending fields negated so that keys always sort
+    ascending."""
+    attributes: List[Tuple[str, int]] = []
+    for field_name, sign in _sort_fields(sort):
+        # Documents live in a single segment, so index order and shard order are the same.
+        if field_name in ("_shard_doc", "_doc"):
+            attributes.append(("position", sign))
+        elif field_name == "@timestamp":
+            attributes.append(("timestamp", sign))
+        else:
+            raise _bad_request(f"sorting on [{field_name}] is not supported")
+    return lambda document: tuple(
+        sign * getattr(document, attribute) for attribute, sign in attributes
+    )
+
+
+def _search_after(
+    body: Dict[str, Any], matches: List[Tuple[_SortKey, _Document]]
+) -> int:
+    """Position of the first match which comes after the `search_after` values of a search."""
+    search_after = body.get("search_after")
+    if search_after is None:
+        return 0
+    signs = _sort_signs(body.get("sort", ["_shard_doc"]))
+    after = tuple(sign * int(value) for sign, value in zip(signs, search_after))
+    low, high = 0, len(matches)
+    while low < high:
+        middle = (low + high) // 2
+        if matches[middle][0] <= after:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _in_slice(document: _Document, slice_: Optional[Dict[str, Any]]) -> bool:
+    """Slices split documents round-robin, regardless of the shards they live in, so that they get evenly sized
+    slices for any number of slices."""
+    if slice_ is None:
+        return True
+    return document.position % int(slice_["max"]) == int(slice_["id"])
+
+
+def _source_fields(fields: Any) -> List[str]:
+    if isinstance(fields, str):
+        return [fields]
+    if isinstance(fields, dict):
+        return _source_fields(fields.get("includes", []))
+    return list(fields)
+
+
+def _project(source: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Keeps the fields of a document which `_source` filtering asks for, in the structure they had."""
+    projected = {}
+    for key, value in source.items():
+        if key in fields:
+            projected[key] = value
+            continue
+        prefix = f"{key}."
+        nested = [name[len(prefix) :] for name in fields if name.startswith(prefix)]
+        if nested and isinstance(value, dict):
+            inner = _project(value, nested)
+            if inner:
+                projected[key] = inner
+    return projected
+
+
+def _aggregate(
+    aggregation: Dict[str, Any], documents: List[_Document]
+) -> Dict[str, Any]:
+    aggregation_type, spec = _single(aggregation, "aggregation")
+    match aggregation_type:
+        case "min" | "max":
+            values = [
+                _aggregated_value(document, spec["field"]) for document in documents
+            ]
+            present = [value for value in values if value is not _MISSING]
+            if not present:
+                return {"value": None}
+            value = min(present) if aggregation_type == "min" else max(present)
+            result: Dict[str, Any] = {"value": float(value)}
+            if spec["field"] == "@timestamp":
+                result["value_as_string"] = _millis_as_string(value)
+            return result
+        case "composite":
+            return _composite(spec, documents)
+    raise _bad_request(f"unknown aggregation type [{aggregation_type}]")
+
+
+def _aggregated_value(document: _Document, field_name: str) -> Any:
+    if field_name == "@timestamp":
+        return document.timestamp
+    return _lookup(document.source, field_name.removesuffix(".keyword"))
+
+
+def _composite(spec: Dict[str, Any], documents: List[_Document]) -> Dict[str, Any]:
+    names = []
+    fields = []
+    for source in spec["sources"]:
+        name, value_source = _single(source, "composite source")
+        source_type, terms = _single(value_source, "composite source")
+        if source_type != "terms":
+            raise _bad_request(f"unsupported composite source [{source_type}]")
+        names.append(name)
+        fields.append(terms["field"])
+
+    counts: Counter[Tuple[Any, ...]] = Counter()
+    for document in documents:
+        key = tuple(_aggregated_value(document, name) for name in fields)
+        if _MISSING not in key:
+            counts[key] += 1
+
+    keys = sorted(counts)
+    after = spec.get("after")
+    if after is not None:
+        after_key = tuple(after[name] for name in names)
+        keys = [key for key in keys if key > after_key]
+    page = keys[: spec.get("size", 10)]
+
+    result: Dict[str, Any] = {
+        "buckets": [
+            {"key": dict(zip(names, key)), "doc_count": counts[key]} for key in page
+        ]
+    }
+    if page:
+        result["after_key"] = dict(zip(names, page[-1]))
+    return result
+
+
+def _millis_as_string(millis: int) -> str:
+    instant = datetime.datetime.fromtimestamp(millis / 1000, tz=datetime.UTC)
+    return instant.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _filter_response(
+    response: Dict[str, Any], filter_path: Optional[str]
+) -> Dict[str, Any]:
+    """Applies `filter_path` to a response. As with ES, objects and lists which end up empty get dropped."""
+    if not filter_path:
+        return response
+    paths = [path.split(".") for path in filter_path.split(",")]
+    filtered = _filter(response, paths)
+    return {} if filtered is _MISSING else filtered
+
+
+def _filter(value: Any, paths: List[List[str]]) -> Any:
+    if any(not path for path in paths):
+        return value
+    if isinstance(value, list):
+        items = [_filter(item, paths) for item in value]
+        kept = [item for item in items if item is not _MISSING]
+        return kept or _MISSING
+    if isinstance(value, dict):
+        filtered = {}
+        for key, item in value.items():
+            nested = [path[1:] for path in paths if fnmatch.fnmatchcase(key, path[0])]
+            if nested:
+                kept_item = _filter(item, nested)
+                if kept_item is not _MISSING:
+                    filtered[key] = kept_item
+        return filtered or _MISSING
+    return _MISSING
+
+
+def _handler(standin: ElasticsearchStandIn) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        # Keeps connections open between requests, as ES does, so clients can pool them.
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self._serve("GET")
+
+        def do_POST(self):
+            self._serve("POST")
+
+        def do_DELETE(self):
+            self._serve("DELETE")
+
+        def do_HEAD(self):
+            self._serve("HEAD")
+
+        def _serve(self, method: str) -> None:
+            url = urlsplit(self.path)
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length) if length else b""
+            try:
+                body = json.loads(raw) if raw else {}
+                status, response = 200, standin.handle(method, url.path, params, body)
+            except _ESError as error:
+                status, response = error.status, error.body()
+            except (ValueError, KeyError, TypeError) as error:
+                status, response = 400, _bad_request(str(error)).body()
+
+            payload = json.dumps(response, separators=(",", ":")).encode()
+            self.send_response(status)
+            # Clients refuse to talk to servers which do not identify as Elasticsearch.
+            self.send_header("X-Elastic-Product", "Elasticsearch")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            if method != "HEAD":
+                self.wfile.write(payload)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(format, *args)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on.")
+    parser.add_argument("--port", type=int, default=9200, help="Port to listen on.")
+    parser.add_argument(
+        "--shards", type=int, default=1, help="Primary shards per index."
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds added to every request."
+    )
+    parser.add_argument(
+        "--hit-latency",
+        type=float,
+        default=0.0,
+        help="Seconds added per document returned.",
+    )
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    config = config_from_arguments(args)
+
+    standin = ElasticsearchStandIn(
+        logstash_documents(config),
+        shards=args.shards,
+        latency=args.latency,
+        hit_latency=args.hit_latency,
+        host=args.host,
+        port=args.port,
+    )
+    print(
+        f"Serving {len(standin.documents):,} documents for group {config.group_id} across "
+        f"{standin.indexes} on {standin.url}."
+    )
+    with standin:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Deterministic generator for synthetic experiment logs. Produces Codex and Deluge node logs which look like the
+ones we get from real experiments, either as a raw log (as produced by `kubectl logs`), wrapped into Vector
+envelopes (as produced by the Vector flat file sink), or as the documents Logstash indexes into Elasticsearch.
+
+Structured entries are interspersed with unstructured lines at a configurable density. Each experiment has its
+own set of pods; experiments run one after the other, while pods within an experiment log concurrently. As in
+Vector dumps, lines are in order within a pod, but not across pods, as pod clocks are skewed.
+
+Run with:
+
+    python -m benchmarks.logging.perf.generator {raw,vector} OUTPUT [--lines N] [--size BYTES] [...]
+"""
+
+import argparse
+import datetime
+import json
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from benchmarks.logging.compression import open_file
+from benchmarks.logging.logging import MARKER
+
+#: Start of the first experiment's logs.
+EPOCH = datetime.datetime(2025, 1, 21, 12, 0, 0, tzinfo=datetime.UTC)
+
+#: Maximum skew between the clocks of pods within an experiment.
+MAX_CLOCK_SKEW = datetime.timedelta(seconds=2)
+
+_HEX = "0123456789abcdef"
+
+_CODEX_TOPICS = [
+    "codex blockexcengine",
+    "codex blockexcnetwork",
+    "codex discoveryengine",
+    "codex repostore",
+    "codex erasure",
+]
+
+_CODEX_MESSAGES = [
+    "Got wantList for peer",
+    "Sending block request",
+    "Resolving blocks",
+    "Stored block",
+    "Block already in store",
+    "Scheduling block for download",
+]
+
+_DELUGE_MESSAGES = [
+    ("deluge.core.torrentmanager", 1094, "Piece {piece} of torrent {digest} verified"),
+    ("deluge.core.alertmanager", 148, "Handling alert: piece_finished_alert"),
+    ("deluge.core.torrent", 1428, "Torrent {digest} state changed to Downloading"),
+    ("deluge.core.rpcserver", 217, "Received RPC request get_torrent_status"),
+]
+
+
+@dataclass(frozen=True)
+class SyntheticLogConfig:
+    """Shape of a synthetic log."""
+
+    lines: int = 200_000
+    """Number of lines to generate."""
+    size: Optional[int] = None
+    """If set, generation stops early once this many bytes worth of log messages have been generated. Raw logs
+    and Vector dumps will be larger than this, as lines get prefixed or wrapped."""
+    marker_density: float = 0.05
+    """Fraction of lines which carry a structured entry."""
+    spaced_deluge_entries: bool = False
+    """If set, Deluge entries get serialized with spaces after separators, as the standard json module does by
+    default, rather than compactly. Passthrough splits can then not strip their type tags by string
+    manipulation, and fall back to parsing them."""
+    pods: int = 8
+    """Number of pods per experiment."""
+    experiments: int = 4
+    """Number of experiments in the group."""
+    group_id: str = "g1736425800"
+    app_name: str = "codex-benchmarks"
+    seed: int = 0
+
+
+@dataclass(frozen=True)
+class SyntheticLine:
+    experiment_id: str
+    pod_name: str
+    timestamp: datetime.datetime
+    message: str
+
+
+class _Pod:
+    def __init__(
+        self,
+        name: str,
+        deluge: bool,
+        clock: datetime.datetime,
+        rnd: random.Random,
+        spaced_entries: bool = False,
+    ) -> None:
+        self.name = name
+        self.deluge = deluge
+        self.spaced_entries = spaced_entries
+        self.clock = clock
+        self.rnd = rnd
+        self.sequence = 0
+
+    def message(self, marked: bool) -> str:
+        self.clock += datetime.timedelta(microseconds=self.rnd.randint(1, 2_000))
+        self.sequence += 1
+        if self.deluge:
+            return self._deluge_message(marked)
+        return self._codex_message(marked)
+
+    def _deluge_message(self, marked: bool) -> str:
+        clock = self.clock.strftime("%H:%M:%S.%f")[:-3]
+        if marked:
+            # Unlike Codex entries, the type tag comes first.
+            entry = json.dumps(
+                {
+                    "entry_type": "download_metric",
+                    "timestamp": self.clock.isoformat(),
+                    "name": "deluge_piece_downloaded",
+                    "value": self.sequence,
+                    "node": self.name,
+                    "dataset_name": f"dataset-0-{self.sequence % 3}",
+                },
+                separators=(", ", ": ") if self.spaced_entries else (",", ":"),
+            )
+            return f"{clock} [INFO    ][deluge.core.metrics           :49  ] {MARKER}{entry}"
+
+        module, line, template = self.rnd.choice(_DELUGE_MESSAGES)
+        text = template.format(piece=self.sequence, digest=self._digest())
+        return f"{clock} [DEBUG   ][{module:<30}:{line:<4}] {text}"
+
+    def _codex_message(self, marked: bool) -> str:
+        if marked:
+            # Codex metrics get logged by the (Python) agent, through pydantic.
+            if self.rnd.random() < 0.9:
+                entry = {
+                    "name": "codex_download",
+                    "timestamp": self._iso_clock(),
+                    "node": self.name,
+                    "value": self.sequence * 65_536,
+                    "dataset_name": f"dataset-0-{self.sequence % 3}",
+                    "entry_type": "download_metric",
+                }
+            else:
+                entry = {
+                    "name": "request",
+                    "timestamp": self._iso_clock(),
+                    "node": self.name,
+                    "destination": f"codex-{self.rnd.randint(0, 9)}",
+                    "request_id": self._digest(),
+                    "type": self.rnd.choice(["start", "end"]),
+                    "entry_type": "request_event",
+                }
+            clock = self.clock.strftime("%Y-%m-%d %H:%M:%S,%f")[:-3]
+            payload = json.dumps(entry, separators=(",", ":"))
+            return f"{clock} - benchmarks.codex.agent.agent - INFO - {MARKER}{payload}"
+
+        clock = self.clock.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        message = self.rnd.choice(_CODEX_MESSAGES)
+        topics = self.rnd.choice(_CODEX_TOPICS)
+        return (
+            f'TRC {clock}+00:00 {message:<32} topics="{topics}" tid=1 '
+            f"peer=16U*{self._digest()[:6]} count={self.rnd.randint(1, 64)}"
+        )
+
+    def _iso_clock(self) -> str:
+        return self.clock.isoformat().replace("+00:00", "Z")
+
+    def _digest(self) -> str:
+        return "".join(self.rnd.choices(_HEX, k=40))
+
+
+def synthetic_lines(config: SyntheticLogConfig) -> Iterator[SyntheticLine]:
+    """Generates the lines of a synthetic log. The same configuration always results in the same lines."""
+    rnd = random.Random(config.seed)
+    generated = 0
+    size = 0
+    for experiment in range(config.experiments):
+        experiment_id = f"e{experiment}"
+        deluge = experiment % 2 == 0
+        kind = "deluge" if deluge else "codex"
+        start = EPOCH + datetime.timedelta(hours=experiment)
+        pods: List[_Pod] = [
+            _Pod(
+                name=f"{kind}-nodes-{experiment_id}-{config.group_id}-{i}",
+                deluge=deluge,
+                clock=start + rnd.random() * MAX_CLOCK_SKEW,
+                rnd=rnd,
+                spaced_entries=config.spaced_deluge_entries,
+            )
+            for i in range(config.pods)
+        ]
+
+        # Spreads lines evenly across experiments.
+        quota = (config.lines * (experiment + 1)) // config.experiments - generated
+        for _ in range(quota):
+            pod = rnd.choice(pods)
+            message = pod.message(marked=rnd.random() < config.marker_density)
+            yield SyntheticLine(experiment_id, pod.name, pod.clock, message)
+
+            generated += 1
+            size += len(message) + 1
+            if config.size is not None and size >= config.size:
+                return
+
+
+def raw_log_lines(config: SyntheticLogConfig) -> Iterator[str]:
+    """Lines of a synthetic raw log, as `kubectl logs --prefix` would output them."""
+    for line in synthetic_lines(config):
+        yield f"[pod/{line.pod_name}] {line.message}\n"
+
+
+def vector_log_lines(config: SyntheticLogConfig) -> Iterator[str]:
+    """Lines of a synthetic Vector flat file dump."""
+    for line in synthetic_lines(config):
+        component = line.pod_name.split("-nodes-")[0] + "-node"
+        envelope = {
+            "file": f"/var/log/pods/codex-benchmarks_{line.pod_name}/{component}/0.log",
+            "kubernetes": {
+                "container_name": component,
+                "pod_labels": {
+                    "app.kubernetes.io/component": component,
+                    "app.kubernetes.io/instance": line.experiment_id,
+                    "app.kubernetes.io/name": config.app_name,
+                    "app.kubernetes.io/part-of": config.group_id,
+                },
+                "pod_name": line.pod_name,
+                "pod_namespace": "codex-benchmarks",
+            },
+            "message": line.message,
+            "source_type": "kubernetes_logs",
+            "stream": "stdout",
+            "timestamp": line.timestamp.isoformat().replace("+00:00", "Z"),
+        }
+        yield json.dumps(envelope, separators=(",", ":")) + "\n"
+
+
+def logstash_documents(config: SyntheticLogConfig) -> Iterator[Dict[str, Any]]:
+    """Documents for the lines of a synthetic log, as Logstash indexes them into Elasticsearch."""
+    for line in synthetic_lines(config):
+        component = line.pod_name.split("-nodes-")[0] + "-node"
+        yield {
+            "@timestamp": line.timestamp.isoformat().replace("+00:00", "Z"),
+            "file": f"/var/log/pods/codex-benchmarks_{line.pod_name}/{component}/0.log",
+            "message": line.message,
+            "pod_labels": {
+                "app.kubernetes.io/component": component,
+                "app.kubernetes.io/instance": line.experiment_id,
+                "app.kubernetes.io/name": config.app_name,
+                "app.kubernetes.io/part-of": config.group_id,
+            },
+            "pod_name": line.pod_name,
+            "pod_namespace": "codex-benchmarks",
+        }
+
+
+def write_log(output: Path, lines: Iterator[str]) -> int:
+    """Writes generated lines onto a file, compressing it if its extension calls for it.
+
+    :return: The number of lines written."""
+    count = 0
+    with open_file(output, "w") as ostream:
+        for line in lines:
+            ostream.write(line)
+            count += 1
+    return count
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = SyntheticLogConfig()
+    parser.add_argument(
+        "--lines", type=int, default=defaults.lines, help="Number of lines."
+    )
+    parser.add_argument(
+        "--size", type=int, default=None, help="Maximum size of log messages, in bytes."
+    )
+    parser.add_argument(
+        "--marker-density",
+        type=float,
+        default=defaults.marker_density,
+        help="Fraction of lines carrying structured entries.",
+    )
+    parser.add_argument(
+        "--spaced-deluge-entries",
+        action="store_true",
+        help="Serializes Deluge entries with spaces after separators, rather than compactly.",
+    )
+    parser.add_argument(
+        "--pods", type=int, default=defaults.pods, help="Pods per experiment."
+    )
+    parser.add_argument(
+        "--experiments",
+        type=int,
+        default=defaults.experiments,
+        help="Number of experiments.",
+    )
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="Random seed.")
+
+
+def config_from_arguments(args) -> SyntheticLogConfig:
+    return SyntheticLogConfig(
+        lines=args.lines,
+        size=args.size,
+        marker_density=args.marker_density,
+        spaced_deluge_entries=args.spaced_deluge_entries,
+        pods=args.pods,
+        experiments=args.experiments,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("kind", choices=["raw", "vector"], help="Kind of log.")
+    parser.add_argument(
+        "output",
+        type=Path,
+        help="File to write the log to. Gets compressed if it ends in .gz or .zst.",
+    )
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    config = config_from_arguments(args)
+    lines = raw_log_lines(config) if args.kind == "raw" else vector_log_lines(config)
+    print(f"Wrote {write_log(args.output, lines)} lines to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Throughput benchmark for :class:`~benchmarks.logging.sources.logstash.LogstashSource` and
+:class:`~benchmarks.logging.sources.logstash.AsyncLogstashSource`, run against
+:class:`~benchmarks.logging.perf.es_standin.ElasticsearchStandIn` serving synthetic logs produced by
+:mod:`benchmarks.logging.perf.generator`. Reports documents per second for each client and number of slices.
+
+The stand-in runs in a process of its own, so that serving requests does not compete with the sources for the
+GIL. Use `--latency` and `--hit-latency` to make it behave like a remote cluster; with no latency, this mostly
+measures how fast the sources decode and go through pages.
+
+Run with:
+
+    python -m benchmarks.logging.perf.logstash_throughput [--slices N ...] [--latency SECONDS] [--lines N] [...]
+"""
+
+import argparse
+import multiprocessing
+import queue
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing.synchronize import Event
+from typing import Iterator, Optional
+
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+
+from benchmarks.logging.perf.es_standin import ElasticsearchStandIn
+from benchmarks.logging.perf.generator import (
+    SyntheticLogConfig,
+    add_config_arguments,
+    config_from_arguments,
+    logstash_documents,
+)
+from benchmarks.logging.sources.logstash import AsyncLogstashSource, LogstashSource
+
+CLIENTS = ["sync", "async"]
+
+#: How long to wait for the stand-in to come up, in seconds. Generating documents takes most of it.
+STARTUP_TIMEOUT = 600
+
+
+@dataclass(frozen=True)
+class ThroughputResult:
+    client: str
+    slices: Optional[int]
+    """Number of slices, or `None` if picked from the number of shards."""
+    documents: int
+    seconds: float
+
+    @property
+    def documents_per_second(self) -> float:
+        return self.documents / self.seconds
+
+
+def measure(
+    url: str,
+    client: str,
+    slices: Optional[int],
+    group_id: str,
+    structured_only: bool = False,
+) -> ThroughputResult:
+    """Reads all logs for a group off of an ES instance, with a fresh source and client, and times it."""
+    start = time.perf_counter()
+    if client == "sync":
+        with LogstashSource(
+            Elasticsearch(url), slices=slices, structured_only=structured_only
+        ) as source:
+            documents = sum(1 for _ in source.logs(group_id))
+    else:
+        with AsyncLogstashSource(
+            AsyncElasticsearch(url), slices=slices, structured_only=structured_only
+        ) as async_source:
+            documents = sum(1 for _ in async_source.logs(group_id))
+    elapsed = time.perf_counter() - start
+
+    return ThroughputResult(
+        client=client, slices=slices, documents=documents, seconds=elapsed
+    )
+
+
+@contextmanager
+def standin_process(
+    config: SyntheticLogConfig,
+    shards: int = 1,
+    latency: float = 0.0,
+    hit_latency: float = 0.0,
+) -> Iterator[str]:
+    """Runs a stand-in serving the documents for a synthetic log in a separate process.
+
+    :return: The URL of the stand-in."""
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    stop = context.Event()
+    process = context.Process(
+        target=_serve,
+        args=(config, shards, latency, hit_latency, ready, stop),
+        name="es-standin",
+    )
+    process.start()
+    try:
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            try:
+                url = ready.get(timeout=1)
+                break
+            except queue.Empty:
+                if not process.is_alive() or time.monotonic() > deadline:
+                    raise RuntimeError("Elasticsearch stand-in failed to start.")
+
+        yield url
+    finally:
+        stop.set()
+        process.join()
+
+
+def _serve(
+    config: SyntheticLogConfig,
+    shards: int,
+    latency: float,
+    hit_latency: float,
+    ready: multiprocessing.Queue,
+    stop: Event,
+) -> None:
+    with ElasticsearchStandIn(
+        logstash_documents(config),
+        shards=shards,
+        latency=latency,
+        hit_latency=hit_latency,
+    ) as standin:
+        ready.put(standin.url)
+        stop.wait()
+
+
+def _slices(value: str) -> Optional[int]:
+    return None if value == "auto" else int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--slices",
+        type=_slices,
+        nargs="+",
+        default=[1, 2, 4, 8],
+        help="Numbers of slices to measure. Use 'auto' to pick them from the number of shards.",
+    )
+    parser.add_argument(
+        "--clients",
+        nargs="+",
+        choices=CLIENTS,
+        default=CLIENTS,
+        help="Clients to measure. Measures all of them by default.",
+    )
+    parser.add_argument(
+        "--shards", type=int, default=4, help="Primary shards per index."
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds the stand-in adds to every request.",
+    )
+    parser.add_argument(
+        "--hit-latency",
+        type=float,
+        default=0.0,
+        help="Seconds the stand-in adds per document returned.",
+    )
+    parser.add_argument(
+        "--structured-only",
+        action="store_true",
+        help="Only retrieve structured log lines.",
+    )
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    config = config_from_arguments(args)
+
+    print(f"Serving logs: {config}")
+    with standin_process(config, args.shards, args.latency, args.hit_latency) as url:
+        print(f"{'client':<8} {'slices':>6} {'documents':>10} {'docs/sec':>12}")
+        for client in args.clients:
+            for slices in args.slices:
+                result = measure(
+                    url, client, slices, config.group_id, args.structured_only
+                )
+                slices_label = "auto" if slices is None else str(slices)
+                print(
+                    f"{result.client:<8} {slices_label:>6} {result.documents:>10,} "
+                    f"{result.documents_per_second:>12,.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
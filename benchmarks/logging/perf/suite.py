@@ -0,0 +1,275 @@
+"""Throughput benchmarks for the hot paths of the log pipeline, run over synthetic logs produced by
+:mod:`benchmarks.logging.perf.generator`. Reports lines and megabytes per second, as well as peak RSS, for each
+stage. Stages run in separate processes, so that their peak RSS figures do not include memory used by the others.
+Stages which run worker processes of their own also report the peak RSS of the largest of those.
+
+Run with:
+
+    python -m benchmarks.logging.perf.suite [--stages STAGE ...] [--lines N] [--marker-density D] [...]
+"""
+
+import argparse
+import multiprocessing
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from io import BytesIO, StringIO
+from pathlib import Path
+from typing import IO, Callable, Dict, List, Tuple
+
+from benchmarks.logging.compression import open_file
+from benchmarks.logging.log_file import split_log_file
+from benchmarks.logging.logging import (
+    MARKER,
+    LogSplitter,
+    LogSplitterFormats,
+    basic_log_parser,
+)
+from benchmarks.logging.perf.generator import (
+    SyntheticLogConfig,
+    add_config_arguments,
+    config_from_arguments,
+    raw_log_lines,
+    vector_log_lines,
+    write_log,
+)
+from benchmarks.logging.sources.sorting import SortingLogSource
+from benchmarks.logging.sources.sources import FSOutputManager, split_logs_in_source
+from benchmarks.logging.sources.vector_flat_file import VectorFlatFileSource
+
+RAW_LOG = "raw-logs.log"
+VECTOR_LOG = "vector.jsonl"
+
+#: Memory budget for the external sort stage. Small enough that it spills even for small logs.
+EXTERNAL_SORT_BUDGET = 16 * 1024**2
+
+#: Number of worker processes for the sharded split stage.
+SPLIT_PROCESSES = 4
+
+#: Lines processed, bytes processed, and elapsed seconds.
+type Measurement = Tuple[int, int, float]
+
+
+@dataclass(frozen=True)
+class StageResult:
+    stage: str
+    lines: int
+    bytes: int
+    seconds: float
+    peak_rss: int
+    """Peak resident set size of the process running the stage, in bytes."""
+    peak_rss_children: int = 0
+    """Peak resident set size of the largest worker process the stage ran, if any, in bytes."""
+
+    @property
+    def lines_per_second(self) -> float:
+        return self.lines / self.seconds
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes / self.seconds / 1024**2
+
+
+def parse_single(workdir: Path, config: SyntheticLogConfig) -> Measurement:
+    """:meth:`LogParser.parse_single` over every line in a raw log. Lines get streamed off of the log, so the
+    time it takes to read them counts towards the stage."""
+    parser = basic_log_parser()
+    lines = 0
+    size = 0
+
+    start = time.perf_counter()
+    with open_file(workdir / RAW_LOG) as istream:
+        for line in istream:
+            parser.parse_single(line)
+            lines += 1
+            size += len(line)
+    elapsed = time.perf_counter() - start
+
+    return lines, size, elapsed
+
+
+def split_single(workdir: Path, config: SyntheticLogConfig) -> Measurement:
+    """:meth:`LogSplitter.split_single` over the entries parsed from a raw log, into in-memory CSV outputs."""
+    parser = basic_log_parser()
+    marked = _marked_lines(workdir / RAW_LOG)
+    entries = [entry for entry in map(parser.parse_single, marked) if entry]
+
+    with LogSplitter(_in_memory_output) as splitter:
+        start = time.perf_counter()
+        for entry in entries:
+            splitter.split_single(entry)
+        splitter.flush()
+        elapsed = time.perf_counter() - start
+
+    return len(entries), sum(len(line) for line in marked), elapsed
+
+
+def split_log_file_stage(workdir: Path, config: SyntheticLogConfig) -> Measurement:
+    """:func:`split_log_file` (i.e. `logs single`) on a raw log, in a single process."""
+    log = workdir / RAW_LOG
+    with tempfile.TemporaryDirectory(dir=workdir) as output:
+        start = time.perf_counter()
+        split_log_file(log, Path(output), basic_log_parser)
+        elapsed = time.perf_counter() - start
+
+    return _count_lines(log), log.stat().st_size, elapsed
+
+
+def vector_unsorted(workdir: Path, config: SyntheticLogConfig) -> Measurement:
+    """:meth:`VectorFlatFileSource.logs` in file order."""
+    return _vector_logs(workdir, config, sorted=False)
+
+
+def vector_sorted(workdir: Path, config: SyntheticLogConfig) -> Measurement:
+    """:meth:`VectorFlatFileSource.logs` in chronological order."""
+    return _vector_logs(workdir, config, sorted=True)
+
+
+def external_sort(workdir: Path, config: SyntheticLogConfig) -> Measurement:
+    """:class:`SortingLogSource` over a Vector dump read in file order, with a small memory budget."""
+    log = workdir / VECTOR_LOG
+    start = time.perf_counter()
+    with SortingLogSource(
+        VectorFlatFileSource(open_file(log), app_name=config.app_name),
+        memory_budget=EXTERNAL_SORT_BUDGET,
+        spill_dir=workdir,
+    ) as source:
+        lines = sum(1 for _ in source.logs(config.group_id))
+    elapsed = time.perf_counter() - start
+
+    return lines, log.stat().st_size, elapsed
+
+
+def split_logs_in_source_stage(
+    workdir: Path, config: SyntheticLogConfig, split_processes: int = 0
+) -> Measurement:
+    """:func:`split_logs_in_source` on a Vector dump, onto CSV files on disk."""
+    log = workdir / VECTOR_LOG
+    with tempfile.TemporaryDirectory(dir=workdir) as output:
+        start = time.perf_counter()
+        with (
+            VectorFlatFileSource(open_file(log), app_name=config.app_name) as source,
+            FSOutputManager(Path(output)) as output_manager,
+        ):
+            split_logs_in_source(
+                source,
+                basic_log_parser(),
+                output_manager,
+                config.group_id,
+                split_processes=split_processes,
+            )
+        elapsed = time.perf_counter() - start
+
+    return _count_lines(log), log.stat().st_size, elapsed
+
+
+STAGES: Dict[str, Callable[[Path, SyntheticLogConfig], Measurement]] = {
+    "parse_single": parse_single,
+    "split_single": split_single,
+    "split_log_file": split_log_file_stage,
+    "vector_unsorted": vector_unsorted,
+    "vector_sorted": vector_sorted,
+    "external_sort": external_sort,
+    "split_logs_in_source": split_logs_in_source_stage,
+    "split_logs_in_source_sharded": partial(
+        split_logs_in_source_stage, split_processes=SPLIT_PROCESSES
+    ),
+}
+
+
+def run_stage(stage: str, workdir: Path, config: SyntheticLogConfig) -> StageResult:
+    """Runs a stage in the current process. Logs must have been generated onto `workdir` beforehand
+    with :func:`generate_logs`."""
+    lines, size, seconds = STAGES[stage](workdir, config)
+    return StageResult(
+        stage=stage,
+        lines=lines,
+        bytes=size,
+        seconds=seconds,
+        # ru_maxrss is in kilobytes on Linux.
+        peak_rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        peak_rss_children=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+    )
+
+
+def generate_logs(workdir: Path, config: SyntheticLogConfig) -> None:
+    write_log(workdir / RAW_LOG, raw_log_lines(config))
+    write_log(workdir / VECTOR_LOG, vector_log_lines(config))
+
+
+def _vector_logs(
+    workdir: Path, config: SyntheticLogConfig, sorted: bool
+) -> Measurement:
+    log = workdir / VECTOR_LOG
+    start = time.perf_counter()
+    with VectorFlatFileSource(
+        open_file(log), app_name=config.app_name, sorted=sorted
+    ) as source:
+        lines = sum(1 for _ in source.logs(config.group_id))
+    elapsed = time.perf_counter() - start
+
+    return lines, log.stat().st_size, elapsed
+
+
+def _marked_lines(path: Path) -> List[str]:
+    with open_file(path) as istream:
+        return [line for line in istream if MARKER in line]
+
+
+def _count_lines(path: Path) -> int:
+    with open_file(path, "rb", encoding=None) as istream:
+        return sum(1 for _ in istream)
+
+
+def _in_memory_output(_: str, output_format: LogSplitterFormats) -> IO:
+    return BytesIO() if output_format.binary else StringIO()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=list(STAGES.keys()),
+        default=list(STAGES.keys()),
+        help="Stages to run. Runs all of them by default.",
+    )
+    parser.add_argument(
+        "--workdir",
+        type=Path,
+        default=None,
+        help="Folder to generate logs into. Uses a temporary folder by default.",
+    )
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    config = config_from_arguments(args)
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        print(f"Generating logs: {config}")
+        generate_logs(Path(workdir), config)
+
+        width = max(len(stage) for stage in args.stages)
+        print(
+            f"{'stage':<{width}} {'lines':>10} {'lines/sec':>12} {'MB/sec':>8} {'peak RSS (MB)':>14} "
+            f"{'workers (MB)':>13}"
+        )
+        for stage in args.stages:
+            # Each stage gets a fresh process, so peak RSS is the stage's own.
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                result = executor.submit(
+                    run_stage, stage, Path(workdir), config
+                ).result()
+            print(
+                f"{result.stage:<{width}} {result.lines:>10,} {result.lines_per_second:>12,.0f} "
+                f"{result.megabytes_per_second:>8.1f} {result.peak_rss / 1024**2:>14.1f} "
+                f"{result.peak_rss_children / 1024**2:>13.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List
+
+import pytest
+from elasticsearch import AsyncElasticsearch, Elasticsearch, NotFoundError, helpers
+
+from benchmarks.logging.logging import entry_type_tag
+from benchmarks.logging.perf.es_standin import ElasticsearchStandIn
+from benchmarks.logging.perf.generator import SyntheticLogConfig, logstash_documents
+from benchmarks.logging.perf.logstash_throughput import measure, standin_process
+from benchmarks.logging.sources.logstash import (
+    AsyncLogstashSource,
+    EXPERIMENT_LABEL,
+    LogstashSource,
+)
+
+CONFIG = SyntheticLogConfig(lines=3_000, experiments=3, marker_density=0.2)
+
+DOCUMENTS = list(logstash_documents(CONFIG))
+
+
+def _line(document: Dict[str, Any]):
+    return (
+        document["pod_labels"][EXPERIMENT_LABEL],
+        document["pod_name"],
+        document["message"],
+    )
+
+
+LINES = [_line(document) for document in DOCUMENTS]
+
+
+@pytest.fixture
+def standin() -> Iterator[ElasticsearchStandIn]:
+    with ElasticsearchStandIn(DOCUMENTS, shards=2) as standin:
+        yield standin
+
+
+@pytest.mark.parametrize("slices", [1, 3, None])
+def test_should_serve_all_logs_to_the_sync_source(standin, slices):
+    with LogstashSource(Elasticsearch(standin.url), slices=slices) as source:
+        assert sorted(source.logs(CONFIG.group_id)) == sorted(LINES)
+        assert list(source.experiments(CONFIG.group_id)) == ["e0", "e1", "e2"]
+
+    assert standin.open_contexts == 0
+
+
+@pytest.mark.parametrize("slices", [1, 3, None])
+def test_should_serve_all_logs_to_the_async_source(standin, slices):
+    with AsyncLogstashSource(AsyncElasticsearch(standin.url), slices=slices) as source:
+        assert sorted(source.logs(CONFIG.group_id)) == sorted(LINES)
+        assert list(source.experiments(CONFIG.group_id)) == ["e0", "e1", "e2"]
+
+    assert standin.open_contexts == 0
+
+
+def test_should_serve_logs_in_chronological_order(standin):
+    with LogstashSource(Elasticsearch(standin.url), chronological=True) as source:
+        lines = list(source.logs(CONFIG.group_id, "e1"))
+
+    # ES sorts on millisecond timestamps, breaking ties by document order.
+    chronological = sorted(
+        (int(datetime.fromisoformat(document["@timestamp"]).timestamp() * 1000), i)
+        for i, document in enumerate(DOCUMENTS)
+        if document["pod_labels"][EXPERIMENT_LABEL] == "e1"
+    )
+    assert lines == [LINES[i] for _, i in chronological]
+
+
+def test_should_filter_structured_logs_by_entry_type(standin):
+    with LogstashSource(
+        Elasticsearch(standin.url),
+        structured_only=True,
+        entry_types=["request_event"],
+    ) as source:
+        lines = list(source.logs(CONFIG.group_id))
+
+    expected = [line for line in LINES if entry_type_tag(line[2]) == "request_event"]
+    assert expected
+    assert lines == expected
+
+
+def test_should_not_serve_logs_for_unknown_groups(standin):
+    with LogstashSource(Elasticsearch(standin.url)) as source:
+        assert list(source.logs("g0")) == []
+        assert list(source.experiments("g0")) == []
+
+
+def test_should_scroll_through_all_documents(standin):
+    client = Elasticsearch(standin.url)
+    documents = list(
+        helpers.scan(
+            client,
+            index="benchmarks-*",
+            query={
+                "query": {
+                    "term": {"pod_labels.app.kubernetes.io/instance.keyword": "e2"}
+                }
+            },
+            size=500,
+        )
+    )
+
+    assert [_line(document["_source"]) for document in documents] == [
+        line for line in LINES if line[0] == "e2"
+    ]
+    assert standin.requests["scroll"] > 1
+    assert standin.open_contexts == 0
+
+
+def test_should_expire_points_in_time(standin):
+    client = Elasticsearch(standin.url)
+    pit_id = client.open_point_in_time(index="benchmarks-*", keep_alive="1ms")["id"]
+    time.sleep(0.01)
+
+    with pytest.raises(NotFoundError):
+        client.search(body={"pit": {"id": pit_id}, "size": 10})
+
+
+def test_should_only_ignore_missing_indexes_when_asked_to(standin):
+    client = Elasticsearch(standin.url)
+    indexes: List[str] = ["benchmarks-2025.01.21", "benchmarks-2025.01.20"]
+
+    with pytest.raises(NotFoundError):
+        client.indices.get_settings(index=indexes)
+
+    assert client.indices.get_settings(
+        index=indexes, name="index.number_of_shards", ignore_unavailable=True
+    ).body == {
+        "benchmarks-2025.01.21": {"settings": {"index": {"number_of_shards": "2"}}}
+    }
+
+
+def test_should_add_latency_to_requests():
+    with ElasticsearchStandIn(DOCUMENTS[:10], latency=0.05) as standin:
+        client = Elasticsearch(standin.url)
+        start = time.monotonic()
+        client.info()
+        assert time.monotonic() - start >= 0.05
+
+
+def test_should_measure_throughput_against_a_standin_process():
+    config = SyntheticLogConfig(lines=1_000, experiments=2)
+    with standin_process(config, shards=2) as url:
+        for client in ["sync", "async"]:
+            result = measure(url, client, 2, config.group_id)
+            assert result.client == client
+            assert result.documents == 1_000
+            assert result.documents_per_second > 0
@@ -0,0 +1,88 @@
+from io import StringIO
+from typing import List
+
+from benchmarks.logging.logging import MARKER, basic_log_parser
+from benchmarks.logging.perf.generator import (
+    SyntheticLogConfig,
+    raw_log_lines,
+    synthetic_lines,
+    vector_log_lines,
+)
+from benchmarks.logging.perf.suite import STAGES, generate_logs, run_stage
+from benchmarks.logging.sources.vector_flat_file import VectorFlatFileSource
+
+
+def test_should_generate_the_same_log_for_the_same_config():
+    config = SyntheticLogConfig(lines=1000)
+
+    assert list(raw_log_lines(config)) == list(raw_log_lines(config))
+    assert list(raw_log_lines(config)) != list(
+        raw_log_lines(SyntheticLogConfig(lines=1000, seed=1))
+    )
+
+
+def test_should_generate_parseable_entries_at_the_requested_density():
+    config = SyntheticLogConfig(lines=10_000, marker_density=0.2)
+    lines = list(raw_log_lines(config))
+    marked = [line for line in lines if MARKER in line]
+
+    assert len(lines) == 10_000
+    assert 1_800 < len(marked) < 2_200
+
+    parser = basic_log_parser()
+    assert all(parser.parse_single(line) is not None for line in marked)
+
+
+def test_should_serialize_entries_compactly_unless_asked_otherwise():
+    def marked(config: SyntheticLogConfig) -> List[str]:
+        return [line for line in raw_log_lines(config) if MARKER in line]
+
+    compact = marked(SyntheticLogConfig(lines=2_000, marker_density=0.2))
+    spaced = marked(
+        SyntheticLogConfig(lines=2_000, marker_density=0.2, spaced_deluge_entries=True)
+    )
+
+    # Compact type tags are what passthrough splits strip without parsing entries.
+    assert all('"entry_type":"' in line for line in compact)
+    assert any('"entry_type": "' in line for line in spaced)
+
+
+def test_should_stop_once_size_is_reached():
+    lines = list(synthetic_lines(SyntheticLogConfig(lines=10_000, size=10_000)))
+
+    assert 10_000 <= sum(len(line.message) + 1 for line in lines) < 10_500
+
+
+def test_should_generate_vector_logs_which_are_sorted_per_pod():
+    config = SyntheticLogConfig(lines=2_000, pods=3, experiments=2)
+    lines = list(synthetic_lines(config))
+
+    source = VectorFlatFileSource(
+        StringIO("".join(vector_log_lines(config))), app_name=config.app_name
+    )
+
+    assert list(source.experiments(config.group_id)) == ["e0", "e1"]
+    assert list(source.logs(config.group_id)) == [
+        (line.experiment_id, line.pod_name, line.message) for line in lines
+    ]
+
+    pods = {line.pod_name for line in lines}
+    assert len(pods) == 6
+    for pod in pods:
+        timestamps = [line.timestamp for line in lines if line.pod_name == pod]
+        assert timestamps == sorted(timestamps)
+
+
+def test_should_run_benchmark_stages(tmp_path):
+    config = SyntheticLogConfig(lines=500)
+    generate_logs(tmp_path, config)
+
+    for stage in STAGES:
+        result = run_stage(stage, tmp_path, config)
+        assert result.lines > 0
+        assert result.seconds > 0
+        assert result.peak_rss > 0
+
+    # Workers of the sharded stage have exited by the time it returns, so their RSS shows up separately.
+    sharded = run_stage("split_logs_in_source_sharded", tmp_path, config)
+    assert sharded.peak_rss_children > 0
@@ -0,0 +1,109 @@
+"""Throughput benchmark for :class:`~benchmarks.logging.logging.LogSplitter` writers. Compares the current
+writers against the original per-entry writers, which went through pydantic's `model_dump` for every row.
+
+Run with:
+
+    python -m benchmarks.logging.perf.writers [--rows N]
+"""
+
+import argparse
+import datetime
+import time
+from csv import DictWriter
+from io import BytesIO, StringIO
+from typing import IO, Callable, List, Set
+
+from pydantic import BaseModel
+
+from benchmarks.logging.logging import DownloadMetric, LogEntry
+from benchmarks.logging.writers import (
+    CSVWriter,
+    EntryWriter,
+    JSONLWriter,
+    ParquetWriter,
+)
+
+EXCLUDE = {"entry_type"}
+
+
+class ModelDumpCSVWriter(EntryWriter):
+    """The original CSV writer, which dumps and writes every entry as it comes."""
+
+    def __init__(self, output: IO, entry: BaseModel, exclude: Set[str]) -> None:
+        super().__init__(output)
+        self.exclude = exclude
+        self.writer = DictWriter(
+            output, fieldnames=entry.model_dump(exclude=exclude).keys()
+        )
+        self.writer.writeheader()
+
+    def write(self, entry: BaseModel) -> None:
+        self.writer.writerow(entry.model_dump(exclude=self.exclude))
+
+
+class ModelDumpJSONLWriter(EntryWriter):
+    """The original JSONL writer, which dumps and writes every entry as it comes."""
+
+    def __init__(self, output: IO, exclude: Set[str]) -> None:
+        super().__init__(output)
+        self.exclude = exclude
+
+    def write(self, entry: BaseModel) -> None:
+        self.output.write(entry.model_dump_json(exclude=self.exclude) + "\n")
+
+
+def download_metrics(rows: int) -> List[LogEntry]:
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.UTC)
+    return [
+        DownloadMetric(
+            timestamp=start + datetime.timedelta(microseconds=i * 1_337),
+            node=f"codex-{i % 13}",
+            value=i * 65_536,
+            dataset_name=f"dataset-{i % 3}",
+        )
+        for i in range(rows)
+    ]
+
+
+def rows_per_second(
+    writer_factory: Callable[[], EntryWriter], entries: List[LogEntry]
+) -> float:
+    writer = writer_factory()
+    start = time.perf_counter()
+    for entry in entries:
+        writer.write(entry)
+    writer.flush()
+    elapsed = time.perf_counter() - start
+    writer.close()
+    return len(entries) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rows", type=int, default=500_000, help="Number of rows to write."
+    )
+    args = parser.parse_args()
+
+    entries = download_metrics(args.rows)
+    model = type(entries[0])
+
+    print(f"{'format':<8} {'writer':<12} {'rows/sec':>12}")
+    for output_format, writer_type, factory in [
+        (
+            "csv",
+            "model_dump",
+            lambda: ModelDumpCSVWriter(StringIO(), entries[0], EXCLUDE),
+        ),
+        ("csv", "batched", lambda: CSVWriter(StringIO(), model, EXCLUDE)),
+        ("jsonl", "model_dump", lambda: ModelDumpJSONLWriter(StringIO(), EXCLUDE)),
+        ("jsonl", "batched", lambda: JSONLWriter(StringIO(), model, EXCLUDE)),
+        ("parquet", "batched", lambda: ParquetWriter(BytesIO(), model, EXCLUDE)),
+    ]:
+        print(
+            f"{output_format:<8} {writer_type:<12} {rows_per_second(factory, entries):>12,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Local, size-bounded cache for the logs retrieved from (typically remote) log sources."""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterable, List, Optional, Set, Tuple
+from urllib.parse import quote
+
+from benchmarks.logging.compression import Compression, open_file
+from benchmarks.logging.sources.sources import (
+    ExperimentId,
+    LogSource,
+    NodeId,
+    RawLine,
+)
+
+logger = logging.getLogger(__name__)
+
+#: Default upper bound for the size of a cache, in bytes.
+DEFAULT_CACHE_SIZE = 4 * 1024**3
+
+_GROUP_SEGMENT = "group.jsonl"
+_EXPERIMENTS = "experiments.json"
+_TMP_PREFIX = ".tmp-"
+
+type _Entry = Tuple[ExperimentId, NodeId, RawLine]
+
+
+class CachingLogSource(LogSource):
+    """A :class:`LogSource` which keeps the logs it retrieves from another source in compressed segment files
+    on local disk, one per group or experiment queried, so that later queries for the same logs are served
+    from disk rather than, say, pulled from Elasticsearch all over again. Queries for an experiment are also
+    served from the segment for its group, if there is one.
+
+    Segments only get stored once the logs they hold have been read in full. The cache is bounded in size:
+    storing a segment evicts the least recently used ones until the cache fits its budget again. Caches
+    can be shared across sources, which get their segments stored apart based on their `namespace`."""
+
+    def __init__(
+        self,
+        source: LogSource,
+        cache_dir: Path,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        compression: Compression = Compression.gzip,
+        invalidate: bool = False,
+        namespace: Optional[str] = None,
+    ) -> None:
+        """
+        :param source: The source to cache logs from.
+        :param cache_dir: Where to store segments.
+        :param max_size: Maximum size of the cache, in bytes, across all namespaces.
+        :param compression: How to compress segments.
+        :param invalidate: Whether to drop whatever is cached for a group the first time it gets queried,
+            e.g. because the logs in the source changed.
+        :param namespace: Identifies the logs a source returns, so that sources returning different logs (e.g.
+            with or without unstructured lines) do not share segments. Defaults to the string representation
+            of the source.
+        """
+        self.source = source
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.compression = compression
+        self.invalidate = invalidate
+        self.namespace = namespace if namespace is not None else str(source)
+        self._root = (
+            cache_dir / hashlib.sha256(self.namespace.encode()).hexdigest()[:16]
+        )
+        self._invalidated: Set[str] = set()
+        # Segments get looked up, stored, and evicted under this lock, as queries may come from multiple
+        # threads at once.
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.source.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self.source.__exit__(exc_type, exc_val, exc_tb)
+
+    def experiments(self, group_id: str) -> Iterator[str]:
+        self._invalidate(group_id)
+        path = self._group_dir(group_id) / _EXPERIMENTS
+        cached = self._open(path)
+        if cached is not None:
+            with cached:
+                return iter(json.load(cached))
+
+        experiments = list(self.source.experiments(group_id))
+        with _writer(path) as (tmp, ostream):
+            json.dump(experiments, ostream)
+        self._store(tmp, path)
+        return iter(experiments)
+
+    def logs(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
+        self._invalidate(group_id)
+        segment = self._segment(group_id, experiment_id)
+        cached = self._open(segment)
+        if cached is not None:
+            yield from _read_segment(cached)
+            return
+
+        if experiment_id is not None:
+            cached = self._open(self._segment(group_id, None))
+            if cached is not None:
+                for entry in _read_segment(cached):
+                    if entry[0] == experiment_id:
+                        yield entry
+                return
+
+        yield from self._fetch(segment, self.source.logs(group_id, experiment_id))
+
+    def _fetch(self, segment: Path, entries: Iterable[_Entry]) -> Iterator[_Entry]:
+        with _writer(segment) as (tmp, ostream):
+            for entry in entries:
+                ostream.write(json.dumps(entry))
+                ostream.write("\n")
+                yield entry
+        self._store(tmp, segment)
+
+    def _group_dir(self, group_id: str) -> Path:
+        return self._root / quote(group_id, safe="")
+
+    def _segment(self, group_id: str, experiment_id: Optional[str]) -> Path:
+        name = (
+            _GROUP_SEGMENT
+            if experiment_id is None
+            else f"experiments/{quote(experiment_id, safe='')}.jsonl"
+        )
+        return self._group_dir(group_id) / f"{name}{self.compression.suffix}"
+
+    def _invalidate(self, group_id: str) -> None:
+        if not self.invalidate:
+            return
+        with self._lock:
+            if group_id in self._invalidated:
+                return
+            self._invalidated.add(group_id)
+            logger.info(f"Dropping cached logs for group {group_id}.")
+            shutil.rmtree(self._group_dir(group_id), ignore_errors=True)
+
+    def _open(self, path: Path) -> Optional[IO]:
+        """Opens a cached file, and marks it as recently used. Returns `None` on a cache miss."""
+        with self._lock:
+            try:
+                stream = open_file(path)
+            except FileNotFoundError:
+                return None
+            os.utime(path)
+            return stream
+
+    def _store(self, tmp: Path, path: Path) -> None:
+        with self._lock:
+            tmp.replace(path)
+            size = path.stat().st_size
+            if size > self.max_size:
+                logger.warning(
+                    f"Not caching {path} ({size} bytes), as it does not fit in the cache."
+                )
+                path.unlink()
+                return
+            self._evict(keep=path)
+
+    def _evict(self, keep: Path) -> None:
+        files: List[Tuple[float, int, Path]] = []
+        for path in self.cache_dir.rglob("*"):
+            # Segments still being written are not ours to evict.
+            if path.name.startswith(_TMP_PREFIX) or path == keep:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.is_file():
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = keep.stat().st_size + sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_size:
+                break
+            logger.info(f"Evicting {path} from the cache.")
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+@contextmanager
+def _writer(path: Path) -> Iterator[Tuple[Path, IO]]:
+    """Writes a cached file onto a temporary file next to it, which gets discarded if writing fails or gets
+    interrupted (e.g. because the logs going into it were not read in full)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(
+        dir=path.parent, prefix=_TMP_PREFIX, suffix="".join(path.suffixes)
+    )
+    os.close(fd)
+    tmp = Path(name)
+    try:
+        with open_file(tmp, "w") as ostream:
+            yield tmp, ostream
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _read_segment(stream: IO) -> Iterator[_Entry]:
+    with stream:
+        for line in stream:
+            experiment_id, node_id, raw_line = json.loads(line)
+            yield experiment_id, node_id, raw_line
@@ -1,59 +1,146 @@
+import asyncio
 import datetime
 import logging
-from collections.abc import Iterator
-from typing import Optional, Tuple, Any, Dict, List
+import re
+import threading
+import time
+from collections.abc import AsyncGenerator, Coroutine, Iterable, Iterator
+from dataclasses import dataclass
+from typing import Optional, Tuple, Any, Dict, List, TypeVar, cast
 
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch, Elasticsearch, NotFoundError
 
 from benchmarks.core.concurrency import pflatmap
 from benchmarks.logging.sources.sources import LogSource, ExperimentId, NodeId, RawLine
 
 GROUP_LABEL = "app.kubernetes.io/part-of"
 EXPERIMENT_LABEL = "app.kubernetes.io/instance"
-DEFAULT_HORIZON = 5
+
+#: Logstash writes logs onto daily indexes, named after the (UTC) day of their timestamps.
+INDEX_PREFIX = "benchmarks-"
+INDEX_PATTERN = f"{INDEX_PREFIX}*"
 ES_MAX_BATCH_SIZE = 10_000
+ES_MIN_BATCH_SIZE = 500
+
+#: How long ES keeps a point in time alive between requests.
+PIT_KEEP_ALIVE = "2m"
+PIT_KEEP_ALIVE_SECONDS = 120
+
+#: Upper bound for the number of slices picked from the shard count of the target indexes.
+MAX_AUTO_SLICES = 16
+
+#: Number of experiments retrieved per page when listing experiments.
+EXPERIMENTS_PAGE_SIZE = 1000
+
+#: Number of pages per slice which :class:`AsyncLogstashSource` keeps around for the consumer, on top of the
+#: page it has in flight for each slice.
+ASYNC_PREFETCH = 1
+
+#: The only fields we read off of log documents.
+SOURCE_FIELDS = ["message", "pod_name", f"pod_labels.{EXPERIMENT_LABEL}"]
+
+#: Trims responses down to what we read off of them, which saves ES from sending, and us from decoding, the
+#: per-hit metadata (index, ID, score, etc.).
+RESPONSE_FILTER = ["pit_id", "hits.hits._source", "hits.hits.sort"]
+
+#: Messages are indexed as text with the standard analyzer, under which type tags like these come out as
+#: single tokens, so they can be matched with `term` queries.
+_TOKENIZABLE_TYPE_TAG = re.compile(r"^[a-z0-9_]+$")
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
 
-class LogstashSource(LogSource):
-    """Log source for logs stored in Elasticsearch by Logstash. This is typically used when running experiments
-    in a Kubernetes cluster."""
+type _LogLine = Tuple[ExperimentId, NodeId, RawLine]
+
+
+@dataclass(frozen=True)
+class GroupIndexes:
+    """Where the logs for an experiment group live: the daily indexes which overlap with the group's time span,
+    and the span itself."""
+
+    indexes: List[str]
+    settings: Dict[str, Any]
+    """Settings (`index.number_of_shards` only) for each of the indexes."""
+    first: int
+    """Timestamp of the group's first log entry, in epoch milliseconds."""
+    last: int
+    """Timestamp of the group's last log entry, in epoch milliseconds."""
+
+    def range_filter(self) -> Dict[str, Any]:
+        # Aggregations may round timestamps down to the millisecond, hence the exclusive upper bound.
+        return {
+            "range": {
+                "@timestamp": {
+                    "gte": self.first,
+                    "lt": self.last + 1,
+                    "format": "epoch_millis",
+                }
+            }
+        }
+
+
+class _PointInTime:
+    """Tracks the ID of a point in time as last returned to each of the slices reading from it. ES may hand out
+    a new ID with any response, and only the latest one is guaranteed to be valid, so these are the ones that
+    get closed."""
+
+    def __init__(self, pit_id: str, slices: int) -> None:
+        self.ids = [pit_id] * slices
+
+    def latest(self) -> List[str]:
+        """Returns the latest IDs across all slices, without duplicates."""
+        return list(dict.fromkeys(self.ids))
+
+
+class _BaseLogstashSource(LogSource):
+    """Builds the queries for :class:`LogstashSource` and :class:`AsyncLogstashSource`, which differ only in
+    how they run them."""
 
     def __init__(
         self,
-        client: Elasticsearch,
         structured_only: bool = False,
         chronological: bool = False,
-        slices: int = 1,
-        horizon: int = DEFAULT_HORIZON,
-        today: Optional[datetime.date] = None,
+        slices: Optional[int] = 1,
+        entry_types: Optional[Iterable[str]] = None,
     ):
-        """
-        @:param client: Elasticsearch client to use for retrieving logs
-        @:param structured_only: If True, only return structured log lines (those starting with '>>').
-        @:param chronological: If True, return logs in chronological order. This is mostly meant for use
-            in testing, and can get quite slow/expensive for large queries.
-        """
-        self.client = client
         self.structured_only = structured_only
+        if chronological and slices is not None and slices > 1:
+            logger.warning(
+                f"Logs can only be read in chronological order from a single slice, ignoring slices={slices}."
+            )
         self.chronological = chronological
         self.slices = slices
-        self._indexes = self._generate_indexes(today, horizon)
+        self.entry_types = sorted(entry_types) if entry_types is not None else None
+        self._group_indexes: Dict[str, GroupIndexes] = {}
 
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.client.close()
+    def _span_query(self, group_id: str) -> Dict[str, Any]:
+        return {
+            "size": 0,
+            "query": {
+                "constant_score": {
+                    "filter": {"term": {f"pod_labels.{GROUP_LABEL}.keyword": group_id}}
+                }
+            },
+            "aggs": {
+                "first": {"min": {"field": "@timestamp"}},
+                "last": {"max": {"field": "@timestamp"}},
+            },
+        }
 
-    @property
-    def indexes(self) -> List[str]:
-        return list(self._indexes)
+    def _span(self, response: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        """Reads the time span of a group off of the response to :meth:`_span_query`. Returns `None` for groups
+        without logs."""
+        aggregations = response["aggregations"]
+        first, last = aggregations["first"]["value"], aggregations["last"]["value"]
+        if first is None or last is None:
+            return None
+        return int(first), int(last)
 
-    def experiments(self, group_id: str) -> Iterator[str]:
-        """Retrieves all experiment IDs within an experiment group."""
-        query = {
+    def _experiments_query(self, group_id: str) -> Dict[str, Any]:
+        """Query for the first page of experiments in a group. Later pages are requested by setting the
+        `after` key of the composite aggregation."""
+        return {
             "size": 0,
             "query": {
                 "constant_score": {
@@ -62,23 +149,30 @@ class LogstashSource(LogSource):
             },
             "aggs": {
                 "experiments": {
-                    "terms": {
-                        "field": f"pod_labels.{EXPERIMENT_LABEL}.keyword",
-                        "size": 1000,
+                    "composite": {
+                        "size": EXPERIMENTS_PAGE_SIZE,
+                        "sources": [
+                            {
+                                "experiment": {
+                                    "terms": {
+                                        "field": f"pod_labels.{EXPERIMENT_LABEL}.keyword"
+                                    }
+                                }
+                            }
+                        ],
                     }
                 }
             },
         }
 
-        response = self.client.search(index="benchmarks-*", body=query)
-        for bucket in response["aggregations"]["experiments"]["buckets"]:
-            yield bucket["key"]
-
-    def logs(
-        self, group_id: str, experiment_id: Optional[str] = None
-    ) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
-        """Retrieves logs for either all experiments within a group, or a specific experiment."""
-        filters = [{"term": {f"pod_labels.{GROUP_LABEL}.keyword": group_id}}]
+    def _logs_query(
+        self, group_id: str, experiment_id: Optional[str], group: GroupIndexes
+    ) -> Dict[str, Any]:
+        filters = [
+            {"term": {f"pod_labels.{GROUP_LABEL}.keyword": group_id}},
+            # Lets ES skip shards which hold no logs for the group without even searching them.
+            group.range_filter(),
+        ]
 
         if experiment_id:
             filters.append(
@@ -86,92 +180,596 @@ class LogstashSource(LogSource):
             )
 
         if self.structured_only:
-            filters.append({"match_phrase": {"message": "entry_type"}})
+            filters.extend(self._structured_filters())
 
-        query: Dict[str, Any] = {"query": {"bool": {"filter": filters}}}
+        query: Dict[str, Any] = {
+            "query": {"bool": {"filter": filters}},
+            "_source": SOURCE_FIELDS,
+        }
 
         if self.chronological:
-            query["sort"] = [{"@timestamp": {"order": "asc"}}]
+            # _shard_doc breaks ties, which search_after needs to tell where it left off.
+            query["sort"] = [{"@timestamp": {"order": "asc"}}, {"_shard_doc": "asc"}]
         else:
-            # More efficient, as per https://www.elastic.co/guide/en/elasticsearch/reference/current/paginate-search-results.html#scroll-search-results
-            query["sort"] = ["_doc"]
+            # Cheapest sort order, as per https://www.elastic.co/guide/en/elasticsearch/reference/current/paginate-search-results.html#search-after
+            query["sort"] = ["_shard_doc"]
 
-        # We can probably cache this, but for now OK.
-        actual_indexes = [
-            index for index in self.indexes if self.client.indices.exists(index=index)
-        ]
+        return query
 
-        if self.slices > 1:
-            logger.info(f"Querying ES with {self.slices} scroll slices.")
-            yield from pflatmap(
-                [
-                    self._run_scroll(sliced_query, actual_indexes)
-                    for sliced_query in self._sliced_queries(query)
-                ],
-                workers=self.slices,
-                max_queue_size=100_000,
-            )
+    def _structured_filters(self) -> List[Dict[str, Any]]:
+        # Term queries need no positions, unlike phrase queries, so they are cheaper to run. The marker
+        # itself does not survive analysis, so this is as tight as we can get on the marker.
+        filters: List[Dict[str, Any]] = [{"term": {"message": "entry_type"}}]
+        if self.entry_types is None:
+            return filters
+
+        if all(_TOKENIZABLE_TYPE_TAG.match(tag) for tag in self.entry_types):
+            filters.append({"terms": {"message": self.entry_types}})
         else:
-            yield from self._run_scroll(query, actual_indexes)
+            logger.warning(
+                "Some entry types cannot be matched as terms, not filtering on entry types in ES."
+            )
+        return filters
+
+    def _slice_count(self, settings: Dict[str, Any]) -> int:
+        # Slices come back interleaved, so logs are only in chronological order with a single one.
+        if self.chronological:
+            return 1
+        return self.slices if self.slices is not None else self._auto_slices(settings)
 
-    def _sliced_queries(self, query: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
-        for i in range(self.slices):
+    def _auto_slices(self, settings: Dict[str, Any]) -> int:
+        """Picks the number of slices from the `index.number_of_shards` settings of the target indexes."""
+        shards = sum(
+            int(index_settings["settings"]["index"]["number_of_shards"])
+            for index_settings in settings.values()
+        )
+        return max(1, min(shards, MAX_AUTO_SLICES))
+
+    def _sliced_queries(
+        self, query: Dict[str, Any], slices: int
+    ) -> Iterator[Dict[str, Any]]:
+        for i in range(slices):
             query_slice = query.copy()
-            query_slice["slice"] = {"id": i, "max": self.slices}
+            query_slice["slice"] = {"id": i, "max": slices}
             yield query_slice
 
-    def _run_scroll(self, query: Dict[str, Any], actual_indexes: List[str]):
-        scroll_response = self.client.search(
-            index=actual_indexes, body=query, scroll="2m", size=ES_MAX_BATCH_SIZE
+    def __str__(self):
+        return (
+            f"{type(self).__name__}(client={self.client}, structured_only={self.structured_only}, "
+            f"chronological={self.chronological}, entry_types={self.entry_types})"
+        )
+
+
+def daily_indexes(first: int, last: int) -> List[str]:
+    """Names of the daily indexes which may hold logs timestamped between `first` and `last` (in epoch
+    milliseconds)."""
+    day = _utc_day(first)
+    end = _utc_day(last)
+    indexes = []
+    while day <= end:
+        indexes.append(f"{INDEX_PREFIX}{day.strftime('%Y.%m.%d')}")
+        day += datetime.timedelta(days=1)
+    return indexes
+
+
+def _utc_day(epoch_millis: int) -> datetime.date:
+    return datetime.datetime.fromtimestamp(
+        epoch_millis / 1000, tz=datetime.timezone.utc
+    ).date()
+
+
+class LogstashSource(_BaseLogstashSource):
+    """Log source for logs stored in Elasticsearch by Logstash. This is typically used when running experiments
+    in a Kubernetes cluster."""
+
+    def __init__(
+        self,
+        client: Elasticsearch,
+        structured_only: bool = False,
+        chronological: bool = False,
+        slices: Optional[int] = 1,
+        entry_types: Optional[Iterable[str]] = None,
+    ):
+        """
+        Only the daily indexes which overlap with the time span of a group get queried for its logs. The span
+        comes from a min/max aggregation over all indexes, and gets cached along with the indexes, so later
+        queries for the same group do not pay for it.
+
+        @:param client: Elasticsearch client to use for retrieving logs
+        @:param structured_only: If True, only return structured log lines (those starting with '>>').
+        @:param chronological: If True, return logs in chronological order. This is mostly meant for use
+            in testing, and can get quite slow/expensive for large queries.
+        @:param slices: Number of slices to read in parallel. If None, uses as many slices as there are
+            primary shards in the target indexes, up to :data:`MAX_AUTO_SLICES`. Logs only come in
+            chronological order from a single slice, so this is ignored if `chronological` is set.
+        @:param entry_types: If set along with `structured_only`, only return lines carrying entries with
+            these type tags (e.g. those registered with a :class:`~benchmarks.logging.logging.LogParser`),
+            filtering them in ES rather than on our end.
+        """
+        super().__init__(
+            structured_only=structured_only,
+            chronological=chronological,
+            slices=slices,
+            entry_types=entry_types,
+        )
+        self.client = client
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.client.close()
+
+    def experiments(self, group_id: str) -> Iterator[str]:
+        """Retrieves all experiment IDs within an experiment group. Pages through them with a composite
+        aggregation, so there is no cap on the number of experiments."""
+        query = self._experiments_query(group_id)
+        while True:
+            response = self.client.search(index=INDEX_PATTERN, body=query)
+            experiments = response["aggregations"]["experiments"]
+            for bucket in experiments["buckets"]:
+                yield bucket["key"]["experiment"]
+
+            after_key = experiments.get("after_key")
+            if not experiments["buckets"] or after_key is None:
+                break
+            query["aggs"]["experiments"]["composite"]["after"] = after_key
+
+    def logs(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
+        """Retrieves logs for either all experiments within a group, or a specific experiment."""
+        group = self._resolve_group(group_id)
+        if group is None:
+            return
+
+        query = self._logs_query(group_id, experiment_id, group)
+        slices = self._slice_count(group.settings)
+
+        pit = _PointInTime(
+            self.client.open_point_in_time(
+                index=group.indexes, keep_alive=PIT_KEEP_ALIVE
+            )["id"],
+            slices,
+        )
+        try:
+            if slices > 1:
+                logger.info(f"Querying ES with {slices} slices.")
+                yield from pflatmap(
+                    [
+                        self._run_pit(sliced_query, pit, i)
+                        for i, sliced_query in enumerate(
+                            self._sliced_queries(query, slices)
+                        )
+                    ],
+                    workers=slices,
+                    max_queue_size=100_000,
+                )
+            else:
+                yield from self._run_pit(query, pit, 0)
+        finally:
+            logger.info("Closing point in time.")
+            for pit_id in pit.latest():
+                try:
+                    self.client.close_point_in_time(id=pit_id)
+                except NotFoundError:
+                    # Already closed through the ID of another slice.
+                    pass
+
+    def _resolve_group(self, group_id: str) -> Optional[GroupIndexes]:
+        """Works out where the logs for a group live, or returns `None` if there are none. Results get cached
+        for the lifetime of the source."""
+        cached = self._group_indexes.get(group_id)
+        if cached is not None:
+            return cached
+
+        span = self._span(
+            self.client.search(
+                index=INDEX_PATTERN, body=self._span_query(group_id)
+            ).body
+        )
+        if span is None:
+            return None
+
+        # Missing indexes get left out of the response, so this checks for them in a single call.
+        settings = self.client.indices.get_settings(
+            index=daily_indexes(*span),
+            name="index.number_of_shards",
+            ignore_unavailable=True,
+        ).body
+        if not settings:
+            logger.warning(f"No daily indexes found for the logs of group {group_id}.")
+            return None
+
+        group = self._group_indexes[group_id] = GroupIndexes(
+            indexes=sorted(settings), settings=settings, first=span[0], last=span[1]
+        )
+        logger.info(f"Logs for group {group_id} are in indexes {group.indexes}.")
+        return group
+
+    def _run_pit(self, query: Dict[str, Any], pit: _PointInTime, slice_id: int):
+        """Pages through the results for a query within a point in time with `search_after`. Unlike scroll
+        contexts, points in time get their keep-alive extended with every page, so we only have to make sure
+        pages get consumed quickly enough; see :class:`BatchSizer`."""
+        sizer = BatchSizer()
+        search_after: Optional[List[Any]] = None
+        pit_id = pit.ids[slice_id]
+
+        while True:
+            response = self.client.search(
+                body=_page_body(query, pit_id, sizer.size, search_after),
+                filter_path=RESPONSE_FILTER,
+            )
+            # The PIT ID may change between requests.
+            pit_id = pit.ids[slice_id] = response.get("pit_id", pit_id)
+
+            # Filtered responses have no hits at all, rather than an empty list, once we run out.
+            hits = response.get("hits", {}).get("hits", [])
+            logger.info(f"Retrieved {len(hits)} log entries.")
+            if not hits:
+                break
+
+            start = time.monotonic()
+            yield from _hit_lines(hits)
+
+            # Yielding blocks until the consumer catches up, so this measures how fast it is going.
+            sizer.update(len(hits), time.monotonic() - start)
+            search_after = hits[-1]["sort"]
+
+
+class _SliceEnd:
+    def __init__(self, exception: Optional[Exception]) -> None:
+        self.exception = exception
+
+
+class AsyncLogstashSource(_BaseLogstashSource):
+    """Log source for logs stored in Elasticsearch by Logstash, like :class:`LogstashSource`, but built on the
+    async ES client. All slices run as tasks on a single event loop, and each slice keeps the request for its
+    next page in flight while the consumer goes through the current one. Waiting on ES then overlaps with
+    whatever the consumer does with the logs (typically, parsing them), and slices need no threads of their own.
+
+    The event loop runs on a background thread, which gets started on first use and stopped once the source is
+    closed. Queries can be issued from several threads at once (e.g. when splitting experiments concurrently
+    with :func:`~benchmarks.logging.sources.sources.split_logs_in_source`), in which case they share the
+    loop as well."""
+
+    def __init__(
+        self,
+        client: AsyncElasticsearch,
+        structured_only: bool = False,
+        chronological: bool = False,
+        slices: Optional[int] = 1,
+        entry_types: Optional[Iterable[str]] = None,
+        prefetch: int = ASYNC_PREFETCH,
+    ):
+        """
+        @:param client: Async Elasticsearch client to use for retrieving logs. Gets bound to the event loop
+            of the source on first use, so it should not be used elsewhere.
+        @:param prefetch: Number of pages per slice to keep ready for the consumer, on top of the one in
+            flight for each slice.
+
+        See :class:`LogstashSource` for the remaining parameters.
+        """
+        super().__init__(
+            structured_only=structured_only,
+            chronological=chronological,
+            slices=slices,
+            entry_types=entry_types,
         )
-        scroll_id = scroll_response["_scroll_id"]
+        self.client = client
+        self.prefetch = prefetch
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._loop_lock = threading.Lock()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self._run(self.client.close())
+        finally:
+            self._stop_loop()
+
+    def experiments(self, group_id: str) -> Iterator[str]:
+        """Retrieves all experiment IDs within an experiment group, one page of experiments at a time."""
+        return self._iterate(self._experiment_pages(group_id))
+
+    def logs(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
+        """Retrieves logs for either all experiments within a group, or a specific experiment."""
+        return self._iterate(self._log_pages(group_id, experiment_id))
+
+    async def _experiment_pages(self, group_id: str) -> AsyncGenerator[List[str], None]:
+        query = self._experiments_query(group_id)
+        while True:
+            response = await self.client.search(index=INDEX_PATTERN, body=query)
+            experiments = response["aggregations"]["experiments"]
+            yield [bucket["key"]["experiment"] for bucket in experiments["buckets"]]
+
+            after_key = experiments.get("after_key")
+            if not experiments["buckets"] or after_key is None:
+                break
+            query["aggs"]["experiments"]["composite"]["after"] = after_key
+
+    async def _log_pages(
+        self, group_id: str, experiment_id: Optional[str]
+    ) -> AsyncGenerator[List[_LogLine], None]:
+        group = await self._resolve_group(group_id)
+        if group is None:
+            return
+
+        query = self._logs_query(group_id, experiment_id, group)
+        slices = self._slice_count(group.settings)
+        if slices > 1:
+            logger.info(f"Querying ES with {slices} slices.")
+
+        pit = _PointInTime(
+            (
+                await self.client.open_point_in_time(
+                    index=group.indexes, keep_alive=PIT_KEEP_ALIVE
+                )
+            )["id"],
+            slices,
+        )
+        pages: asyncio.Queue[List[_LogLine] | _SliceEnd] = asyncio.Queue(
+            slices * self.prefetch
+        )
+        tasks = [
+            asyncio.create_task(self._run_slice(sliced_query, pit, i, pages))
+            for i, sliced_query in enumerate(
+                self._sliced_queries(query, slices) if slices > 1 else [query]
+            )
+        ]
+        try:
+            exceptions: List[Exception] = []
+            active_slices = len(tasks)
+            while active_slices:
+                page = await pages.get()
+                if isinstance(page, _SliceEnd):
+                    active_slices -= 1
+                    if page.exception is not None:
+                        exceptions.append(page.exception)
+                else:
+                    yield page
+
+            if exceptions:
+                raise ExceptionGroup(
+                    "One or more slices failed to complete successfully", exceptions
+                )
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info("Closing point in time.")
+            for pit_id in pit.latest():
+                try:
+                    await self.client.close_point_in_time(id=pit_id)
+                except NotFoundError:
+                    # Already closed through the ID of another slice.
+                    pass
+
+    async def _resolve_group(self, group_id: str) -> Optional[GroupIndexes]:
+        """Same as :meth:`LogstashSource._resolve_group`."""
+        cached = self._group_indexes.get(group_id)
+        if cached is not None:
+            return cached
+
+        span = self._span(
+            (
+                await self.client.search(
+                    index=INDEX_PATTERN, body=self._span_query(group_id)
+                )
+            ).body
+        )
+        if span is None:
+            return None
+
+        settings = (
+            await self.client.indices.get_settings(
+                index=daily_indexes(*span),
+                name="index.number_of_shards",
+                ignore_unavailable=True,
+            )
+        ).body
+        if not settings:
+            logger.warning(f"No daily indexes found for the logs of group {group_id}.")
+            return None
+
+        group = self._group_indexes[group_id] = GroupIndexes(
+            indexes=sorted(settings), settings=settings, first=span[0], last=span[1]
+        )
+        logger.info(f"Logs for group {group_id} are in indexes {group.indexes}.")
+        return group
+
+    async def _run_slice(
+        self,
+        query: Dict[str, Any],
+        pit: _PointInTime,
+        slice_id: int,
+        pages: asyncio.Queue[List[_LogLine] | _SliceEnd],
+    ) -> None:
+        # Slices get cancelled only once nobody is reading off of the queue anymore, so there is no one to
+        # tell about it.
+        try:
+            await self._run_pit(query, pit, slice_id, pages)
+        except Exception as exception:
+            await pages.put(_SliceEnd(exception))
+        else:
+            await pages.put(_SliceEnd(None))
+
+    async def _run_pit(
+        self,
+        query: Dict[str, Any],
+        pit: _PointInTime,
+        slice_id: int,
+        pages: asyncio.Queue[List[_LogLine] | _SliceEnd],
+    ) -> None:
+        """Pages through the results for a query within a point in time, like :meth:`LogstashSource._run_pit`,
+        except that the request for the next page goes out as soon as the current page comes in."""
+        sizer = BatchSizer()
+        pit_id = pit.ids[slice_id]
+        request = asyncio.ensure_future(self._search(query, pit_id, sizer.size, None))
+        requested = time.monotonic()
+        consumed = 0
         try:
             while True:
-                hits = scroll_response["hits"]["hits"]
+                response = await request
+                # The PIT ID may change between requests.
+                pit_id = pit.ids[slice_id] = response.get("pit_id", pit_id)
+
+                # Filtered responses have no hits at all, rather than an empty list, once we run out.
+                hits = response.get("hits", {}).get("hits", [])
                 logger.info(f"Retrieved {len(hits)} log entries.")
                 if not hits:
-                    break
-
-                for hit in hits:
-                    source = hit["_source"]
-                    message = source["message"]
-
-                    experiment_id = source["pod_labels"][EXPERIMENT_LABEL]
-                    node_id = source["pod_name"]
-
-                    if (
-                        not isinstance(experiment_id, str)
-                        or not isinstance(node_id, str)
-                        or not isinstance(message, str)
-                    ):
-                        logger.warning(
-                            "Skipping log entry with invalid data: %s", source
-                        )
-                        continue
+                    return
 
-                    yield experiment_id, node_id, message
+                # Putting pages onto the queue blocks while the consumer is behind, so the time between two
+                # requests tells how fast it went through the previous page.
+                now = time.monotonic()
+                sizer.update(consumed, now - requested)
+                request = asyncio.ensure_future(
+                    self._search(query, pit_id, sizer.size, hits[-1]["sort"])
+                )
+                requested = now
 
-                # Get next batch of results
-                scroll_response = self.client.scroll(scroll_id=scroll_id, scroll="2m")
-        except Exception as e:
-            logger.exception(f"Error while scrolling: {e}")
+                lines = list(_hit_lines(hits))
+                consumed = len(lines)
+                await pages.put(lines)
         finally:
-            # Clean up scroll context
-            logger.info("Worker done, clearing scroll context.")
-            self.client.clear_scroll(scroll_id=scroll_id)
+            request.cancel()
 
-    def __str__(self):
-        return (
-            f"LogstashSource(client={self.client}, structured_only={self.structured_only}, "
-            f"chronological={self.chronological}, indexes={self.indexes})"
+    async def _search(
+        self,
+        query: Dict[str, Any],
+        pit_id: str,
+        size: int,
+        search_after: Optional[List[Any]],
+    ) -> Dict[str, Any]:
+        response = await self.client.search(
+            body=_page_body(query, pit_id, size, search_after),
+            filter_path=RESPONSE_FILTER,
         )
+        return cast(Dict[str, Any], response.body)
 
-    def _generate_indexes(self, today: Optional[datetime.date], horizon: int):
-        if today is None:
-            today = datetime.date.today()
+    def _iterate(self, pages: AsyncGenerator[List[T], None]) -> Iterator[T]:
+        """Bridges an async iterator of pages running on the event loop onto a plain iterator of items."""
+        loop = self._event_loop()
+        try:
+            while True:
+                page = self._run(_next_page(pages), loop)
+                if page is None:
+                    return
+                yield from page
+        finally:
+            # If the source got closed before the pages ran out, the loop (and whatever was running on it)
+            # is gone already.
+            if self._loop is loop:
+                self._run(_close(pages), loop)
 
-        return [
-            f"benchmarks-{(today - datetime.timedelta(days=i)).strftime('%Y.%m.%d')}"
-            for i in range(horizon)
-        ]
+    def _run(
+        self,
+        coroutine: Coroutine[Any, Any, T],
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> T:
+        return asyncio.run_coroutine_threadsafe(
+            coroutine, loop or self._event_loop()
+        ).result()
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="async-logstash-source",
+                    daemon=True,
+                )
+                self._loop_thread.start()
+            return self._loop
+
+    def _stop_loop(self) -> None:
+        with self._loop_lock:
+            loop, thread = self._loop, self._loop_thread
+            if loop is None:
+                return
+            self._loop, self._loop_thread = None, None
+            loop.call_soon_threadsafe(loop.stop)
+            cast(threading.Thread, thread).join()
+            loop.close()
+
+
+async def _next_page(pages: AsyncGenerator[List[T], None]) -> Optional[List[T]]:
+    try:
+        return await anext(pages)
+    except StopAsyncIteration:
+        return None
+
+
+async def _close(pages: AsyncGenerator[Any, None]) -> None:
+    await pages.aclose()
+
+
+def _page_body(
+    query: Dict[str, Any],
+    pit_id: str,
+    size: int,
+    search_after: Optional[List[Any]],
+) -> Dict[str, Any]:
+    body = dict(query)
+    body["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+    body["size"] = size
+    if search_after is not None:
+        body["search_after"] = search_after
+    return body
+
+
+def _hit_lines(hits: List[Dict[str, Any]]) -> Iterator[_LogLine]:
+    for hit in hits:
+        source = hit["_source"]
+        message = source["message"]
+
+        experiment_id = source["pod_labels"][EXPERIMENT_LABEL]
+        node_id = source["pod_name"]
+
+        if (
+            not isinstance(experiment_id, str)
+            or not isinstance(node_id, str)
+            or not isinstance(message, str)
+        ):
+            logger.warning("Skipping log entry with invalid data: %s", source)
+            continue
+
+        yield experiment_id, node_id, message
+
+
+class BatchSizer:
+    """Adapts the size of the pages requested from ES to the throughput of the consumer, so that the time
+    it takes for the consumer to go through a page stays well within the keep-alive of the point in time.
+    Pages start at the maximum size allowed by ES, and only get smaller for slow consumers."""
+
+    def __init__(
+        self,
+        keep_alive: float = PIT_KEEP_ALIVE_SECONDS,
+        min_size: int = ES_MIN_BATCH_SIZE,
+        max_size: int = ES_MAX_BATCH_SIZE,
+        target_fraction: float = 0.25,
+    ):
+        """
+        @:param keep_alive: The keep-alive of the point in time, in seconds.
+        @:param target_fraction: Fraction of the keep-alive which consuming a page should take.
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target = keep_alive * target_fraction
+        self.size = max_size
+
+    def update(self, items: int, seconds: float) -> int:
+        """Records how long the consumer took to go through a page, and works out the size for the next one."""
+        if items > 0 and seconds > 0:
+            throughput = items / seconds
+            self.size = max(
+                self.min_size, min(self.max_size, int(throughput * self.target))
+            )
+        return self.size
@@ -0,0 +1,191 @@
+"""Chronological ordering for arbitrary log sources, under bounded memory."""
+
+import heapq
+import logging
+import pickle
+import re
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from benchmarks.logging.sources.sources import (
+    ExperimentId,
+    LogSource,
+    NodeId,
+    RawLine,
+)
+from benchmarks.logging.timestamps import parse_epoch_ns
+
+logger = logging.getLogger(__name__)
+
+#: Default amount of memory, in bytes, that lines may take up before they get spilled to disk.
+DEFAULT_MEMORY_BUDGET = 256 * 1024**2
+
+#: Default maximum number of runs merged at once. Each run being merged holds a batch of lines in memory.
+DEFAULT_MAX_FAN_IN = 64
+
+#: Approximate memory taken up by a buffered line on top of the line itself (tuple, ints, and references
+#: to the experiment and node IDs, which are shared across lines).
+_RECORD_OVERHEAD = 160
+
+#: Lines get written onto runs, and read back from them, in batches of this many bytes (give or take).
+_BATCH_SIZE = 256 * 1024
+
+_TIMESTAMP = re.compile(r'"timestamp":\s*"(?P<timestamp>[^"]+)"')
+
+#: A line, along with its timestamp and its position in the source.
+type _Record = Tuple[int, int, ExperimentId, NodeId, RawLine]
+
+#: Extracts a timestamp, in epoch nanoseconds, from a log line. Returns `None` for lines without timestamps.
+type TimestampKey = Callable[[ExperimentId, NodeId, RawLine], Optional[int]]
+
+
+def entry_timestamp(
+    experiment_id: ExperimentId, node_id: NodeId, raw_line: RawLine
+) -> Optional[int]:
+    """Default :data:`TimestampKey`: the timestamp of the structured entry in a line, if any."""
+    match = _TIMESTAMP.search(raw_line)
+    if match is None:
+        return None
+    try:
+        return parse_epoch_ns(match.group("timestamp"))
+    except ValueError:
+        return None
+
+
+class SortingLogSource(LogSource):
+    """A :class:`LogSource` which returns the logs of another source in chronological order. Unlike sorting
+    within sources (e.g. :class:`~benchmarks.logging.sources.vector_flat_file.VectorFlatFileSource` in sorted
+    mode), this makes no assumptions on the order in which the wrapped source returns lines, so it works for
+    chained or otherwise merged sources as well.
+
+    Lines get buffered up to a memory budget, then sorted and spilled as runs onto temporary files, which
+    get merged back at the end. Memory use is therefore bounded by the budget, plus one batch of lines per
+    run being merged, regardless of how large the logs are.
+
+    Lines without a timestamp (e.g. unstructured log messages) take the timestamp of the last line
+    with one from the same node, so that they stay next to it. Lines with the same timestamp come in the
+    order in which the wrapped source returned them."""
+
+    def __init__(
+        self,
+        source: LogSource,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        timestamp_key: TimestampKey = entry_timestamp,
+        spill_dir: Optional[Path] = None,
+        max_fan_in: int = DEFAULT_MAX_FAN_IN,
+    ) -> None:
+        """
+        :param source: The source to sort logs from.
+        :param memory_budget: How much memory, in bytes, buffered lines may take up before getting spilled.
+        :param timestamp_key: How to extract timestamps from lines.
+        :param spill_dir: Where to create temporary files. Uses the system's default temporary folder if omitted.
+        :param max_fan_in: Maximum number of runs to merge at once. Merges happen in multiple passes if
+            there are more runs than that.
+        """
+        if max_fan_in < 2:
+            raise ValueError("max_fan_in must be at least 2.")
+        self.source = source
+        self.memory_budget = memory_budget
+        self.timestamp_key = timestamp_key
+        self.spill_dir = spill_dir
+        self.max_fan_in = max_fan_in
+
+    def __enter__(self):
+        self.source.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self.source.__exit__(exc_type, exc_val, exc_tb)
+
+    def experiments(self, group_id: str) -> Iterator[str]:
+        return self.source.experiments(group_id)
+
+    def logs(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
+        with tempfile.TemporaryDirectory(dir=self.spill_dir) as scratch:
+            for _, _, experiment, node, line in self._sorted(
+                self._records(group_id, experiment_id), Path(scratch)
+            ):
+                yield experiment, node, line
+
+    def _records(
+        self, group_id: str, experiment_id: Optional[str]
+    ) -> Iterator[_Record]:
+        last_timestamps: Dict[Tuple[ExperimentId, NodeId], int] = {}
+        for sequence, (experiment, node, line) in enumerate(
+            self.source.logs(group_id, experiment_id)
+        ):
+            timestamp = self.timestamp_key(experiment, node, line)
+            if timestamp is None:
+                timestamp = last_timestamps.get((experiment, node), 0)
+            else:
+                last_timestamps[(experiment, node)] = timestamp
+            yield timestamp, sequence, experiment, node, line
+
+    def _sorted(self, records: Iterable[_Record], scratch: Path) -> Iterator[_Record]:
+        runs: List[Path] = []
+        buffer: List[_Record] = []
+        buffered = 0
+        for record in records:
+            buffer.append(record)
+            buffered += len(record[4]) + _RECORD_OVERHEAD
+            if buffered >= self.memory_budget:
+                buffer.sort()
+                runs.append(_write_run(scratch / f"run-{len(runs)}", buffer))
+                buffer, buffered = [], 0
+
+        buffer.sort()
+        # Everything fit in memory, so there's nothing to merge.
+        if not runs:
+            yield from buffer
+            return
+
+        runs.append(_write_run(scratch / f"run-{len(runs)}", buffer))
+        del buffer
+
+        logger.info(f"Merging {len(runs)} sorted runs.")
+        merged = 0
+        while len(runs) > self.max_fan_in:
+            batch, runs = runs[: self.max_fan_in], runs[self.max_fan_in :]
+            runs.append(
+                _write_run(
+                    scratch / f"merged-{merged}",
+                    heapq.merge(*(_read_run(run) for run in batch)),
+                )
+            )
+            merged += 1
+
+        yield from heapq.merge(*(_read_run(run) for run in runs))
+
+
+def _write_run(path: Path, records: Iterable[_Record]) -> Path:
+    """Writes sorted records onto a run, as a sequence of pickled batches."""
+    with path.open("wb") as ostream:
+        batch: List[_Record] = []
+        size = 0
+        for record in records:
+            batch.append(record)
+            size += len(record[4]) + _RECORD_OVERHEAD
+            if size >= _BATCH_SIZE:
+                pickle.dump(batch, ostream, protocol=pickle.HIGHEST_PROTOCOL)
+                batch, size = [], 0
+        if batch:
+            pickle.dump(batch, ostream, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path: Path) -> Iterator[_Record]:
+    """Reads a run back, one batch at a time, and deletes it once done."""
+    try:
+        with path.open("rb") as istream:
+            while True:
+                try:
+                    batch = pickle.load(istream)
+                except EOFError:
+                    return
+                yield from batch
+    finally:
+        path.unlink(missing_ok=True)
@@ -1,11 +1,25 @@
 import logging
+import threading
+import zlib
 from abc import abstractmethod
+from collections import OrderedDict
 from collections.abc import Iterator
-from contextlib import AbstractContextManager
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager, ExitStack, contextmanager, nullcontext
+from functools import partial
+from itertools import batched
 from pathlib import Path
-from typing import Optional, Tuple, List, Dict, Type, IO
+from typing import Optional, Tuple, List, Dict, Type, IO, Callable, Any, cast
 
+from benchmarks.core.concurrency import (
+    ensure_successful,
+    pflatmap,
+    pflatmap_processes,
+    pshard_processes,
+)
+from benchmarks.logging.compression import Compression, open_file
 from benchmarks.logging.logging import (
+    MARKER,
     LogParser,
     LogSplitter,
     LogSplitterFormats,
@@ -46,14 +60,17 @@ class OutputManager(AbstractContextManager):
     """An :class:`OutputManager` is responsible for managing output locations for log splitting operations.
     :class:`OutputManager`s must be closed after use, and implements the context manager interface to that end."""
 
-    def open(self, relative_path: Path, mode: str = "w", encoding="utf-8") -> IO:
-        """Opens a file for writing within a relative abstract path."""
+    def open(
+        self, relative_path: Path, mode: str = "w", encoding: Optional[str] = "utf-8"
+    ) -> IO:
+        """Opens a file for writing within a relative abstract path. Binary modes require `encoding` to be
+        set to `None`."""
         if relative_path.is_absolute():
             raise ValueError(f"Path {relative_path} must be relative.")
         return self._open(relative_path, mode, encoding)
 
     @abstractmethod
-    def _open(self, relative_path: Path, mode: str, encoding: str) -> IO:
+    def _open(self, relative_path: Path, mode: str, encoding: Optional[str]) -> IO:
         pass
 
 
@@ -82,34 +99,248 @@ class ChainedLogSource(LogSource):
                 yield from source.logs(group_id, experiment_id)
 
 
+type LogSourceFactory = Callable[[], LogSource]
+
+#: Number of lines handed over at once by the threads or processes of a :class:`ConcurrentChainedLogSource`.
+CONCURRENT_BATCH_SIZE = 1000
+
+
+class ConcurrentChainedLogSource(LogSource):
+    """A :class:`LogSource` which chains multiple sources together, like :class:`ChainedLogSource`, but reads
+    from several of them at once. Lines from the same source come in order, but lines from different sources
+    get interleaved.
+
+    Sources get read either in threads, which is enough for sources which are I/O-bound (e.g.
+    :class:`~benchmarks.logging.sources.logstash.LogstashSource`), or in separate processes, for sources
+    which are CPU-bound (e.g. :class:`~benchmarks.logging.sources.vector_flat_file.VectorFlatFileSource`,
+    which spends most of its time parsing JSON). Since sources cannot always be shipped to other processes
+    (they typically hold open files or connections), this takes factories for sources instead, which must
+    be picklable when running in separate processes."""
+
+    def __init__(
+        self,
+        sources: List[LogSourceFactory],
+        workers: int = 4,
+        prefetch: int = 64,
+        processes: bool = False,
+    ) -> None:
+        """
+        :param sources: Factories for the sources to read from.
+        :param workers: Maximum number of sources to read from at once.
+        :param prefetch: Maximum number of batches of lines (of :data:`CONCURRENT_BATCH_SIZE` lines each) read
+            ahead of the consumer.
+        :param processes: Whether to read sources in separate processes rather than threads.
+        """
+        self.sources = sources
+        self.workers = workers
+        self.prefetch = prefetch
+        self.processes = processes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def experiments(self, group_id: str) -> Iterator[str]:
+        for factory in self.sources:
+            with factory() as source:
+                yield from source.experiments(group_id)
+
+    def logs(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
+        tasks = [
+            partial(_source_logs, factory, group_id, experiment_id)
+            for factory in self.sources
+        ]
+        if self.processes:
+            yield from pflatmap_processes(
+                tasks,
+                workers=self.workers,
+                max_queue_size=self.prefetch,
+                batch_size=CONCURRENT_BATCH_SIZE,
+            )
+            return
+
+        for batch in pflatmap(
+            [batched(task(), CONCURRENT_BATCH_SIZE) for task in tasks],
+            workers=self.workers,
+            max_queue_size=self.prefetch,
+        ):
+            yield from batch
+
+
+def _source_logs(
+    factory: LogSourceFactory, group_id: str, experiment_id: Optional[str]
+) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
+    with factory() as source:
+        yield from source.logs(group_id, experiment_id)
+
+
+#: Default maximum number of files an :class:`FSOutputManager` keeps open at once.
+DEFAULT_MAX_OPEN_FILES = 128
+
+
 class FSOutputManager(OutputManager):
     """Simple :class:`OutputManager` which writes directly into the file system.
 
-    The current implementation is very simple, and might end up keeping a lot of open files.
-    Since there's locality in th logs, we can make this better without making it slower by just
-    bounding the number of open files and juggling them as an LRU cache of sorts,
-    but for now just make sure your limits are big enough.
+    Splitting logs for large groups may take as many outputs as there are entry types times experiments, so
+    at most `max_open_files` files are kept open at once, which bounds both the number of file descriptors
+    and the memory taken up by write buffers. Opening or writing to a file past that closes the least
+    recently written one, after flushing it. Closed files get reopened in append mode the next time they get
+    written to, which is transparent to whoever writes to them, except that positions (:meth:`IO.tell`)
+    taken before and after a reopen may not line up. Writers which only write headers onto empty files
+    (e.g. :class:`~benchmarks.logging.writers.CSVWriter`) check that once, upon creation, so they never
+    write headers twice.
+
+    Files opened in text mode can be compressed on the fly, in which case the compression's extension gets appended
+    to their names. Binary files are left alone, as our only binary output format (Parquet) comes compressed
+    already.
+
+    Managers can be pickled, e.g. to be handed over to worker processes (see `split_processes` in
+    :func:`split_logs_in_source`). Unpickled copies write onto the same root, but start off with no open files.
     """
 
-    def __init__(self, root: Path) -> None:
+    def __init__(
+        self,
+        root: Path,
+        compression: Optional[Compression] = None,
+        max_open_files: int = DEFAULT_MAX_OPEN_FILES,
+    ) -> None:
+        if max_open_files < 1:
+            raise ValueError("max_open_files must be at least 1.")
         self.root = root
-        self.open_files: List[IO] = []
-
-    def _open(self, relative_path: Path, mode: str, encoding: str) -> IO:
+        self.compression = compression
+        self.max_open_files = max_open_files
+        self.files: List[_PooledFile] = []
+        # Files which are currently open, from least to most recently written.
+        self.open_files: OrderedDict[_PooledFile, None] = OrderedDict()
+        # Outputs may get written to from multiple threads (see `experiment_workers` in
+        # :func:`split_logs_in_source`), and any of them may close files written to by the others.
+        self._lock = threading.Lock()
+
+    def _open(self, relative_path: Path, mode: str, encoding: Optional[str]) -> IO:
         fullpath = self.root / relative_path
         parent = fullpath.parent
         parent.mkdir(parents=True, exist_ok=True)
-        f = fullpath.open(mode, encoding=encoding)
-        self.open_files.append(f)
-        return f
+        if self.compression is not None and "b" not in mode:
+            fullpath = fullpath.with_name(f"{fullpath.name}{self.compression.suffix}")
+        pooled = _PooledFile(self, fullpath, mode, encoding)
+        with self._lock:
+            self._reopen(pooled)
+            self.files.append(pooled)
+        return cast(IO, pooled)
+
+    def _reopen(self, pooled: "_PooledFile") -> IO:
+        while len(self.open_files) >= self.max_open_files:
+            evicted, _ = self.open_files.popitem(last=False)
+            evicted.release()
+        stream = pooled.acquire()
+        self.open_files[pooled] = None
+        return stream
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        for f in self.open_files:
+        for f in self.files:
             try:
                 f.close()
             except IOError:
                 pass
 
+    def __getstate__(self) -> Dict[str, Any]:
+        return {
+            "root": self.root,
+            "compression": self.compression,
+            "max_open_files": self.max_open_files,
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(**state)  # type: ignore[misc]
+
+
+class _PooledFile:
+    """A file handed out by :class:`FSOutputManager`, which the manager may close whenever it needs to, and
+    which gets reopened in append mode whenever it gets written to after that."""
+
+    def __init__(
+        self, manager: FSOutputManager, path: Path, mode: str, encoding: Optional[str]
+    ) -> None:
+        self.manager = manager
+        self.path = path
+        self.mode = mode
+        self.encoding = encoding
+        self.stream: Optional[IO] = None
+        self.closed = False
+
+    def acquire(self) -> IO:
+        self.stream = open_file(self.path, self.mode, encoding=self.encoding)
+        # Anything written from now on must go after whatever got written before.
+        self.mode = self.mode.replace("w", "a")
+        return self.stream
+
+    def release(self) -> None:
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def _stream(self) -> IO:
+        """Returns the underlying stream, reopening it if needed, and marks it as the most recently used one.
+        Must be called with the manager's lock held."""
+        if self.closed:
+            raise ValueError(f"I/O operation on closed file {self.path}.")
+        if self.stream is None:
+            return self.manager._reopen(self)
+        self.manager.open_files.move_to_end(self)
+        return self.stream
+
+    def write(self, data):
+        with self.manager._lock:
+            return self._stream().write(data)
+
+    def tell(self) -> int:
+        with self.manager._lock:
+            return self._stream().tell()
+
+    def flush(self) -> None:
+        with self.manager._lock:
+            if self.stream is not None:
+                self.stream.flush()
+
+    def writable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return False
+
+    def seekable(self) -> bool:
+        return False
+
+    def close(self) -> None:
+        with self.manager._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.manager.open_files.pop(self, None)
+            self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+#: Number of lines handed over at once to the worker processes of :func:`split_logs_in_source`.
+SPLIT_BATCH_SIZE = 1000
+
+#: Maximum number of batches of lines backlogged for each worker process of :func:`split_logs_in_source`.
+SPLIT_QUEUE_SIZE = 16
+
+#: Maximum number of lines split onto outputs which are kept open until the end before all of their writers
+#: get flushed. Each writer buffers up to :data:`~benchmarks.logging.writers.COLUMNAR_BATCH_SIZE` rows, so
+#: without this, memory would grow with the number of experiments in a group.
+MAX_BUFFERED_LINES = 256 * 1024
+
 
 def split_logs_in_source(
     log_source: LogSource,
@@ -117,38 +348,250 @@ def split_logs_in_source(
     output_manager: OutputManager,
     group_id: str,
     formats: Optional[List[Tuple[Type[LogEntry], LogSplitterFormats]]] = None,
+    default_format: LogSplitterFormats = LogSplitterFormats.csv,
+    passthrough: bool = False,
+    compact_timestamps: bool = False,
+    experiment_workers: int = 0,
+    split_processes: int = 0,
+    flush_interval: Optional[float] = None,
 ) -> None:
     """
     Parses logs for an entire experiment group and splits them onto separate folders per experiment, as well
     as separate files for each log type. This makes it suitable for consumption by an analysis environment.
 
+    By default, logs for the whole group are retrieved with a single query, and outputs for all experiments are
+    kept open until the end. With `experiment_workers` set, experiments are instead listed upfront and retrieved
+    with separate queries, that many at a time, each onto its own :class:`LogSplitter` which gets closed as soon
+    as its experiment is done. This pays off for sources which can answer per-experiment queries efficiently
+    (e.g. :class:`~benchmarks.logging.sources.logstash.LogstashSource`), as waiting on the source for one
+    experiment then overlaps with parsing the logs of another. The source must then support being queried from
+    multiple threads at once, which sources reading off of a single file handle (e.g.
+    :class:`~benchmarks.logging.sources.vector_flat_file.VectorFlatFileSource`) do not.
+
+    Parsing and writing out lines takes up a full core, which caps throughput for sources which can deliver
+    lines faster than that (e.g. :class:`~benchmarks.logging.sources.logstash.LogstashSource` with several
+    slices). With `split_processes` set, logs are still retrieved in the current process, but then get split
+    in that many worker processes instead, each owning the :class:`LogSplitter`s for the experiments which
+    hash onto it. Workers write through their own copy of `output_manager`, which must then be picklable (as
+    :class:`FSOutputManager` is), as must `log_parser`.
+
+    Outputs only get written out in full once all logs have been split. Sources which keep returning logs while
+    experiments run (e.g. :class:`~benchmarks.logging.sources.vector_flat_file.VectorTailSource`) take
+    `flush_interval`, which makes whatever got split so far readable off of uncompressed CSV and JSONL outputs
+    every so often. Compressed outputs only become readable once complete, and Parquet outputs get a row group
+    per flush, but only become readable once closed.
+
     :param log_source: The :class:`LogSource` to retrieve logs from.
     :param log_parser: A suitably configured :class:`LogParser` which can understand the logs.
     :param output_manager: An :class:`OutputManager` to manage where output content gets placed.
     :param group_id: The group ID to retrieve logs for.
     :param formats: An additional format configuration to be fed onto :class:`LogSplitter`.
+    :param default_format: The format to use for entry types which have no format set in `formats`.
+    :param passthrough: Whether to run :class:`LogSplitter` in pass-through mode, which makes splitting onto
+        JSONL outputs much cheaper.
+    :param compact_timestamps: Whether to write timestamps onto CSV outputs as epoch nanoseconds.
+    :param experiment_workers: Number of experiments to retrieve and split at once, in separate threads. Logs
+        get retrieved for the whole group at once if zero.
+    :param split_processes: Number of worker processes to split logs in. Logs get split in the current process
+        if zero. Cannot be combined with `experiment_workers`.
+    :param flush_interval: How often to flush outputs, in seconds. Cannot be combined with `experiment_workers`
+        or `split_processes`.
     """
-    splitters: Dict[str, LogSplitter] = {}
-    formats = formats if formats else []
+    if experiment_workers > 0 and split_processes > 0:
+        raise ValueError(
+            "experiment_workers and split_processes are mutually exclusive."
+        )
+    if flush_interval is not None and (experiment_workers > 0 or split_processes > 0):
+        raise ValueError(
+            "flush_interval cannot be combined with experiment_workers or split_processes."
+        )
+
+    splitter_options: Dict[str, Any] = dict(
+        formats=formats if formats else [],
+        default_format=default_format,
+        passthrough=passthrough,
+        compact_timestamps=compact_timestamps,
+    )
+    splitter_factory = partial(_experiment_splitter, output_manager, **splitter_options)
 
     logger.info(f'Processing logs for group "{group_id} from source "{log_source}"')
 
-    for experiment_id, node_id, raw_line in log_source.logs(group_id):
-        splitter = splitters.get(experiment_id)
-        if splitter is None:
-            logger.info(f"Found experiment {experiment_id}")
-            splitter = LogSplitter(
-                lambda event_type, ext: output_manager.open(
-                    Path(experiment_id) / f"{event_type}.{ext.value}"
-                )
-            )
-            for entry_type, output_format in formats:
-                splitter.set_format(entry_type, output_format)
+    if experiment_workers > 0:
+        _split_experiments(
+            log_source, log_parser, splitter_factory, group_id, experiment_workers
+        )
+        logger.info("Finished processing logs.")
+        return
+
+    lines = (
+        (experiment_id, raw_line)
+        for experiment_id, _, raw_line in log_source.logs(group_id)
+    )
+    if split_processes > 0:
+        pshard_processes(
+            # Lines without structured entries get discarded by splitters anyway, and are typically the vast
+            # majority, so there is no point in shipping them to workers.
+            (line for line in lines if MARKER in line[1]),
+            consumer=partial(
+                _split_shard, output_manager, log_parser, splitter_options
+            ),
+            shard=_experiment_shards(split_processes),
+            workers=split_processes,
+            max_queue_size=SPLIT_QUEUE_SIZE,
+            batch_size=SPLIT_BATCH_SIZE,
+        )
+    else:
+        _split_lines(lines, log_parser, splitter_factory, flush_interval)
 
-            splitters[experiment_id] = splitter
+    logger.info("Finished processing logs.")
 
-        parsed = log_parser.parse_single(raw_line)
-        if parsed:
-            splitter.split_single(parsed)
 
-    logger.info("Finished processing logs.")
+def _split_lines(
+    lines: Iterator[Tuple[ExperimentId, RawLine]],
+    log_parser: LogParser,
+    splitter_factory: Callable[[ExperimentId], LogSplitter],
+    flush_interval: Optional[float] = None,
+) -> None:
+    splitters: Dict[str, LogSplitter] = {}
+    flusher: AbstractContextManager[AbstractContextManager] = (
+        _flushing(splitters, flush_interval)
+        if flush_interval is not None
+        # Uncontended locks are cheaper to go through than no-op context managers written in Python.
+        else nullcontext(threading.Lock())
+    )
+    # Each line yields at most one entry, so flushing all writers every so many lines bounds the total number
+    # of rows they buffer, regardless of how many there are.
+    buffered = 0
+    # Splitters get closed only after the flusher stops, so it never flushes closed outputs.
+    with ExitStack() as stack, flusher as guard:
+        for experiment_id, raw_line in lines:
+            with guard:
+                splitter = splitters.get(experiment_id)
+                if splitter is None:
+                    logger.info(f"Found experiment {experiment_id}")
+                    splitter = stack.enter_context(splitter_factory(experiment_id))
+                    splitters[experiment_id] = splitter
+
+                splitter.split_line(raw_line, log_parser)
+
+                buffered += 1
+                if buffered >= MAX_BUFFERED_LINES:
+                    for open_splitter in splitters.values():
+                        open_splitter.flush()
+                    buffered = 0
+
+
+@contextmanager
+def _flushing(
+    splitters: Dict[str, LogSplitter], interval: float
+) -> Iterator[threading.Lock]:
+    """Flushes splitters and their outputs every `interval` seconds, from a background thread, so that this
+    also happens while waiting on the source. This makes uncompressed CSV and JSONL outputs readable as they
+    go; see :func:`split_logs_in_source`. Splitters must only be used with the returned lock held."""
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def _flush() -> None:
+        while not done.wait(interval):
+            with lock:
+                for splitter in splitters.values():
+                    try:
+                        splitter.flush(outputs=True)
+                    except Exception:
+                        logger.exception("Failed to flush outputs.")
+
+    flusher = threading.Thread(target=_flush, daemon=True)
+    flusher.start()
+    try:
+        yield lock
+    finally:
+        done.set()
+        flusher.join()
+
+
+def _split_shard(
+    output_manager: OutputManager,
+    log_parser: LogParser,
+    splitter_options: Dict[str, Any],
+    lines: Iterator[Tuple[ExperimentId, RawLine]],
+) -> None:
+    """Splits the lines handed over to a worker process, through the worker's own copy of the output manager."""
+    with output_manager:
+        _split_lines(
+            lines,
+            log_parser,
+            partial(_experiment_splitter, output_manager, **splitter_options),
+        )
+
+
+def _experiment_shards(
+    shards: int,
+) -> Callable[[Tuple[ExperimentId, RawLine]], int]:
+    """Maps lines onto shards by experiment. Uses a stable hash rather than :func:`hash`, which is salted
+    differently on each run, so that experiments always land on the same shard."""
+    cache: Dict[ExperimentId, int] = {}
+
+    def _shard(line: Tuple[ExperimentId, RawLine]) -> int:
+        experiment_id = line[0]
+        shard = cache.get(experiment_id)
+        if shard is None:
+            shard = zlib.crc32(experiment_id.encode()) % shards
+            cache[experiment_id] = shard
+        return shard
+
+    return _shard
+
+
+def _split_experiments(
+    log_source: LogSource,
+    log_parser: LogParser,
+    splitter_factory: Callable[[ExperimentId], LogSplitter],
+    group_id: str,
+    workers: int,
+) -> None:
+    def _split_experiment(experiment_id: ExperimentId) -> None:
+        with splitter_factory(experiment_id) as splitter:
+            for _, _, raw_line in log_source.logs(group_id, experiment_id):
+                splitter.split_line(raw_line, log_parser)
+        logger.info(f"Finished experiment {experiment_id}")
+
+    # Chained sources may list the same experiment more than once.
+    experiment_ids = list(dict.fromkeys(log_source.experiments(group_id)))
+    logger.info(f"Found {len(experiment_ids)} experiments.")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        ensure_successful(
+            executor.submit(_split_experiment, experiment_id)
+            for experiment_id in experiment_ids
+        )
+
+
+def _experiment_splitter(
+    output_manager: OutputManager,
+    experiment_id: ExperimentId,
+    formats: List[Tuple[Type[LogEntry], LogSplitterFormats]],
+    default_format: LogSplitterFormats,
+    passthrough: bool,
+    compact_timestamps: bool,
+) -> LogSplitter:
+    splitter = LogSplitter(
+        _experiment_output(output_manager, experiment_id),
+        default_format=default_format,
+        passthrough=passthrough,
+        compact_timestamps=compact_timestamps,
+    )
+    for entry_type, output_format in formats:
+        splitter.set_format(entry_type, output_format)
+    return splitter
+
+
+def _experiment_output(
+    output_manager: OutputManager, experiment_id: ExperimentId
+) -> Callable[[str, LogSplitterFormats], IO]:
+    def output_factory(event_type: str, output_format: LogSplitterFormats) -> IO:
+        path = Path(experiment_id) / f"{event_type}.{output_format.value}"
+        if output_format.binary:
+            return output_manager.open(path, mode="wb", encoding=None)
+        return output_manager.open(path)
+
+    return output_factory
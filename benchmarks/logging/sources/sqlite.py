@@ -0,0 +1,292 @@
+"""Local, indexed log store backed by SQLite."""
+
+import logging
+import sqlite3
+import threading
+from collections.abc import Iterator
+from itertools import batched
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from benchmarks.logging.logging import entry_type_tag
+from benchmarks.logging.sources.sorting import TimestampKey, entry_timestamp
+from benchmarks.logging.sources.sources import (
+    ExperimentId,
+    LogSource,
+    NodeId,
+    RawLine,
+)
+
+logger = logging.getLogger(__name__)
+
+#: Number of lines inserted per transaction when storing logs.
+DEFAULT_INSERT_BATCH_SIZE = 10_000
+
+#: Number of rows fetched at once when reading logs back.
+_FETCH_SIZE = 1_000
+
+#: Bumped whenever the schema changes in ways older databases would not be readable with.
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY,
+    group_id TEXT NOT NULL,
+    experiment_id TEXT NOT NULL,
+    node_id TEXT NOT NULL,
+    entry_type TEXT,
+    timestamp INTEGER NOT NULL,
+    line TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS experiments (
+    group_id TEXT NOT NULL,
+    experiment_id TEXT NOT NULL,
+    PRIMARY KEY (group_id, experiment_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS groups (
+    group_id TEXT PRIMARY KEY,
+    lines INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Rows in an index are ordered by rowid within equal keys, so reads which follow the index come in
+# insertion order, or in chronological order with ties broken by insertion order, without sorting.
+_INDEXES = {
+    "logs_by_group": "logs (group_id)",
+    "logs_by_experiment": "logs (group_id, experiment_id)",
+    "logs_by_time": "logs (group_id, timestamp)",
+    "logs_by_experiment_time": "logs (group_id, experiment_id, timestamp)",
+    "logs_by_node_time": "logs (group_id, node_id, timestamp)",
+    "logs_by_entry_type": "logs (group_id, entry_type)",
+}
+
+type _Row = Tuple[str, ExperimentId, NodeId, Optional[str], int, RawLine]
+
+
+class SQLiteLogSource(LogSource):
+    """A :class:`LogSource` backed by a local SQLite database, which logs for whole groups get stored into
+    (see :meth:`SQLiteLogSource.ingest`), typically from sources which are slow to query (e.g.
+    :class:`~benchmarks.logging.sources.vector_flat_file.VectorFlatFileSource`, which has to scan the dump) or
+    which cost money to query (e.g. :class:`~benchmarks.logging.sources.logstash.LogstashSource`).
+
+    Lines get stored along with the type tag of their structured entry, if any, and their timestamp. Lines are
+    indexed by group, experiment, node, entry type, and timestamp, so that listing experiments, reading logs for
+    single experiments or nodes, chronological reads, and reads for a subset of entry types do not need to
+    scan the logs. As with :class:`~benchmarks.logging.sources.sorting.SortingLogSource`, lines without a
+    timestamp take the timestamp of the last line with one from the same node, so that they stay next to it
+    in chronological reads.
+
+    Databases are kept in WAL mode, so that they can be read while logs get stored, and get a connection per
+    thread, so they can be queried from multiple threads at once."""
+
+    def __init__(
+        self,
+        path: Path,
+        chronological: bool = False,
+        entry_types: Optional[List[str]] = None,
+        timestamp_key: TimestampKey = entry_timestamp,
+        batch_size: int = DEFAULT_INSERT_BATCH_SIZE,
+    ) -> None:
+        """
+        :param path: Where the database lives. Gets created if it does not exist.
+        :param chronological: Whether to return logs in chronological order, rather than in the order they got
+            stored in.
+        :param entry_types: If set, only lines carrying structured entries of these types get returned.
+        :param timestamp_key: How to extract timestamps from lines when storing them.
+        :param batch_size: Number of lines to insert per transaction when storing logs.
+        """
+        self.path = path
+        self.chronological = chronological
+        self.entry_types = entry_types
+        self.timestamp_key = timestamp_key
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._initialize()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+            self._local = threading.local()
+
+    def experiments(self, group_id: str) -> Iterator[str]:
+        return self._query(
+            "SELECT experiment_id FROM experiments WHERE group_id = ? ORDER BY experiment_id",
+            (group_id,),
+            lambda row: row[0],
+        )
+
+    def logs(
+        self,
+        group_id: str,
+        experiment_id: Optional[str] = None,
+        node_id: Optional[str] = None,
+    ) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
+        """See :meth:`LogSource.logs`. Logs can also be restricted to a single node with `node_id`."""
+        filters = ["group_id = ?"]
+        parameters: List[Any] = [group_id]
+        if experiment_id is not None:
+            filters.append("experiment_id = ?")
+            parameters.append(experiment_id)
+        if node_id is not None:
+            filters.append("node_id = ?")
+            parameters.append(node_id)
+        if self.entry_types is not None:
+            filters.append(
+                f"entry_type IN ({', '.join('?' for _ in self.entry_types)})"
+            )
+            parameters.extend(self.entry_types)
+
+        order = "timestamp, id" if self.chronological else "id"
+        return self._query(
+            f"SELECT experiment_id, node_id, line FROM logs WHERE {' AND '.join(filters)} "
+            f"ORDER BY {order}",
+            parameters,
+            tuple,
+        )
+
+    def groups(self) -> Dict[str, int]:
+        """Returns the groups stored in the database, along with how many lines each holds."""
+        return dict(
+            self._connection().execute("SELECT group_id, lines FROM groups").fetchall()
+        )
+
+    def has_group(self, group_id: str) -> bool:
+        """Whether logs for a group got stored in full."""
+        return (
+            self._connection()
+            .execute("SELECT 1 FROM groups WHERE group_id = ?", (group_id,))
+            .fetchone()
+            is not None
+        )
+
+    def ingest(self, source: LogSource, group_id: str) -> int:
+        """Stores the logs for a whole group, as retrieved from another source. See :meth:`SQLiteLogSource.store`."""
+        logger.info(f"Storing logs for group {group_id} from source {source}.")
+        return self.store(group_id, source.logs(group_id))
+
+    def store(
+        self, group_id: str, logs: Iterable[Tuple[ExperimentId, NodeId, RawLine]]
+    ) -> int:
+        """Stores the logs for a whole group, replacing whatever was stored for it before. Lines get inserted in
+        batches, each in its own transaction, so the group only gets registered (see
+        :meth:`SQLiteLogSource.has_group`) once all of its lines are in; logs which fail to get stored in full
+        get dropped the next time the group gets stored.
+
+        Indexes get dropped when storing onto an empty database, and get built again at the end, as that is
+        much faster than keeping them up to date while inserting.
+
+        :return: The number of lines stored."""
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM groups WHERE group_id = ?", (group_id,))
+            connection.execute("DELETE FROM logs WHERE group_id = ?", (group_id,))
+            connection.execute(
+                "DELETE FROM experiments WHERE group_id = ?", (group_id,)
+            )
+            bulk = connection.execute("SELECT 1 FROM logs LIMIT 1").fetchone() is None
+            if bulk:
+                for name in _INDEXES:
+                    connection.execute(f"DROP INDEX IF EXISTS {name}")
+
+        lines = 0
+        experiment_ids: Set[ExperimentId] = set()
+        for batch in batched(self._rows(group_id, logs), self.batch_size):
+            with connection:
+                connection.executemany(
+                    "INSERT INTO logs (group_id, experiment_id, node_id, entry_type, timestamp, line) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    batch,
+                )
+            lines += len(batch)
+            experiment_ids.update(row[1] for row in batch)
+
+        with connection:
+            self._create_indexes(connection)
+            connection.executemany(
+                "INSERT INTO experiments (group_id, experiment_id) VALUES (?, ?)",
+                ((group_id, experiment_id) for experiment_id in experiment_ids),
+            )
+            connection.execute(
+                "INSERT INTO groups (group_id, lines) VALUES (?, ?)", (group_id, lines)
+            )
+
+        logger.info(f"Stored {lines} lines for group {group_id}.")
+        return lines
+
+    def _rows(
+        self, group_id: str, logs: Iterable[Tuple[ExperimentId, NodeId, RawLine]]
+    ) -> Iterator[_Row]:
+        last_timestamps: Dict[Tuple[ExperimentId, NodeId], int] = {}
+        for experiment_id, node_id, line in logs:
+            timestamp = self.timestamp_key(experiment_id, node_id, line)
+            if timestamp is None:
+                timestamp = last_timestamps.get((experiment_id, node_id), 0)
+            else:
+                last_timestamps[(experiment_id, node_id)] = timestamp
+            yield (
+                group_id,
+                experiment_id,
+                node_id,
+                entry_type_tag(line),
+                timestamp,
+                line,
+            )
+
+    def _query(
+        self, query: str, parameters: Iterable[Any], convert: Callable[[Tuple], Any]
+    ) -> Iterator[Any]:
+        cursor = self._connection().execute(query, tuple(parameters))
+        try:
+            while rows := cursor.fetchmany(_FETCH_SIZE):
+                for row in rows:
+                    yield convert(row)
+        finally:
+            cursor.close()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Connections are only ever used from the thread which opened them, but get closed from any.
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            # Commits only get synced onto disk at checkpoints, which may lose the last few commits on a crash,
+            # but never corrupts the database.
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _initialize(self) -> None:
+        connection = self._connection()
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, _SCHEMA_VERSION):
+            raise ValueError(
+                f"Database {self.path} has schema version {version}, expected {_SCHEMA_VERSION}."
+            )
+        # WAL mode is persistent, so this only needs doing once, but it is cheap to do again.
+        connection.execute("PRAGMA journal_mode = WAL")
+        with connection:
+            connection.executescript(_SCHEMA)
+            connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    @staticmethod
+    def _create_indexes(connection: sqlite3.Connection) -> None:
+        for name, columns in _INDEXES.items():
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}")
+        # Gathers statistics for the query planner off of a sample of each index, which is enough to pick
+        # between indexes, and much faster than going through them in full.
+        connection.execute("PRAGMA analysis_limit = 1000")
+        connection.execute("ANALYZE")
+
+    def __str__(self):
+        return f"SQLiteLogSource({self.path})"
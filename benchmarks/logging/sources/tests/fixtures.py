@@ -4,7 +4,7 @@ from pathlib import Path
 from typing import Dict, Any
 
 import pytest
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch, Elasticsearch
 
 from benchmarks.core.concurrency import await_predicate
 
@@ -14,9 +14,13 @@ def _json_data(data: str) -> Dict[str, Any]:
         return json.load(json_file)
 
 
+def _elasticsearch_url() -> str:
+    return os.environ.get("ELASTICSEARCH_URL", "http://localhost:9200")
+
+
 @pytest.fixture(scope="module")
 def benchmark_logs_client() -> Elasticsearch:
-    client = Elasticsearch(os.environ.get("ELASTICSEARCH_URL", "http://localhost:9200"))
+    client = Elasticsearch(_elasticsearch_url())
 
     # ES may take a while to boot up.
     await_predicate(client.ping, timeout=15, polling_interval=0.5)
@@ -42,3 +46,9 @@ def benchmark_logs_client() -> Elasticsearch:
     ), "Indexing failed"
 
     return client
+
+
+@pytest.fixture
+def async_benchmark_logs_client(benchmark_logs_client) -> AsyncElasticsearch:
+    # Async clients are bound to the event loop they first run on, so each test gets its own.
+    return AsyncElasticsearch(_elasticsearch_url())
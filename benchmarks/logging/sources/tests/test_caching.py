@@ -0,0 +1,149 @@
+import os
+from collections.abc import Iterator
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pytest
+
+from benchmarks.logging.compression import Compression
+from benchmarks.logging.sources.caching import CachingLogSource
+from benchmarks.logging.sources.sources import (
+    ExperimentId,
+    LogSource,
+    NodeId,
+    RawLine,
+)
+
+LOGS = [
+    ("e1", "p1", "m1"),
+    ("e2", "p1", "m2"),
+    ("e1", "p2", 'm3 with "quotes"\tand tabs'),
+    ("e2", "p2", "m4"),
+]
+
+
+class CountingLogSource(LogSource):
+    def __init__(self, logs: List[Tuple[ExperimentId, NodeId, RawLine]]) -> None:
+        self.entries = logs
+        self.queries: List[Tuple[str, Optional[str]]] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def experiments(self, group_id: str) -> Iterator[str]:
+        self.queries.append(("experiments", group_id))
+        return iter(sorted({experiment for experiment, _, _ in self.entries}))
+
+    def logs(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
+        self.queries.append((group_id, experiment_id))
+        for entry in self.entries:
+            if experiment_id is None or entry[0] == experiment_id:
+                yield entry
+
+
+def _segments(cache_dir: Path) -> List[str]:
+    return sorted(path.name for path in cache_dir.rglob("*") if path.is_file())
+
+
+@pytest.mark.parametrize("compression", [Compression.gzip, Compression.zstd])
+def test_should_serve_repeated_queries_from_the_cache(tmp_path, compression):
+    if compression == Compression.zstd:
+        pytest.importorskip("zstandard")
+
+    source = CountingLogSource(LOGS)
+    cached = CachingLogSource(source, tmp_path, compression=compression)
+
+    assert list(cached.logs("g1")) == LOGS
+    assert list(cached.logs("g1")) == LOGS
+    assert list(cached.logs("g1", "e2")) == [LOGS[1], LOGS[3]]
+    assert source.queries == [("g1", None)]
+
+    assert list(cached.experiments("g1")) == ["e1", "e2"]
+    assert list(cached.experiments("g1")) == ["e1", "e2"]
+    assert source.queries == [("g1", None), ("experiments", "g1")]
+
+    # A separate source over the same cache picks up the segments stored by the first.
+    other = CountingLogSource(LOGS)
+    shared = CachingLogSource(
+        other, tmp_path, compression=compression, namespace=str(source)
+    )
+    assert list(shared.logs("g1")) == LOGS
+    assert other.queries == []
+
+
+def test_should_cache_experiments_separately(tmp_path):
+    source = CountingLogSource(LOGS)
+    cached = CachingLogSource(source, tmp_path)
+
+    assert list(cached.logs("g1", "e1")) == [LOGS[0], LOGS[2]]
+    assert list(cached.logs("g1", "e1")) == [LOGS[0], LOGS[2]]
+    assert list(cached.logs("g1")) == LOGS
+    assert source.queries == [("g1", "e1"), ("g1", None)]
+
+
+def test_should_not_store_logs_which_were_not_read_in_full(tmp_path):
+    source = CountingLogSource(LOGS)
+    cached = CachingLogSource(source, tmp_path)
+
+    logs = cached.logs("g1")
+    next(logs)
+    logs.close()
+
+    assert _segments(tmp_path) == []
+    assert list(cached.logs("g1")) == LOGS
+    assert len(source.queries) == 2
+
+
+def test_should_keep_sources_with_different_namespaces_apart(tmp_path):
+    first = CountingLogSource(LOGS)
+    second = CountingLogSource(LOGS[:1])
+
+    assert list(CachingLogSource(first, tmp_path, namespace="a").logs("g1")) == LOGS
+    assert list(CachingLogSource(second, tmp_path, namespace="b").logs("g1")) == [
+        LOGS[0]
+    ]
+
+
+def test_should_drop_cached_logs_when_invalidating(tmp_path):
+    first = CachingLogSource(CountingLogSource(LOGS), tmp_path, namespace="a")
+    assert list(first.logs("g1")) == LOGS
+
+    source = CountingLogSource(LOGS[:2])
+    cached = CachingLogSource(source, tmp_path, namespace="a", invalidate=True)
+
+    assert list(cached.logs("g1")) == LOGS[:2]
+    # Segments stored after invalidating get used.
+    assert list(cached.logs("g1")) == LOGS[:2]
+    assert source.queries == [("g1", None)]
+
+
+def test_should_evict_least_recently_used_segments(tmp_path):
+    source = CountingLogSource(LOGS * 100)
+    cached = CachingLogSource(source, tmp_path, compression=Compression.gzip)
+
+    for group in ["g1", "g2", "g3"]:
+        list(cached.logs(group))
+    (segment_size,) = {path.stat().st_size for path in tmp_path.rglob("*.gz")}
+
+    # Makes g1 the most recently used, regardless of the resolution of modification times.
+    for age, group in enumerate(["g1", "g3", "g2"]):
+        segment = next(tmp_path.rglob(f"{group}/group.jsonl.gz"))
+        os.utime(segment, (0, 1_000_000 - age))
+
+    cached.max_size = 2 * segment_size
+    list(cached.logs("g4"))
+
+    assert sorted(path.parent.name for path in tmp_path.rglob("*.gz")) == ["g1", "g4"]
+
+
+def test_should_not_cache_segments_larger_than_the_cache(tmp_path):
+    source = CountingLogSource(LOGS)
+    cached = CachingLogSource(source, tmp_path, max_size=10)
+
+    assert list(cached.logs("g1")) == LOGS
+    assert _segments(tmp_path) == []
@@ -1,10 +1,23 @@
+import asyncio
+import inspect
+from typing import Any, Dict, List, Optional, cast
+
 import pytest
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch, Elasticsearch
 
 from benchmarks.logging.logging import LogParser, DownloadMetric
-from datetime import datetime, timezone, date
+from datetime import datetime, timezone
 
-from benchmarks.logging.sources.logstash import LogstashSource
+from benchmarks.core.concurrency import await_predicate
+from benchmarks.logging.sources.logstash import (
+    AsyncLogstashSource,
+    BatchSizer,
+    EXPERIMENT_LABEL,
+    ES_MAX_BATCH_SIZE,
+    ES_MIN_BATCH_SIZE,
+    LogstashSource,
+    daily_indexes,
+)
 
 
 def _log_lines(source, experiment_id, group_id):
@@ -14,21 +27,24 @@ def _log_lines(source, experiment_id, group_id):
     )
 
 
-def test_should_look_into_k_day_horizon():
-    source = LogstashSource(
-        Elasticsearch("http://bogus.com:9000/"),
-        today=date(2025, 1, 21),
-        horizon=5,
-    )
+def _epoch_millis(timestamp: datetime) -> int:
+    return int(timestamp.timestamp() * 1000)
+
 
-    assert source.indexes == [
-        "benchmarks-2025.01.21",
-        "benchmarks-2025.01.20",
-        "benchmarks-2025.01.19",
-        "benchmarks-2025.01.18",
-        "benchmarks-2025.01.17",
+def test_should_pick_the_daily_indexes_which_overlap_a_time_span():
+    assert daily_indexes(
+        _epoch_millis(datetime(2025, 1, 30, 23, 59, tzinfo=timezone.utc)),
+        _epoch_millis(datetime(2025, 2, 2, 0, 1, tzinfo=timezone.utc)),
+    ) == [
+        "benchmarks-2025.01.30",
+        "benchmarks-2025.01.31",
+        "benchmarks-2025.02.01",
+        "benchmarks-2025.02.02",
     ]
 
+    instant = _epoch_millis(datetime(2025, 1, 21, 12, tzinfo=timezone.utc))
+    assert daily_indexes(instant, instant) == ["benchmarks-2025.01.21"]
+
 
 @pytest.mark.deluge_integration
 def test_should_retrieve_unstructured_log_messages(benchmark_logs_client):
@@ -48,6 +64,39 @@ def test_should_retrieve_the_same_results_when_slicing(benchmark_logs_client):
     assert unsliced == sliced
 
 
+@pytest.mark.deluge_integration
+def test_should_retrieve_the_same_results_when_picking_slices_from_shards(
+    benchmark_logs_client,
+):
+    unsliced = set(LogstashSource(benchmark_logs_client, slices=1).logs(group_id="g3"))
+    auto = set(LogstashSource(benchmark_logs_client, slices=None).logs(group_id="g3"))
+
+    assert unsliced == auto
+
+
+def test_should_start_batches_at_maximum_size():
+    assert BatchSizer().size == ES_MAX_BATCH_SIZE
+
+
+def test_should_shrink_batches_for_slow_consumers():
+    sizer = BatchSizer(keep_alive=120, target_fraction=0.25)
+
+    # 10k items took 60 seconds, so at 166 items/s, 30 seconds' worth is about 5k items.
+    assert sizer.update(10_000, 60) == 5_000
+    # Very slow consumers still get a minimum batch size.
+    assert sizer.update(10, 60) == ES_MIN_BATCH_SIZE
+
+
+def test_should_grow_batches_back_for_fast_consumers():
+    sizer = BatchSizer(keep_alive=120, target_fraction=0.25)
+
+    sizer.update(10_000, 600)
+    assert sizer.size == ES_MIN_BATCH_SIZE
+    assert sizer.update(ES_MIN_BATCH_SIZE, 0.01) == ES_MAX_BATCH_SIZE
+    # Empty or instantaneous pages tell us nothing.
+    assert sizer.update(0, 0) == ES_MAX_BATCH_SIZE
+
+
 @pytest.mark.deluge_integration
 def test_filter_out_unstructured_log_messages(benchmark_logs_client):
     source = LogstashSource(
@@ -57,6 +106,35 @@ def test_filter_out_unstructured_log_messages(benchmark_logs_client):
     assert all(">>" in line for line in lines)
 
 
+@pytest.mark.deluge_integration
+def test_should_filter_entry_types_in_es(benchmark_logs_client):
+    source = LogstashSource(
+        benchmark_logs_client, structured_only=True, entry_types=["download_metric"]
+    )
+    assert len(list(_log_lines(source, None, "g3"))) == 3
+
+    source = LogstashSource(
+        benchmark_logs_client, structured_only=True, entry_types=["request_event"]
+    )
+    assert list(_log_lines(source, None, "g3")) == []
+
+
+def test_should_not_filter_on_entry_types_which_cannot_be_matched_as_terms():
+    client = Elasticsearch("http://bogus.com:9000/")
+    source = LogstashSource(
+        client, structured_only=True, entry_types=["download_metric", "request_event"]
+    )
+    assert source._structured_filters() == [
+        {"term": {"message": "entry_type"}},
+        {"terms": {"message": ["download_metric", "request_event"]}},
+    ]
+
+    source = LogstashSource(
+        client, structured_only=True, entry_types=["download_metric", "Odd-Type"]
+    )
+    assert source._structured_filters() == [{"term": {"message": "entry_type"}}]
+
+
 @pytest.mark.deluge_integration
 def test_should_retrieve_logs_for_single_experiment(benchmark_logs_client):
     source = LogstashSource(
@@ -118,3 +196,284 @@ def test_should_return_all_experiments_within_a_group(benchmark_logs_client):
         benchmark_logs_client, structured_only=True, chronological=True
     )
     assert sorted(list(source.experiments(group_id="g3"))) == ["e2", "e3"]
+
+
+@pytest.mark.deluge_integration
+def test_should_retrieve_the_same_results_with_the_async_client(
+    benchmark_logs_client, async_benchmark_logs_client
+):
+    expected = set(LogstashSource(benchmark_logs_client).logs(group_id="g3"))
+
+    with AsyncLogstashSource(async_benchmark_logs_client, slices=2) as source:
+        assert set(source.logs(group_id="g3")) == expected
+        assert sorted(source.experiments(group_id="g3")) == ["e2", "e3"]
+
+
+class _Response(dict):
+    @property
+    def body(self) -> Dict[str, Any]:
+        return self
+
+
+class FakeIndices:
+    def __init__(self, shards: int) -> None:
+        self.shards = shards
+        self.existing = {"benchmarks-2025.01.21", "benchmarks-2025.01.22"}
+        self.requests: List[List[str]] = []
+
+    async def get_settings(
+        self, index: List[str], name: str, ignore_unavailable: bool
+    ) -> _Response:
+        self.requests.append(index)
+        return _Response(
+            {
+                i: {"settings": {"index": {"number_of_shards": self.shards}}}
+                for i in index
+                if i in self.existing
+            }
+        )
+
+
+class FakeAsyncElasticsearch:
+    """Serves documents out of a list, paging and slicing them the way ES would."""
+
+    def __init__(self, documents: List[Dict[str, Any]], shards: int = 1) -> None:
+        self.documents = documents
+        self.indices = FakeIndices(shards)
+        self.requests: List[Dict[str, Any]] = []
+        self.open_pits = 0
+        self.closed = False
+        self.failing_slice: Optional[int] = None
+        self.rotate_pit_ids = False
+        """If set, hands out a new PIT ID with every page, as ES may."""
+        self.latest_pit_ids: Dict[int, str] = {}
+        """Latest PIT ID handed out, per slice."""
+        self.closed_pit_ids: List[str] = []
+        self.span = (
+            _epoch_millis(datetime(2025, 1, 20, 23, tzinfo=timezone.utc)),
+            _epoch_millis(datetime(2025, 1, 21, 1, tzinfo=timezone.utc)),
+        )
+
+    async def open_point_in_time(self, index: List[str], keep_alive: str) -> _Response:
+        self.open_pits += 1
+        return _Response({"id": "pit"})
+
+    async def close_point_in_time(self, id: str) -> None:
+        self.open_pits -= 1
+        self.closed_pit_ids.append(id)
+
+    async def search(self, body: Dict[str, Any], **_) -> _Response:
+        self.requests.append(body)
+        # Gives the consumer a chance to run, as a real request would.
+        await asyncio.sleep(0)
+
+        if "aggs" in body and "first" in body["aggs"]:
+            first, last = self.span if self.documents else (None, None)
+            return _Response(
+                {"aggregations": {"first": {"value": first}, "last": {"value": last}}}
+            )
+
+        if "aggs" in body:
+            return self._experiments(body["aggs"]["experiments"]["composite"])
+
+        slice_ = body.get("slice", {"id": 0, "max": 1})
+        if slice_["id"] == self.failing_slice:
+            raise ConnectionError("slice failed")
+
+        start = body.get("search_after", [-1])[0] + 1
+        hits = [
+            {"_source": document, "sort": [i]}
+            for i, document in enumerate(self.documents)
+            if i >= start and i % slice_["max"] == slice_["id"]
+        ][: body["size"]]
+        if not hits:
+            return _Response({})
+
+        pit_id = "pit"
+        if self.rotate_pit_ids:
+            pit_id = f"pit-{slice_['id']}-{len(self.requests)}"
+            self.latest_pit_ids[slice_["id"]] = pit_id
+        return _Response({"pit_id": pit_id, "hits": {"hits": hits}})
+
+    def _experiments(self, composite: Dict[str, Any]) -> _Response:
+        experiments = sorted(
+            {document["pod_labels"][EXPERIMENT_LABEL] for document in self.documents}
+        )
+        after = composite.get("after", {}).get("experiment")
+        page = [e for e in experiments if after is None or e > after][
+            : composite["size"]
+        ]
+        result: Dict[str, Any] = {
+            "buckets": [{"key": {"experiment": e}, "doc_count": 1} for e in page]
+        }
+        if page:
+            result["after_key"] = {"experiment": page[-1]}
+        return _Response({"aggregations": {"experiments": result}})
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def _documents(count: int, experiments: int = 1) -> List[Dict[str, Any]]:
+    return [
+        {
+            "message": f"m{i}",
+            "pod_name": f"p{i % 3}",
+            "pod_labels": {EXPERIMENT_LABEL: f"e{i % experiments}"},
+        }
+        for i in range(count)
+    ]
+
+
+def _log_requests(client: FakeAsyncElasticsearch) -> List[Dict[str, Any]]:
+    return [request for request in client.requests if "pit" in request]
+
+
+def _async_source(client: FakeAsyncElasticsearch, **kwargs) -> AsyncLogstashSource:
+    return AsyncLogstashSource(cast(AsyncElasticsearch, client), **kwargs)
+
+
+class _Blocking:
+    """Exposes the coroutine methods of a fake async client, and of its `indices`, as blocking ones."""
+
+    def __init__(self, target: Any) -> None:
+        self.target = target
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self.target, name)
+        if inspect.iscoroutinefunction(attribute):
+            return lambda *args, **kwargs: asyncio.run(attribute(*args, **kwargs))
+        return _Blocking(attribute) if name == "indices" else attribute
+
+
+@pytest.mark.parametrize("slices", [1, 3, None])
+def test_should_retrieve_all_pages_from_all_slices_with_the_async_client(slices):
+    client = FakeAsyncElasticsearch(_documents(5_000), shards=2)
+    with _async_source(client, slices=slices) as source:
+        lines = list(source.logs(group_id="g1"))
+
+    expected = [("e0", f"p{i % 3}", f"m{i}") for i in range(5_000)]
+    if slices == 1:
+        assert lines == expected
+    else:
+        assert sorted(lines) == sorted(expected)
+
+    # Starts with a 10k page, which gets smaller with the throughput of the consumer.
+    assert _log_requests(client)[0]["size"] == ES_MAX_BATCH_SIZE
+    assert client.open_pits == 0
+    assert client.closed
+
+
+def test_should_request_the_next_page_before_the_current_one_is_consumed():
+    client = FakeAsyncElasticsearch(_documents(25_000))
+    with _async_source(client) as source:
+        lines = source.logs(group_id="g1")
+        next(lines)
+        # We are still on the first page, but the request for the second one is already out.
+        assert await_predicate(
+            lambda: len(_log_requests(client)) >= 2, timeout=5, polling_interval=0.01
+        )
+        assert _log_requests(client)[1]["search_after"] == [ES_MAX_BATCH_SIZE - 1]
+        lines.close()
+
+    assert client.open_pits == 0
+
+
+def test_should_raise_errors_from_failed_slices():
+    client = FakeAsyncElasticsearch(_documents(100))
+    client.failing_slice = 1
+    with _async_source(client, slices=2) as source:
+        with pytest.raises(ExceptionGroup) as error:
+            list(source.logs(group_id="g1"))
+
+    assert isinstance(error.value.exceptions[0], ConnectionError)
+    assert client.open_pits == 0
+
+
+def test_should_page_through_experiments_with_the_async_client():
+    client = FakeAsyncElasticsearch(_documents(2_500, experiments=2_500))
+    with _async_source(client) as source:
+        assert len(set(source.experiments(group_id="g1"))) == 2_500
+
+
+def test_should_only_query_daily_indexes_within_the_time_span_of_a_group():
+    client = FakeAsyncElasticsearch(_documents(10))
+    with _async_source(client) as source:
+        assert len(list(source.logs(group_id="g1"))) == 10
+        assert len(list(source.logs(group_id="g1", experiment_id="e0"))) == 10
+
+    # Indexes get resolved once, in a single call, and only for the days the group spans.
+    assert client.indices.requests == [
+        ["benchmarks-2025.01.20", "benchmarks-2025.01.21"]
+    ]
+    span_queries = [request for request in client.requests if "aggs" in request]
+    assert len(span_queries) == 1
+
+    log_query = client.requests[-1]["query"]["bool"]["filter"]
+    assert {
+        "range": {
+            "@timestamp": {
+                "gte": client.span[0],
+                "lt": client.span[1] + 1,
+                "format": "epoch_millis",
+            }
+        }
+    } in log_query
+
+
+def test_should_not_query_logs_for_groups_without_any():
+    client = FakeAsyncElasticsearch([])
+    with _async_source(client) as source:
+        assert list(source.logs(group_id="g1")) == []
+
+    assert client.indices.requests == []
+    assert client.open_pits == 0
+
+
+@pytest.mark.parametrize("slices", [None, 3])
+def test_should_read_from_a_single_slice_when_chronological(slices):
+    client = FakeAsyncElasticsearch(_documents(5_000), shards=2)
+    with LogstashSource(
+        cast(Elasticsearch, _Blocking(client)), chronological=True, slices=slices
+    ) as sync_source:
+        sync_lines = list(sync_source.logs(group_id="g1"))
+    with _async_source(client, chronological=True, slices=slices) as async_source:
+        async_lines = list(async_source.logs(group_id="g1"))
+
+    expected = [("e0", f"p{i % 3}", f"m{i}") for i in range(5_000)]
+    assert sync_lines == expected
+    assert async_lines == expected
+    assert all("slice" not in request for request in _log_requests(client))
+
+
+@pytest.mark.parametrize("slices", [1, 3])
+def test_should_close_the_latest_pit_ids_with_the_sync_client(slices):
+    client = FakeAsyncElasticsearch(_documents(25_000))
+    client.rotate_pit_ids = True
+    with LogstashSource(
+        cast(Elasticsearch, _Blocking(client)), slices=slices
+    ) as source:
+        assert len(list(source.logs(group_id="g1"))) == 25_000
+
+    assert len(client.latest_pit_ids) == slices
+    assert sorted(client.closed_pit_ids) == sorted(client.latest_pit_ids.values())
+
+
+@pytest.mark.parametrize("slices", [1, 3])
+def test_should_close_the_latest_pit_ids_with_the_async_client(slices):
+    client = FakeAsyncElasticsearch(_documents(25_000))
+    client.rotate_pit_ids = True
+    with _async_source(client, slices=slices) as source:
+        assert len(list(source.logs(group_id="g1"))) == 25_000
+
+    assert len(client.latest_pit_ids) == slices
+    assert sorted(client.closed_pit_ids) == sorted(client.latest_pit_ids.values())
+
+
+def test_should_close_shared_pit_ids_once():
+    client = FakeAsyncElasticsearch(_documents(100))
+    with _async_source(client, slices=3) as source:
+        assert len(list(source.logs(group_id="g1"))) == 100
+
+    assert client.closed_pit_ids == ["pit"]
+    assert client.open_pits == 0
@@ -0,0 +1,138 @@
+from io import StringIO
+
+import pytest
+
+from benchmarks.logging.perf.generator import SyntheticLogConfig, vector_log_lines
+from benchmarks.logging.sources.sorting import SortingLogSource, entry_timestamp
+from benchmarks.logging.sources.sources import ChainedLogSource
+from benchmarks.logging.sources.vector_flat_file import VectorFlatFileSource
+from benchmarks.logging.timestamps import parse_epoch_ns
+from benchmarks.tests.utils import make_jsonl
+
+
+def vector_line(experiment_id: str, pod_name: str, message: str):
+    return {
+        "kubernetes": {
+            "pod_labels": {
+                "app.kubernetes.io/instance": experiment_id,
+                "app.kubernetes.io/name": "codex-benchmarks",
+                "app.kubernetes.io/part-of": "g1736425800",
+            },
+            "pod_name": pod_name,
+        },
+        "message": message,
+        "timestamp": "2025-04-22T13:37:43.001886404Z",
+    }
+
+
+def entry(timestamp: str) -> str:
+    return f'>>{{"entry_type": "metric", "timestamp": "{timestamp}"}}'
+
+
+def vector_source(*lines) -> VectorFlatFileSource:
+    return VectorFlatFileSource(
+        StringIO(make_jsonl(list(lines))), app_name="codex-benchmarks"
+    )
+
+
+def test_should_extract_timestamps_from_structured_entries():
+    assert entry_timestamp("e1", "p1", entry("2025-01-21T12:00:00Z")) == (
+        parse_epoch_ns("2025-01-21T12:00:00Z")
+    )
+    assert entry_timestamp("e1", "p1", 'x >>{"timestamp":"2025-01-21T12:00:00"}') == (
+        parse_epoch_ns("2025-01-21T12:00:00Z")
+    )
+    assert entry_timestamp("e1", "p1", "an unstructured line") is None
+    assert entry_timestamp("e1", "p1", '>>{"timestamp": "yesterday"}') is None
+
+
+def test_should_sort_lines_across_sources():
+    source = SortingLogSource(
+        ChainedLogSource(
+            [
+                vector_source(
+                    vector_line("e1", "p1", entry("2025-01-21T12:00:03Z")),
+                    vector_line("e1", "p1", "p1 unstructured"),
+                    vector_line("e1", "p2", entry("2025-01-21T12:00:01Z")),
+                ),
+                vector_source(
+                    vector_line("e1", "p3", entry("2025-01-21T12:00:02Z")),
+                    vector_line("e1", "p3", entry("2025-01-21T12:00:00Z")),
+                ),
+            ]
+        )
+    )
+
+    with source:
+        assert [node for _, node, _ in source.logs("g1736425800")] == [
+            "p3",
+            "p2",
+            "p3",
+            "p1",
+            "p1",
+        ]
+
+
+def test_should_keep_unstructured_lines_next_to_their_nodes_last_entry():
+    source = SortingLogSource(
+        vector_source(
+            vector_line("e1", "p1", "p1 before any entry"),
+            vector_line("e1", "p1", entry("2025-01-21T12:00:02Z")),
+            vector_line("e1", "p2", entry("2025-01-21T12:00:01Z")),
+            vector_line("e1", "p1", "p1 after entry"),
+            vector_line("e1", "p2", "p2 after entry"),
+            vector_line("e1", "p2", entry("2025-01-21T12:00:03Z")),
+        )
+    )
+
+    assert [line for _, _, line in source.logs("g1736425800")] == [
+        "p1 before any entry",
+        entry("2025-01-21T12:00:01Z"),
+        "p2 after entry",
+        entry("2025-01-21T12:00:02Z"),
+        "p1 after entry",
+        entry("2025-01-21T12:00:03Z"),
+    ]
+
+
+@pytest.mark.parametrize("experiment_id", [None, "e1"])
+def test_should_return_the_same_lines_when_spilling_to_disk(tmp_path, experiment_id):
+    config = SyntheticLogConfig(lines=2_000, marker_density=0.5, experiments=2)
+    dump = "".join(vector_log_lines(config))
+
+    def logs(**kwargs):
+        source = SortingLogSource(
+            VectorFlatFileSource(StringIO(dump), app_name=config.app_name), **kwargs
+        )
+        return list(source.logs(config.group_id, experiment_id))
+
+    in_memory = logs()
+    # Forces lots of small runs, and several merge passes.
+    spilled = logs(memory_budget=16 * 1024, max_fan_in=2, spill_dir=tmp_path)
+
+    assert spilled == in_memory
+    assert len(spilled) == (2_000 if experiment_id is None else 1_000)
+    assert list(tmp_path.iterdir()) == []
+
+    timestamps = [
+        timestamp
+        for timestamp in (entry_timestamp(*line) for line in spilled)
+        if timestamp is not None
+    ]
+    assert timestamps == sorted(timestamps)
+
+
+def test_should_delegate_experiment_listing():
+    source = SortingLogSource(
+        vector_source(
+            vector_line("e1", "p1", "m1"),
+            vector_line("e2", "p1", "m2"),
+        )
+    )
+
+    assert list(source.experiments("g1736425800")) == ["e1", "e2"]
+
+
+def test_should_reject_fan_in_smaller_than_two():
+    with pytest.raises(ValueError):
+        SortingLogSource(vector_source(), max_fan_in=1)
@@ -0,0 +1,65 @@
+from functools import partial
+
+import pytest
+
+from benchmarks.logging.perf.generator import (
+    SyntheticLogConfig,
+    vector_log_lines,
+    write_log,
+)
+from benchmarks.logging.sources.sources import (
+    ChainedLogSource,
+    ConcurrentChainedLogSource,
+)
+from benchmarks.logging.sources.vector_flat_file import VectorFlatFileSource
+
+
+def is_subsequence(items: list, sequence: list) -> bool:
+    remaining = iter(sequence)
+    return all(item in remaining for item in items)
+
+
+@pytest.fixture
+def vector_logs(tmp_path):
+    logs = []
+    for seed in range(3):
+        log = tmp_path / f"vector-{seed}.jsonl"
+        write_log(log, vector_log_lines(SyntheticLogConfig(lines=2_500, seed=seed)))
+        logs.append(log)
+    return logs
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_should_read_sources_concurrently(vector_logs, processes):
+    factories = [
+        partial(VectorFlatFileSource.from_path, log, "codex-benchmarks")
+        for log in vector_logs
+    ]
+
+    with ChainedLogSource([factory() for factory in factories]) as source:
+        expected = list(source.logs("g1736425800"))
+
+    with ConcurrentChainedLogSource(
+        factories, workers=2, prefetch=2, processes=processes
+    ) as source:
+        actual = list(source.logs("g1736425800"))
+
+    assert sorted(actual) == sorted(expected)
+
+    # Lines from each source still come in order.
+    for factory in factories:
+        with factory() as single:
+            assert is_subsequence(list(single.logs("g1736425800")), actual)
+
+
+def test_should_read_single_experiments_concurrently(vector_logs):
+    factories = [
+        partial(VectorFlatFileSource.from_path, log, "codex-benchmarks")
+        for log in vector_logs
+    ]
+    source = ConcurrentChainedLogSource(factories, workers=3, processes=True)
+
+    assert list(source.experiments("g1736425800")) == ["e0", "e1", "e2", "e3"] * 3
+    assert {
+        experiment_id for experiment_id, _, _ in source.logs("g1736425800", "e2")
+    } == {"e2"}
@@ -1,8 +1,26 @@
+import copy
 import datetime
+import threading
+from functools import partial
 from io import StringIO
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import pytest
+
+from benchmarks.core.concurrency import await_predicate
+
+from benchmarks.logging.compression import Compression, open_file
 from benchmarks.logging.logging import LogEntry, LogParser
-from benchmarks.logging.sources.sources import split_logs_in_source
+from benchmarks.logging.sources.sources import (
+    ConcurrentChainedLogSource,
+    ExperimentId,
+    FSOutputManager,
+    LogSource,
+    NodeId,
+    RawLine,
+    split_logs_in_source,
+)
 from benchmarks.logging.sources.vector_flat_file import VectorFlatFileSource
 from benchmarks.logging.tests.utils import InMemoryOutputManager
 from benchmarks.tests.utils import make_jsonl, compact
@@ -111,3 +129,297 @@ def test_should_produce_logs_for_multiple_experiments():
         download,2021-01-01 00:00:00+00:00,0.246,node3
     """)
     )
+
+
+def test_should_produce_the_same_logs_when_splitting_experiments_separately(tmp_path):
+    parser = LogParser()
+    parser.register(MetricsEvent)
+    parser.register(Person)
+
+    log = tmp_path / "vector.jsonl"
+    log.write_text(make_jsonl(EXPERIMENT_LOG))
+    # Creates a fresh source for each query, so experiments can be queried concurrently.
+    source = ConcurrentChainedLogSource(
+        [partial(VectorFlatFileSource.from_path, log, "codex-benchmarks")]
+    )
+
+    def split(experiment_workers: int) -> InMemoryOutputManager:
+        outputs = InMemoryOutputManager()
+        split_logs_in_source(
+            log_source=source,
+            log_parser=parser,
+            output_manager=outputs,
+            group_id="g1736425800",
+            experiment_workers=experiment_workers,
+        )
+        return outputs
+
+    expected = split(experiment_workers=0).fs
+    actual = split(experiment_workers=2).fs
+
+    assert set(actual.keys()) == {"e1", "e2"}
+    for experiment_id, files in expected.items():
+        assert {name: f.getvalue() for name, f in actual[experiment_id].items()} == {
+            name: f.getvalue() for name, f in files.items()
+        }
+
+
+def _interleaved_experiments(experiments: int) -> list:
+    """Replicates the experiment log across `experiments` experiments, with their lines interleaved, so that
+    splitting it keeps writing to all outputs until the end."""
+    lines = []
+    for line in EXPERIMENT_LOG:
+        for experiment in range(experiments):
+            replica: dict = copy.deepcopy(line)
+            replica["kubernetes"]["pod_labels"]["app.kubernetes.io/instance"] = (
+                f"e{experiment}"
+            )
+            lines.append(replica)
+    return lines
+
+
+def _read_outputs(root: Path) -> Dict[str, str]:
+    outputs = {}
+    for path in root.rglob("*"):
+        if path.is_file():
+            with open_file(path) as istream:
+                outputs[str(path.relative_to(root))] = istream.read()
+    return outputs
+
+
+@pytest.mark.parametrize("compression", [None, Compression.gzip])
+def test_should_produce_the_same_logs_with_a_bounded_number_of_open_files(
+    tmp_path, compression: Optional[Compression]
+):
+    parser = LogParser()
+    parser.register(MetricsEvent)
+    parser.register(Person)
+    log = make_jsonl(_interleaved_experiments(10))
+
+    def split(output_dir: Path, max_open_files: int) -> FSOutputManager:
+        with FSOutputManager(
+            output_dir, compression=compression, max_open_files=max_open_files
+        ) as outputs:
+            split_logs_in_source(
+                log_source=VectorFlatFileSource(
+                    app_name="codex-benchmarks", file=StringIO(log)
+                ),
+                log_parser=parser,
+                output_manager=outputs,
+                group_id="g1736425800",
+            )
+            assert len(outputs.open_files) <= max_open_files
+        return outputs
+
+    split(tmp_path / "unbounded", max_open_files=100)
+    bounded = split(tmp_path / "bounded", max_open_files=2)
+
+    # Far more outputs than open files, so files had to be closed and reopened over and over.
+    assert len(bounded.files) == 20
+    assert bounded.open_files == {}
+
+    expected = _read_outputs(tmp_path / "unbounded")
+    actual = _read_outputs(tmp_path / "bounded")
+
+    assert actual == expected
+    assert compact(
+        actual[f"e3/metrics_event.csv{compression.suffix if compression else ''}"]
+    ) == (
+        compact("""
+        name,timestamp,value,node
+        download,2021-01-01 00:00:00+00:00,0.246,node2
+        download,2021-01-01 00:00:00+00:00,0.246,node3
+        """)
+    )
+
+
+def test_should_not_write_to_output_files_once_closed(tmp_path):
+    with FSOutputManager(tmp_path, max_open_files=1) as outputs:
+        first = outputs.open(Path("e1/first.csv"))
+        second = outputs.open(Path("e1/second.csv"))
+        first.write("a\n")
+        second.write("b\n")
+        first.write("c\n")
+        first.close()
+
+        with pytest.raises(ValueError):
+            first.write("d\n")
+
+    assert (tmp_path / "e1/first.csv").read_text() == "a\nc\n"
+    assert (tmp_path / "e1/second.csv").read_text() == "b\n"
+
+
+def test_should_require_at_least_one_open_file(tmp_path):
+    with pytest.raises(ValueError):
+        FSOutputManager(tmp_path, max_open_files=0)
+
+
+def test_should_produce_the_same_logs_when_splitting_in_separate_processes(tmp_path):
+    parser = LogParser()
+    parser.register(MetricsEvent)
+    parser.register(Person)
+    log = make_jsonl(_interleaved_experiments(10))
+
+    def split(output_dir: Path, split_processes: int) -> Dict[str, str]:
+        with FSOutputManager(output_dir, compression=Compression.gzip) as outputs:
+            split_logs_in_source(
+                log_source=VectorFlatFileSource(
+                    app_name="codex-benchmarks", file=StringIO(log)
+                ),
+                log_parser=parser,
+                output_manager=outputs,
+                group_id="g1736425800",
+                split_processes=split_processes,
+            )
+        return _read_outputs(output_dir)
+
+    expected = split(tmp_path / "single", split_processes=0)
+    actual = split(tmp_path / "sharded", split_processes=3)
+
+    assert len(actual) == 20
+    assert actual == expected
+
+
+def test_should_not_split_experiments_concurrently_in_separate_processes(tmp_path):
+    with pytest.raises(ValueError):
+        split_logs_in_source(
+            log_source=VectorFlatFileSource(
+                app_name="codex-benchmarks", file=StringIO(make_jsonl(EXPERIMENT_LOG))
+            ),
+            log_parser=LogParser(),
+            output_manager=FSOutputManager(tmp_path),
+            group_id="g1736425800",
+            experiment_workers=2,
+            split_processes=2,
+        )
+
+
+class PausingLogSource(LogSource):
+    """Returns the messages in the experiment log, but waits to be resumed before returning the last one."""
+
+    def __init__(self) -> None:
+        self.resume = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def experiments(self, group_id: str) -> Iterator[str]:
+        return iter(["e1", "e2"])
+
+    def logs(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
+        entries: List[dict] = EXPERIMENT_LOG
+        for i, entry in enumerate(entries):
+            if i == len(entries) - 1:
+                self.resume.wait()
+            yield (
+                entry["kubernetes"]["pod_labels"]["app.kubernetes.io/instance"],
+                entry["kubernetes"]["pod_name"],
+                entry["message"],
+            )
+
+
+def test_should_flush_outputs_periodically_while_waiting_on_the_source(tmp_path):
+    parser = LogParser()
+    parser.register(MetricsEvent)
+    parser.register(Person)
+    source = PausingLogSource()
+
+    def split() -> None:
+        with FSOutputManager(tmp_path) as outputs:
+            split_logs_in_source(
+                log_source=source,
+                log_parser=parser,
+                output_manager=outputs,
+                group_id="g1736425800",
+                flush_interval=0.05,
+            )
+
+    splitter = threading.Thread(target=split)
+    splitter.start()
+    try:
+        person = tmp_path / "e1" / "person.csv"
+        assert await_predicate(
+            lambda: person.exists() and "John,Doe" in person.read_text(), timeout=5
+        )
+        assert not (tmp_path / "e2").exists()
+    finally:
+        source.resume.set()
+        splitter.join()
+
+    assert "node3" in (tmp_path / "e2" / "metrics_event.csv").read_text()
+
+
+class CountingLogSource(LogSource):
+    """Returns a metrics event for each of `experiments` experiments, `rounds` times over, and records how many
+    lines it had returned, and how many rows had been written onto the outputs, every `every` lines."""
+
+    def __init__(
+        self,
+        outputs: InMemoryOutputManager,
+        experiments: int,
+        rounds: int,
+        every: int,
+    ) -> None:
+        self.outputs = outputs
+        self.experiment_count = experiments
+        self.rounds = rounds
+        self.every = every
+        self.samples: List[Tuple[int, int]] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def experiments(self, group_id: str) -> Iterator[str]:
+        return iter(f"e{i}" for i in range(self.experiment_count))
+
+    def logs(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
+        message = str(EXPERIMENT_LOG[0]["message"])
+        for i in range(self.experiment_count * self.rounds):
+            if i % self.every == 0:
+                self.samples.append((i, self._written()))
+            yield f"e{i % self.experiment_count}", "p1", message
+
+    def _written(self) -> int:
+        # Discounts the headers.
+        return sum(
+            output.getvalue().count("\n") - 1
+            for files in self.outputs.fs.values()
+            for output in files.values()
+        )
+
+
+def test_should_bound_rows_buffered_across_many_experiments(monkeypatch):
+    monkeypatch.setattr("benchmarks.logging.sources.sources.MAX_BUFFERED_LINES", 1_000)
+    parser = LogParser()
+    parser.register(MetricsEvent)
+    outputs = InMemoryOutputManager()
+    source = CountingLogSource(outputs, experiments=500, rounds=10, every=250)
+
+    split_logs_in_source(
+        log_source=source,
+        log_parser=parser,
+        output_manager=outputs,
+        group_id="g1736425800",
+    )
+
+    # Writers buffer up to 8k rows each, so without a cap nothing would get written out until the very end.
+    assert len(outputs.fs) == 500
+    assert all(lines - written <= 1_000 for lines, written in source.samples)
+    assert (
+        sum(
+            output.getvalue().count("\n") - 1
+            for files in outputs.fs.values()
+            for output in files.values()
+        )
+        == 5_000
+    )
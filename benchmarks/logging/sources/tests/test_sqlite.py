@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from typing import Iterator, Tuple
+
+import pytest
+
+from benchmarks.logging.perf.generator import SyntheticLogConfig, vector_log_lines
+from benchmarks.logging.sources.sqlite import SQLiteLogSource
+from benchmarks.logging.sources.vector_flat_file import VectorFlatFileSource
+
+
+def entry(entry_type: str, timestamp: str) -> str:
+    return f'INFO >>{{"timestamp":"{timestamp}","entry_type":"{entry_type}"}}'
+
+
+LOGS = [
+    ("e1", "p1", entry("metric", "2025-01-21T12:00:03Z")),
+    ("e1", "p1", "p1 unstructured"),
+    ("e2", "p2", entry("event", "2025-01-21T12:00:00Z")),
+    ("e1", "p2", entry("event", "2025-01-21T12:00:01Z")),
+    ("e1", "p1", entry("metric", "2025-01-21T12:00:02Z")),
+]
+
+
+@pytest.fixture
+def store(tmp_path) -> Iterator[SQLiteLogSource]:
+    with SQLiteLogSource(tmp_path / "logs.db", batch_size=2) as source:
+        source.store("g1", LOGS)
+        yield source
+
+
+def test_should_read_stored_logs_in_the_order_they_were_stored(store):
+    assert list(store.experiments("g1")) == ["e1", "e2"]
+    assert list(store.logs("g1")) == LOGS
+    assert list(store.logs("g1", "e1")) == [LOGS[0], LOGS[1], LOGS[3], LOGS[4]]
+    assert list(store.logs("g1", "e1", node_id="p1")) == [LOGS[0], LOGS[1], LOGS[4]]
+    assert list(store.logs("g2")) == []
+    assert list(store.experiments("g2")) == []
+
+
+def test_should_read_stored_logs_in_chronological_order(store):
+    store.chronological = True
+
+    # Lines without a timestamp stay next to the last line with one from the same node.
+    assert list(store.logs("g1")) == [LOGS[2], LOGS[3], LOGS[4], LOGS[0], LOGS[1]]
+    assert list(store.logs("g1", "e1")) == [LOGS[3], LOGS[4], LOGS[0], LOGS[1]]
+
+
+def test_should_filter_stored_logs_by_entry_type(store):
+    store.entry_types = ["event"]
+    assert list(store.logs("g1")) == [LOGS[2], LOGS[3]]
+
+    store.entry_types = ["metric", "event"]
+    store.chronological = True
+    assert list(store.logs("g1", "e1")) == [LOGS[3], LOGS[4], LOGS[0]]
+
+
+def test_should_replace_stored_groups(store):
+    store.store("g2", LOGS[:1])
+    assert store.groups() == {"g1": 5, "g2": 1}
+
+    assert store.store("g1", LOGS[2:3]) == 1
+    assert list(store.logs("g1")) == [LOGS[2]]
+    assert list(store.experiments("g1")) == ["e2"]
+    assert list(store.logs("g2")) == LOGS[:1]
+
+
+def test_should_not_register_groups_which_were_not_stored_in_full(store):
+    def failing_logs() -> Iterator[Tuple[str, str, str]]:
+        yield from LOGS
+        raise ValueError("Source went away")
+
+    with pytest.raises(ValueError):
+        store.store("g2", failing_logs())
+
+    assert store.has_group("g1")
+    assert not store.has_group("g2")
+
+
+def test_should_persist_stored_logs(tmp_path):
+    with SQLiteLogSource(tmp_path / "logs.db") as source:
+        source.store("g1", LOGS)
+
+    with SQLiteLogSource(tmp_path / "logs.db") as source:
+        assert source.has_group("g1")
+        assert list(source.logs("g1")) == LOGS
+
+
+def test_should_answer_queries_from_indexes(store):
+    # Indexes only pay off with more than one group (or entry type, etc.) to pick from.
+    for group in range(2, 20):
+        store.store(f"g{group}", LOGS)
+    connection = store._connection()
+    for query in [
+        "SELECT experiment_id FROM experiments WHERE group_id = 'g1'",
+        "SELECT line FROM logs WHERE group_id = 'g1' ORDER BY id",
+        "SELECT line FROM logs WHERE group_id = 'g1' ORDER BY timestamp, id",
+        "SELECT line FROM logs WHERE group_id = 'g1' AND experiment_id = 'e1' ORDER BY id",
+        "SELECT line FROM logs WHERE group_id = 'g1' AND experiment_id = 'e1' "
+        "ORDER BY timestamp, id",
+        "SELECT line FROM logs WHERE group_id = 'g1' AND node_id = 'p1' ORDER BY timestamp, id",
+        "SELECT line FROM logs WHERE group_id = 'g1' AND entry_type IN ('event')",
+    ]:
+        plan = " ".join(
+            str(row[-1])
+            for row in connection.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+        )
+        assert "USING" in plan and "TEMP B-TREE" not in plan, (query, plan)
+
+
+def test_should_ingest_logs_from_other_sources(tmp_path):
+    log = make_vector_log()
+    source = VectorFlatFileSource(StringIO(log), app_name="codex-benchmarks")
+    expected = list(source.logs("g1736425800"))
+
+    with SQLiteLogSource(tmp_path / "logs.db") as store:
+        assert store.ingest(source, "g1736425800") == len(expected)
+        assert list(store.logs("g1736425800")) == expected
+        assert list(store.experiments("g1736425800")) == sorted(
+            {experiment_id for experiment_id, _, _ in expected}
+        )
+
+        # Connections are per thread, so stores can be queried from several at once.
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(
+                executor.map(
+                    lambda experiment_id: list(
+                        store.logs("g1736425800", experiment_id)
+                    ),
+                    store.experiments("g1736425800"),
+                )
+            )
+        assert sorted(line for lines in results for line in lines) == sorted(expected)
+
+
+def make_vector_log() -> str:
+    return "".join(vector_log_lines(SyntheticLogConfig(lines=2_000, experiments=4)))
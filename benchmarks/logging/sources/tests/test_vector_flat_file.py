@@ -1,10 +1,22 @@
-import json
+import threading
+import time
 from io import StringIO
-from typing import Tuple
 
-from benchmarks.logging.sources.vector_flat_file import VectorFlatFileSource, PodLog
+import pytest
+
+from benchmarks.logging.compression import open_file
+from benchmarks.logging.perf.generator import (
+    SyntheticLogConfig,
+    synthetic_lines,
+    vector_log_lines,
+    write_log,
+)
+from benchmarks.logging.sources.vector_flat_file import (
+    VectorFlatFileSource,
+    VectorTailSource,
+)
+from benchmarks.logging.sources.vector_index import sidecar_path
 from benchmarks.tests.utils import make_jsonl
-from datetime import datetime
 
 EXPERIMENT_LOG = [
     {
@@ -96,27 +108,6 @@ def test_should_return_all_existing_experiments_in_group():
     assert list(extractor.experiments("g1736425800")) == ["e1", "e2"]
 
 
-def test_should_read_pod_logs_in_order():
-    log_file = StringIO(make_jsonl(EXPERIMENT_LOG))
-    log1 = PodLog("p1", log_file)
-    log2 = PodLog("p2", log_file)
-
-    def check(
-        value: Tuple[str, datetime], expected_message: str, expected_timestamp: str
-    ):
-        assert json.loads(value[0])["message"] == expected_message
-        assert value[1] == datetime.fromisoformat(expected_timestamp)
-
-    assert log1.has_next()
-    check(next(log1), "m1", "2025-04-22T13:37:43.001886404Z")
-    check(next(log1), "m3", "2025-04-22T13:38:43.001886404Z")
-    assert not log1.has_next()
-
-    assert log2.has_next()
-    check(next(log2), "m2", "2025-04-22T12:37:43.001886404Z")
-    assert not log2.has_next()
-
-
 def test_should_merge_pod_logs_by_timestamp_when_requested():
     source = VectorFlatFileSource(
         StringIO(make_jsonl(EXPERIMENT_LOG)),
@@ -129,3 +120,160 @@ def test_should_merge_pod_logs_by_timestamp_when_requested():
         ("e1", "p1", "m1"),
         ("e2", "p1", "m3"),
     ]
+
+
+def test_should_merge_pod_logs_by_timestamp_when_reading_from_disk(tmp_path):
+    log = tmp_path / "vector.jsonl"
+    log.write_text(make_jsonl(EXPERIMENT_LOG))
+
+    with VectorFlatFileSource(
+        open_file(log), app_name="codex-benchmarks", sorted=True
+    ) as source:
+        assert list(source.logs("g1736425800")) == [
+            ("e1", "p2", "m2"),
+            ("e1", "p1", "m1"),
+            ("e2", "p1", "m3"),
+        ]
+        assert list(source.logs("g1736425800", "e2")) == [("e2", "p1", "m3")]
+
+
+@pytest.mark.parametrize("experiment_id", [None, "e1"])
+def test_should_sort_logs_for_many_pods(tmp_path, experiment_id):
+    config = SyntheticLogConfig(lines=5_000, pods=50, experiments=2)
+    log = tmp_path / "vector.jsonl"
+    write_log(log, vector_log_lines(config))
+
+    expected = [
+        (line.experiment_id, line.pod_name, line.message)
+        for line in sorted(synthetic_lines(config), key=lambda line: line.timestamp)
+        if experiment_id is None or line.experiment_id == experiment_id
+    ]
+
+    with VectorFlatFileSource(
+        open_file(log), app_name=config.app_name, sorted=True
+    ) as source:
+        assert list(source.logs(config.group_id, experiment_id)) == expected
+
+
+@pytest.mark.parametrize("sorted", [False, True])
+def test_should_return_the_same_logs_when_indexed(tmp_path, sorted):
+    config = SyntheticLogConfig(lines=5_000, pods=4, experiments=3)
+    log = tmp_path / "vector.jsonl"
+    write_log(log, vector_log_lines(config))
+
+    def query(index: bool):
+        with VectorFlatFileSource(
+            open_file(log),
+            app_name=config.app_name,
+            sorted=sorted,
+            index_file=sidecar_path(log) if index else None,
+        ) as source:
+            return (
+                list(source.experiments(config.group_id)),
+                list(source.logs(config.group_id)),
+                list(source.logs(config.group_id, "e1")),
+                list(source.logs(config.group_id, "e5")),
+            )
+
+    expected = query(index=False)
+    assert expected[0] == ["e0", "e1", "e2"]
+    assert not sidecar_path(log).exists()
+
+    assert query(index=True) == expected
+    assert sidecar_path(log).exists()
+    # Reuses the index stored by the first query.
+    assert query(index=True) == expected
+
+
+def test_should_not_index_in_memory_files(tmp_path):
+    index_file = tmp_path / "vector.jsonl.index.json"
+    source = VectorFlatFileSource(
+        StringIO(make_jsonl(EXPERIMENT_LOG)),
+        app_name="codex-benchmarks",
+        index_file=index_file,
+    )
+
+    assert list(source.experiments("g1736425800")) == ["e1", "e2"]
+    assert not index_file.exists()
+
+
+def test_should_read_compressed_files(tmp_path):
+    log = tmp_path / "vector.jsonl.gz"
+    with open_file(log, "w") as ostream:
+        ostream.write(make_jsonl(EXPERIMENT_LOG))
+
+    with VectorFlatFileSource(open_file(log), app_name="codex-benchmarks") as source:
+        assert list(source.experiments("g1736425800")) == ["e1", "e2"]
+        assert list(source.logs(group_id="g1736425800")) == [
+            ("e1", "p1", "m1"),
+            ("e1", "p2", "m2"),
+            ("e2", "p1", "m3"),
+        ]
+
+
+def _append(path, line: str) -> None:
+    with path.open("a") as ostream:
+        ostream.write(line)
+
+
+def _later(*actions) -> threading.Thread:
+    """Runs actions in the background, a little apart, so that followers get to see what each one does."""
+
+    def _run():
+        for action in actions:
+            time.sleep(0.1)
+            action()
+
+    thread = threading.Thread(target=_run)
+    thread.start()
+    return thread
+
+
+def test_should_follow_dumps_as_they_grow(tmp_path):
+    dump = tmp_path / "vector.jsonl"
+    lines = [make_jsonl([entry]) + "\n" for entry in EXPERIMENT_LOG]
+    stop = threading.Event()
+    source = VectorTailSource(
+        dump, app_name="codex-benchmarks", poll_interval=0.01, stop=stop
+    )
+    logs = source.logs("g1736425800")
+
+    # Dumps need not exist yet.
+    _later(lambda: _append(dump, lines[0]))
+    assert next(logs) == ("e1", "p1", "m1")
+
+    # Lines only come out once complete.
+    writer = _later(
+        lambda: _append(dump, lines[1][:20]), lambda: _append(dump, lines[1][20:])
+    )
+    assert next(logs) == ("e1", "p2", "m2")
+    writer.join()
+
+    # Moved away and recreated, with the writer still adding a line to the old dump.
+    dump.rename(tmp_path / "vector.jsonl.1")
+    _append(tmp_path / "vector.jsonl.1", lines[2])
+    _append(dump, lines[0])
+    assert next(logs) == ("e2", "p1", "m3")
+    assert next(logs) == ("e1", "p1", "m1")
+
+    # Truncated in place.
+    _later(lambda: dump.write_text(""), lambda: _append(dump, lines[1]))
+    assert next(logs) == ("e1", "p2", "m2")
+
+    stop.set()
+    assert list(logs) == []
+
+
+def test_should_stop_following_dumps_once_idle(tmp_path):
+    dump = tmp_path / "vector.jsonl"
+    dump.write_text(make_jsonl(EXPERIMENT_LOG) + "\n")
+
+    source = VectorTailSource(
+        dump, app_name="codex-benchmarks", poll_interval=0.01, idle_timeout=0.2
+    )
+
+    assert list(source.logs("g1736425800", "e1")) == [
+        ("e1", "p1", "m1"),
+        ("e1", "p2", "m2"),
+    ]
+    assert list(source.experiments("g1736425800")) == ["e1", "e2"]
@@ -0,0 +1,226 @@
+import json
+import os
+from io import StringIO
+from typing import List
+
+from benchmarks.logging.sources.tests.test_vector_flat_file import EXPERIMENT_LOG
+from benchmarks.logging.sources.vector_index import (
+    INDEX_RANGE_GAP,
+    MappedLineReader,
+    StreamLineReader,
+    VectorFileIndex,
+    VectorIndex,
+    line_reader,
+    load_or_build_index,
+    sidecar_path,
+)
+from benchmarks.logging.timestamps import parse_epoch_ns
+from benchmarks.tests.utils import make_jsonl
+
+
+def test_should_index_lines_by_group_experiment_and_pod():
+    log = StringIO(make_jsonl(EXPERIMENT_LOG))
+    with line_reader(log) as reader:
+        index = VectorIndex.build(reader.lines(), "codex-benchmarks")
+
+        assert set(index.pods.keys()) == {
+            ("g1736425800", "e1", "p1"),
+            ("g1736425800", "e1", "p2"),
+            ("g1736425800", "e2", "p1"),
+        }
+
+        pod = index.pods[("g1736425800", "e1", "p1")]
+        assert len(pod) == 1
+        assert list(pod.timestamps) == [
+            parse_epoch_ns("2025-04-22T13:37:43.001886404Z")
+        ]
+        assert '"message":"m1"' in reader.line_at(pod.offsets[0])
+
+
+def test_should_skip_lines_for_other_apps():
+    log = StringIO(make_jsonl(EXPERIMENT_LOG))
+    with line_reader(log) as reader:
+        assert VectorIndex.build(reader.lines(), "other-app").pods == {}
+
+
+def test_should_merge_pod_lines_chronologically():
+    log = StringIO(make_jsonl(EXPERIMENT_LOG))
+    with line_reader(log) as reader:
+        index = VectorIndex.build(reader.lines(), "codex-benchmarks")
+
+        assert [
+            reader.line_at(offset) for offset in index.chronological("g1736425800")
+        ] == [reader.line_at(offset) for offset in _offsets(log, [1, 0, 2])]
+
+        assert list(index.chronological("g1736425800", "e2")) == list(
+            _offsets(log, [2])
+        )
+        assert list(index.chronological("g1736425800", "e3")) == []
+
+
+def test_should_memory_map_files_on_disk(tmp_path):
+    log = tmp_path / "vector.jsonl"
+    log.write_text(make_jsonl(EXPERIMENT_LOG))
+
+    with log.open() as istream, line_reader(istream) as reader:
+        assert isinstance(reader, MappedLineReader)
+        lines = list(reader.lines())
+        assert len(lines) == 3
+        # Last line has no trailing newline.
+        assert reader.line_at(lines[2][0]) == lines[2][1].decode("utf-8")
+        assert reader.line_at(lines[1][0]) == lines[1][1].decode("utf-8")
+
+
+def test_should_read_empty_files(tmp_path):
+    log = tmp_path / "vector.jsonl"
+    log.touch()
+
+    with log.open() as istream, line_reader(istream) as reader:
+        assert list(reader.lines()) == []
+
+
+def test_should_fall_back_to_seeking_for_in_memory_streams():
+    with line_reader(StringIO(make_jsonl(EXPERIMENT_LOG))) as reader:
+        assert isinstance(reader, StreamLineReader)
+
+
+def test_should_index_byte_ranges_and_timestamp_bounds_for_pods():
+    log = StringIO(make_jsonl(EXPERIMENT_LOG))
+    with line_reader(log) as reader:
+        lines = list(reader.lines())
+        index = VectorFileIndex.build(
+            lines, "codex-benchmarks", size=len(log.getvalue()), mtime_ns=0
+        )
+
+    pods = {(pod.experiment_id, pod.pod_name): pod for pod in index.pods}
+    assert set(pods.keys()) == {("e1", "p1"), ("e1", "p2"), ("e2", "p1")}
+
+    p2 = pods[("e1", "p2")]
+    assert p2.ranges == [(lines[1][0], lines[2][0])]
+    assert p2.first_timestamp == p2.last_timestamp
+    assert p2.first_timestamp == parse_epoch_ns("2025-04-22T12:37:43.001886404Z")
+    assert p2.lines == 1
+
+    assert index.experiments("g1736425800") == ["e1", "e2"]
+    assert index.experiments("g1") == []
+    assert index.ranges("g1736425800", "e1") == [(0, lines[2][0])]
+    assert index.ranges("g1736425800", "e2") == [(lines[2][0], len(log.getvalue()))]
+
+
+def test_should_only_parse_timestamp_bounds_when_indexing_byte_ranges(monkeypatch):
+    parsed: List[str] = []
+
+    def parse(timestamp: str) -> int:
+        parsed.append(timestamp)
+        return parse_epoch_ns(timestamp)
+
+    monkeypatch.setattr("benchmarks.logging.sources.vector_index.parse_epoch_ns", parse)
+    log = StringIO(make_jsonl(EXPERIMENT_LOG * 10))
+    with line_reader(log) as reader:
+        index = VectorFileIndex.build(
+            reader.lines(), "codex-benchmarks", size=len(log.getvalue()), mtime_ns=0
+        )
+
+    # A first and a last timestamp for each of the three pods.
+    assert len(parsed) == 6
+    assert all(pod.lines == 10 for pod in index.pods)
+
+
+def test_should_index_lines_without_timestamps():
+    untimed = [
+        {k: v for k, v in line.items() if k != "timestamp"} for line in EXPERIMENT_LOG
+    ]
+    log = StringIO(make_jsonl(untimed + EXPERIMENT_LOG[:1]))
+    with line_reader(log) as reader:
+        index = VectorFileIndex.build(
+            reader.lines(), "codex-benchmarks", size=len(log.getvalue()), mtime_ns=0
+        )
+
+    pods = {(pod.experiment_id, pod.pod_name): pod for pod in index.pods}
+    assert pods[("e1", "p1")].lines == 2
+    assert pods[("e1", "p1")].first_timestamp == parse_epoch_ns(
+        "2025-04-22T13:37:43.001886404Z"
+    )
+    assert pods[("e2", "p1")].lines == 1
+    assert pods[("e2", "p1")].first_timestamp is None
+    assert index.experiments("g1736425800") == ["e1", "e2"]
+
+
+def test_should_split_ranges_for_lines_far_apart():
+    filler = {
+        "kubernetes": {"pod_labels": {"app.kubernetes.io/name": "other-app"}},
+        "message": "x" * INDEX_RANGE_GAP,
+    }
+    log = StringIO(make_jsonl([EXPERIMENT_LOG[0], filler, EXPERIMENT_LOG[0]]))
+    with line_reader(log) as reader:
+        lines = list(reader.lines())
+        index = VectorFileIndex.build(lines, "codex-benchmarks", size=0, mtime_ns=0)
+
+    (pod,) = index.pods
+    assert pod.lines == 2
+    assert pod.ranges == [(0, lines[1][0]), (lines[2][0], len(log.getvalue()))]
+    assert index.ranges("g1736425800") == pod.ranges
+
+
+def test_should_store_and_reuse_sidecar_index(tmp_path):
+    log = tmp_path / "vector.jsonl"
+    log.write_text(make_jsonl(EXPERIMENT_LOG))
+    index_file = sidecar_path(log)
+    assert index_file == tmp_path / "vector.jsonl.index.json"
+
+    with log.open() as istream, line_reader(istream) as reader:
+        assert isinstance(reader, MappedLineReader)
+        index = load_or_build_index(reader, index_file, "codex-benchmarks")
+
+    assert VectorFileIndex.model_validate_json(index_file.read_bytes()) == index
+
+    # Tampers with the stored index to check that it gets reused rather than rebuilt.
+    stored = json.loads(index_file.read_text())
+    stored["pods"] = []
+    index_file.write_text(json.dumps(stored))
+
+    with log.open() as istream, line_reader(istream) as reader:
+        assert isinstance(reader, MappedLineReader)
+        assert load_or_build_index(reader, index_file, "codex-benchmarks").pods == []
+
+
+def test_should_rebuild_stale_or_malformed_sidecar_index(tmp_path):
+    log = tmp_path / "vector.jsonl"
+    log.write_text(make_jsonl(EXPERIMENT_LOG[:1]))
+    index_file = sidecar_path(log)
+
+    with log.open() as istream, line_reader(istream) as reader:
+        assert isinstance(reader, MappedLineReader)
+        assert (
+            len(load_or_build_index(reader, index_file, "codex-benchmarks").pods) == 1
+        )
+
+    log.write_text(make_jsonl(EXPERIMENT_LOG))
+    # Makes sure the modification time changes even on filesystems with coarse timestamps.
+    stat = log.stat()
+    os.utime(log, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    with log.open() as istream, line_reader(istream) as reader:
+        assert isinstance(reader, MappedLineReader)
+        assert (
+            len(load_or_build_index(reader, index_file, "codex-benchmarks").pods) == 3
+        )
+
+    index_file.write_text("{")
+    with log.open() as istream, line_reader(istream) as reader:
+        assert isinstance(reader, MappedLineReader)
+        assert (
+            len(load_or_build_index(reader, index_file, "codex-benchmarks").pods) == 3
+        )
+
+    # Indexes are per app.
+    with log.open() as istream, line_reader(istream) as reader:
+        assert isinstance(reader, MappedLineReader)
+        assert load_or_build_index(reader, index_file, "other-app").pods == []
+
+
+def _offsets(log: StringIO, lines: list[int]):
+    starts = [0]
+    for line in log.getvalue().splitlines(keepends=True):
+        starts.append(starts[-1] + len(line))
+    return (starts[line] for line in lines)
@@ -1,92 +1,86 @@
 import json
+import os
+import threading
+import time
 from collections.abc import Iterator
-from datetime import datetime
-from functools import total_ordering
-from heapq import heapify, heappush, heappop
+from itertools import chain
 from json import JSONDecodeError
-from typing import TextIO, Optional, Tuple, List, Callable
+from pathlib import Path
+from typing import IO, Optional, Tuple, Callable, Iterable
 import logging
-import re
 
+from benchmarks.logging.compression import Compression, open_file
 from benchmarks.logging.sources.sources import LogSource, ExperimentId, NodeId, RawLine
+from benchmarks.logging.sources.vector_index import (
+    LineReader,
+    MappedLineReader,
+    VectorFileIndex,
+    VectorIndex,
+    line_reader,
+    load_or_build_index,
+    sidecar_path,
+)
 
 logger = logging.getLogger(__name__)
 
-_POD_NAME_REGEX = re.compile(r'"pod_name":"(?P<pod_name>[^"]+)"')
-_TIMESTAMP_REGEX = re.compile(r'"timestamp":"(?P<timestamp>[^"]+)"')
-
-
-@total_ordering
-class PodLog(object):
-    """:class:`PodLog` allows us to iterate separately over the logs of the various pods even when they
-    are merged into the same file. This is useful when trying to sort the logs of a vector file dump as
-    those are guaranteed to be sorted per-pod, but not across pods."""
-
-    def __init__(self, pod_name: str, file: TextIO) -> None:
-        self.pod_name = pod_name
-        self.file = file
-        self.pointer: int = 0
-
-        self.next_line: Optional[Tuple[str, datetime]] = self._scan_next()
-
-    @property
-    def timestamp(self) -> datetime:
-        if not self.next_line:
-            raise ValueError("Cannot compare: log has run out of entries")
-        return self.next_line[1]
-
-    def has_next(self) -> bool:
-        """Returns true if there are more logs to read for this pod."""
-        return self.next_line is not None
-
-    def __eq__(self, other: object) -> bool:
-        if not isinstance(other, PodLog):
-            return NotImplemented
-        return self.timestamp == other.timestamp
-
-    def __lt__(self, other: object) -> bool:
-        if not isinstance(other, PodLog):
-            return NotImplemented
-        return self.timestamp < other.timestamp
-
-    def __next__(self) -> Tuple[str, datetime]:
-        if self.next_line is None:
-            raise StopIteration()
-        value = self.next_line
-        self.next_line = self._scan_next()
-        return value
-
-    def _iter_file(self) -> Iterator[str]:
-        """Iterates over the file, yielding lines."""
-        self.file.seek(self.pointer)
-        for line in iter(self.file.readline, ""):
-            self.pointer = self.file.tell()
-            yield line
-
-    def _scan_next(self) -> Optional[Tuple[str, datetime]]:
-        pod_name = f'"pod_name":"{self.pod_name}"'
-        for line in self._iter_file():
-            self.pointer = self.file.tell()
-            if pod_name not in line:
-                continue
-
-            timestamp = _TIMESTAMP_REGEX.search(line)
-            if not timestamp:
-                logger.error(f"Log line contains no timestamp {line}")
-                continue
-
-            return line, datetime.fromisoformat(timestamp.group("timestamp"))
-        return None
-
 
 class VectorFlatFileSource(LogSource):
     """Log source for flat JSONL files produced by [Vector](https://vector.dev/). This is typically used when running
-    experiments locally within, say, Minikube or Kind."""
-
-    def __init__(self, file: TextIO, app_name: str, sorted=False):
+    experiments locally within, say, Minikube or Kind.
+
+    Vector dumps are sorted within pods, but not across pods. Sorted reads therefore index the file in a single
+    pass (see :class:`~benchmarks.logging.sources.vector_index.VectorIndex`), and then merge the logs of the
+    individual pods by timestamp, reading only the lines they need. Files on disk get memory-mapped so those reads
+    are cheap.
+
+    Files on disk can also get a sidecar index (see :class:`~benchmarks.logging.sources.vector_index.VectorFileIndex`),
+    which is built on first use and kept up to date with the file. With it, listing experiments no longer requires
+    reading the file, and queries read only the parts of the file which hold the lines they are after.
+
+    The file may be a decompressing stream, as returned by :func:`~benchmarks.logging.compression.open_file`.
+    Sorted reads jump around the file, however, which compressed streams do not support efficiently (or at all).
+    Compressed streams cannot be indexed either."""
+
+    def __init__(
+        self,
+        file: IO[str],
+        app_name: str,
+        sorted=False,
+        index_file: Optional[Path] = None,
+    ):
+        """
+        :param file: The dump to read logs from.
+        :param app_name: The app to read logs for.
+        :param sorted: Whether to return logs in chronological order.
+        :param index_file: Where to keep the sidecar index for the dump, usually
+            :func:`~benchmarks.logging.sources.vector_index.sidecar_path`. Ignored if the dump is not a
+            file on disk. Dumps do not get indexed if omitted.
+        """
         self.file = file
         self.app_name = app_name
         self.sorted = sorted
+        self.index_file = index_file
+        self._file_index: Optional[VectorFileIndex] = None
+
+    @classmethod
+    def from_path(
+        cls, path: Path, app_name: str, sorted: bool = False, index: bool = True
+    ) -> "VectorFlatFileSource":
+        """Opens a dump on disk, decompressing it if its extension calls for it. Since this takes no open
+        files, it can be pickled along with its arguments, and used as a factory for sources read in other
+        processes (see :class:`~benchmarks.logging.sources.sources.ConcurrentChainedLogSource`).
+
+        :param index: Whether to keep a sidecar index next to the dump. Compressed dumps never get indexed."""
+        return cls(
+            open_file(path),
+            app_name=app_name,
+            sorted=sorted,
+            index_file=(
+                sidecar_path(path)
+                if index and Compression.from_path(path) is None
+                else None
+            ),
+        )
 
     def __enter__(self):
         return self
@@ -96,11 +90,17 @@ class VectorFlatFileSource(LogSource):
 
     def experiments(self, group_id: str) -> Iterator[str]:
         """
-        Retrieves all experiment IDs within an experiment group. Can be quite slow as this source supports
-        no indexing or aggregation.
+        Retrieves all experiment IDs within an experiment group. Can be quite slow for files which are
+        not indexed, as it then requires a full pass on the file.
 
         See also: :meth:`LogSource.experiments`.
         """
+        with line_reader(self.file) as reader:
+            index = self._index(reader)
+            if index is not None:
+                yield from index.experiments(group_id)
+                return
+
         app_label = f'"app.kubernetes.io/name":"{self.app_name}"'
         group_label = f'"app.kubernetes.io/part-of":"{group_id}"'
         seen = set()
@@ -119,80 +119,255 @@ class VectorFlatFileSource(LogSource):
             seen.add(experiment_id)
             yield experiment_id
 
-    def _sorted_logs(self, line_predicate: Callable[[str], bool]) -> Iterator[str]:
-        sources = [
-            source for source in self._pod_logs(line_predicate) if source.has_next()
-        ]
-        heapify(sources)
-        while sources:
-            log = heappop(sources)
-            yield next(log)[0]
-            if log.has_next():
-                heappush(sources, log)
-
-    def _unsorted_logs(self, line_predicate: Callable[[str], bool]) -> Iterator[str]:
+    def _sorted_logs(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> Iterator[str]:
+        with line_reader(self.file) as reader:
+            logger.info("Indexing pod logs.")
+            index = VectorIndex.build(
+                self._lines(reader, group_id, experiment_id), self.app_name
+            )
+            logger.info(f"Found {len(index.pods)} pods.")
+            for offset in index.chronological(group_id, experiment_id):
+                yield reader.line_at(offset)
+
+    def _unsorted_logs(
+        self,
+        line_predicate: Callable[[str], bool],
+        group_id: str,
+        experiment_id: Optional[str] = None,
+    ) -> Iterator[str]:
+        with line_reader(self.file) as reader:
+            index = self._index(reader)
+            if index is not None:
+                assert isinstance(reader, MappedLineReader)
+                for start, end in index.ranges(group_id, experiment_id):
+                    for line in reader.text(start, end):
+                        if line_predicate(line):
+                            yield line
+                return
+
         self.file.seek(0)
         for line in self.file:
             if not line_predicate(line):
                 continue
             yield line
 
-    def _pod_logs(self, line_predicate: Callable[[str], bool]) -> List[PodLog]:
-        logger.info("Identifying pod logs.")
-        self.file.seek(0)
-        pod_logs = {}
-        for line in self.file:
-            if not line_predicate(line):
-                continue
-            match = _POD_NAME_REGEX.search(line)
-            if not match:
-                logger.error(f"Log line contains no pod name {line}")
-                continue
-            pod_name = match.group("pod_name")
-            if pod_name not in pod_logs:
-                logger.info(f"Pod found: {pod_name}")
-                pod_logs[pod_name] = PodLog(pod_name, self.file)
+    def _lines(
+        self, reader: LineReader, group_id: str, experiment_id: Optional[str] = None
+    ) -> Iterator[Tuple[int, bytes]]:
+        """Iterates over the lines which may belong to a group or experiment. This is the whole file unless
+        the file is indexed, in which case lines from other groups or experiments may still come up, but
+        much fewer."""
+        index = self._index(reader)
+        if index is None:
+            return reader.lines()
+        return chain.from_iterable(
+            reader.lines(start, end)
+            for start, end in index.ranges(group_id, experiment_id)
+        )
 
-        return list(pod_logs.values())
+    def _index(self, reader: LineReader) -> Optional[VectorFileIndex]:
+        if self.index_file is None or not isinstance(reader, MappedLineReader):
+            return None
+        if self._file_index is None:
+            self._file_index = load_or_build_index(
+                reader, self.index_file, self.app_name
+            )
+        return self._file_index
 
     def logs(
         self, group_id: str, experiment_id: Optional[str] = None
     ) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
-        """Retrieves logs for either all experiments within a group, or a specific experiments. Again, since this
-        source supports no indexing this can be quite slow, as each query represents a full pass on the file.
-        I strongly encourage not attempting to retrieve logs for experiments individually.
+        """Retrieves logs for either all experiments within a group, or a specific experiments. For files which
+        are not indexed, each query represents a full pass on the file, so I strongly encourage not attempting to
+        retrieve logs for experiments individually in that case.
         """
-        app_label = f'"app.kubernetes.io/name":"{self.app_name}"'
-        group_label = f'"app.kubernetes.io/part-of":"{group_id}"'
-        experiment_label = f'"app.kubernetes.io/instance":"{experiment_id}"'
-
-        def line_predicate(line: str) -> bool:
-            return (
-                app_label in line
-                and group_label in line
-                and (experiment_id is None or experiment_label in line)
-            )
-
         logs = (
-            self._sorted_logs(line_predicate)
+            self._sorted_logs(group_id, experiment_id)
             if self.sorted
-            else self._unsorted_logs(line_predicate)
+            else self._unsorted_logs(
+                _line_predicate(self.app_name, group_id, experiment_id),
+                group_id,
+                experiment_id,
+            )
         )
-        for line in logs:
-            try:
-                parsed = json.loads(line)
-            except JSONDecodeError as err:
-                logger.error(
-                    f"Failed to parse line from vector from source {line}", err
-                )
-                continue
+        return _parse_lines(logs)
 
-            k8s = parsed["kubernetes"]
-            yield (
-                k8s["pod_labels"]["app.kubernetes.io/instance"],
-                k8s["pod_name"],
-                parsed["message"],
+    def __str__(self):
+        return f"VectorFlatFileSource({self.app_name})"
+
+
+#: Default interval, in seconds, at which :class:`VectorTailSource` checks dumps for new lines.
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+class VectorTailSource(LogSource):
+    """Log source which follows a Vector flat file dump as it gets written to, much like `tail -F`, so that logs
+    can be split while experiments are still running rather than after the whole group is done (see
+    `flush_interval` in :func:`~benchmarks.logging.sources.sources.split_logs_in_source`).
+
+    Queries read the dump from the start and then keep waiting for new lines, which get returned as soon as
+    they are complete. Queries end once the dump has gone without new lines for `idle_timeout` seconds, or
+    once `stop` gets set, after returning whatever got written until then. Dumps which get rotated, either by
+    being moved away and recreated or by being truncated in place, get followed onto their new contents.
+
+    Logs come in the order they got written in, and dumps cannot be compressed."""
+
+    def __init__(
+        self,
+        path: Path,
+        app_name: str,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        idle_timeout: Optional[float] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> None:
+        """
+        :param path: The dump to follow. Does not need to exist yet.
+        :param app_name: The app to read logs for.
+        :param poll_interval: How often to check the dump for new lines, in seconds, once all lines in it
+            have been read.
+        :param idle_timeout: How long to wait for new lines before ending a query, in seconds. Queries only
+            end when `stop` gets set if omitted.
+        :param stop: Ends queries once set.
+        """
+        if Compression.from_path(path) is not None:
+            raise ValueError(f"Cannot follow compressed dump {path}.")
+        self.path = path
+        self.app_name = app_name
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.stop = stop if stop is not None else threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def experiments(self, group_id: str) -> Iterator[str]:
+        """Retrieves the IDs of the experiments which the dump holds logs for so far."""
+        with VectorFlatFileSource.from_path(
+            self.path, self.app_name, index=False
+        ) as source:
+            yield from source.experiments(group_id)
+
+    def logs(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
+        return _parse_lines(
+            filter(
+                _line_predicate(self.app_name, group_id, experiment_id),
+                self._follow(),
             )
+        )
+
+    def _follow(self) -> Iterator[str]:
+        istream: Optional[IO[str]] = None
+        pending = ""
+        last_read = time.monotonic()
+
+        def _complete_lines(stream: IO[str]) -> Iterator[str]:
+            nonlocal pending, last_read
+            while line := stream.readline():
+                last_read = time.monotonic()
+                if not line.endswith("\n"):
+                    # The rest of the line has yet to be written.
+                    pending += line
+                    continue
+                yield pending + line
+                pending = ""
+
+        try:
+            while True:
+                if istream is None:
+                    istream = self._open()
+
+                if istream is not None:
+                    yield from _complete_lines(istream)
+
+                    if self._rotated(istream):
+                        # Writers may still hold on to the old dump for a bit after it got moved away.
+                        yield from _complete_lines(istream)
+                        if pending:
+                            logger.warning(
+                                f"Dropping incomplete line at the end of rotated dump {self.path}."
+                            )
+                            pending = ""
+                        logger.info(f"Dump {self.path} got rotated, following it.")
+                        istream.close()
+                        istream = None
+                        continue
+
+                if self.stop.is_set():
+                    return
+                if (
+                    self.idle_timeout is not None
+                    and time.monotonic() - last_read >= self.idle_timeout
+                ):
+                    logger.info(
+                        f"No new lines in {self.path} for {self.idle_timeout} seconds, stopping."
+                    )
+                    return
+                self.stop.wait(self.poll_interval)
+        finally:
+            if istream is not None:
+                istream.close()
+
+    def _open(self) -> Optional[IO[str]]:
+        try:
+            return self.path.open(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def _rotated(self, istream: IO[str]) -> bool:
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            # Moved away, but not recreated yet.
+            return False
+        opened = os.fstat(istream.fileno())
+        if (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino):
+            return True
+        # Truncated in place.
+        return current.st_size < istream.tell()
 
     def __str__(self):
-        return f"VectorFlatFileSource({self.app_name})"
+        return f"VectorTailSource({self.path}, {self.app_name})"
+
+
+def _line_predicate(
+    app_name: str, group_id: str, experiment_id: Optional[str]
+) -> Callable[[str], bool]:
+    """Cheaply filters out raw Vector lines which cannot belong to a group or experiment, without decoding
+    them."""
+    app_label = f'"app.kubernetes.io/name":"{app_name}"'
+    group_label = f'"app.kubernetes.io/part-of":"{group_id}"'
+    experiment_label = f'"app.kubernetes.io/instance":"{experiment_id}"'
+
+    def line_predicate(line: str) -> bool:
+        return (
+            app_label in line
+            and group_label in line
+            and (experiment_id is None or experiment_label in line)
+        )
+
+    return line_predicate
+
+
+def _parse_lines(
+    lines: Iterable[str],
+) -> Iterator[Tuple[ExperimentId, NodeId, RawLine]]:
+    for line in lines:
+        try:
+            parsed = json.loads(line)
+        except JSONDecodeError as err:
+            logger.error(f"Failed to parse line from vector from source {line}", err)
+            continue
+
+        k8s = parsed["kubernetes"]
+        yield (
+            k8s["pod_labels"]["app.kubernetes.io/instance"],
+            k8s["pod_name"],
+            parsed["message"],
+        )
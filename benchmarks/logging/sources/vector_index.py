@@ -0,0 +1,454 @@
+"""Indexing for Vector flat file dumps. An index records, for every pod in a dump, the byte offsets and timestamps
+of its lines, which lets us read lines for specific pods, and in chronological order, without having to scan
+through the entire dump once per pod.
+
+Line-level indexes (:class:`VectorIndex`) are built in memory, as needed. Dumps on disk can in addition get a
+coarser, persistent sidecar index (:class:`VectorFileIndex`) which records the byte ranges holding each pod's
+lines, so that listing experiments, or reading the logs for a single experiment, does not require going through
+the entire dump."""
+
+import heapq
+import io
+import logging
+import mmap
+import os
+import re
+from abc import ABC, abstractmethod
+from array import array
+from contextlib import AbstractContextManager
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from benchmarks.logging.timestamps import parse_epoch_ns
+
+logger = logging.getLogger(__name__)
+
+#: Suffix appended to the name of a dump to get the name of its sidecar index.
+INDEX_SUFFIX = ".index.json"
+
+#: Lines for a pod which are less than this many bytes apart get merged into the same byte range in sidecar
+#: indexes. Pods log concurrently, so without this we would end up with about one range per line.
+INDEX_RANGE_GAP = 64 * 1024
+
+_CHUNK_SIZE = 1024 * 1024
+
+_POD_LABELS = b'"pod_labels":{'
+_POD_NAME = b'"pod_name":"'
+_TIMESTAMP = b'"timestamp":"'
+_POD_NAME_VALUE = re.compile(rb'"pod_name":"(?P<value>[^"]+)"')
+_EXPERIMENT_ID = re.compile(rb'"app\.kubernetes\.io/instance":"(?P<value>[^"]+)"')
+_GROUP_ID = re.compile(rb'"app\.kubernetes\.io/part-of":"(?P<value>[^"]+)"')
+
+#: A group ID, an experiment ID, and a pod name.
+type PodKey = Tuple[str, str, str]
+
+
+class PodIndex:
+    """Offsets and timestamps (as epoch nanoseconds, see :mod:`benchmarks.logging.timestamps`) of the lines
+    for a single pod, in file order. Vector dumps are sorted within pods, so these are also in chronological
+    order. Kept as arrays of 64-bit integers, so that indexes for large dumps stay reasonably small."""
+
+    def __init__(self) -> None:
+        self.offsets = array("q")
+        self.timestamps = array("q")
+
+    def append(self, offset: int, timestamp: int) -> None:
+        self.offsets.append(offset)
+        self.timestamps.append(timestamp)
+
+    def entries(self) -> Iterator[Tuple[int, int]]:
+        """Iterates over the pod's lines as `(timestamp, offset)` pairs."""
+        return zip(self.timestamps, self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+
+class VectorIndex:
+    """Index over the lines of a Vector dump which belong to an app, keyed by group, experiment, and pod."""
+
+    def __init__(self, pods: Dict[PodKey, PodIndex]) -> None:
+        self.pods = pods
+
+    @staticmethod
+    def build(lines: Iterable[Tuple[int, bytes]], app_name: str) -> "VectorIndex":
+        """Builds an index in a single pass over the lines of a dump.
+
+        :param lines: The lines in the dump, as `(offset, line)` pairs.
+        :param app_name: The app to index lines for. Lines for other apps are skipped."""
+        # Keyed by the raw labels, so that we only decode those once per pod.
+        pods: Dict[_RawPodKey, PodIndex] = {}
+        for key, offset, line, timestamp in _pod_lines(lines, app_name):
+            if timestamp is None:
+                logger.error(f"Log line contains no timestamp {line!r}")
+                continue
+
+            pod = pods.get(key)
+            if pod is None:
+                pod = pods[key] = PodIndex()
+            pod.append(offset, parse_epoch_ns(timestamp.decode("utf-8")))
+
+        return VectorIndex({_decode_key(key): index for key, index in pods.items()})
+
+    def select(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> List[PodIndex]:
+        """Returns the indexes for the pods in a group, or in a specific experiment within it."""
+        return [
+            index
+            for (group, experiment, _), index in self.pods.items()
+            if group == group_id
+            and (experiment_id is None or experiment == experiment_id)
+        ]
+
+    def chronological(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> Iterator[int]:
+        """Iterates over the offsets of the lines in a group, or in a specific experiment within it, in
+        chronological order. Lines with the same timestamp come in file order."""
+        for _, offset in heapq.merge(
+            *(index.entries() for index in self.select(group_id, experiment_id))
+        ):
+            yield offset
+
+
+class PodRanges(BaseModel):
+    """Where the lines for a pod sit within a dump."""
+
+    group_id: str
+    experiment_id: str
+    pod_name: str
+    ranges: List[Tuple[int, int]]
+    """Byte ranges, as `[start, end)` pairs in file order, which hold the pod's lines. Ranges start and end at line
+    boundaries, but may also hold lines from other pods (see :data:`INDEX_RANGE_GAP`)."""
+    first_timestamp: Optional[int] = None
+    """Timestamp of the pod's first line with one, in epoch nanoseconds."""
+    last_timestamp: Optional[int] = None
+    """Timestamp of the pod's last line with one, in epoch nanoseconds."""
+    lines: int
+
+
+class VectorFileIndex(BaseModel):
+    """Sidecar index for a Vector dump on disk. Gets stored next to the dump, and rebuilt whenever the dump's
+    size or modification time no longer match the ones recorded in it."""
+
+    app_name: str
+    size: int
+    mtime_ns: int
+    pods: List[PodRanges]
+
+    @staticmethod
+    def build(
+        lines: Iterable[Tuple[int, bytes]], app_name: str, size: int, mtime_ns: int
+    ) -> "VectorFileIndex":
+        """Builds a sidecar index in a single pass over the lines of a dump.
+
+        :param lines: The lines in the dump, as `(offset, line)` pairs.
+        :param app_name: The app to index lines for. Lines for other apps are skipped.
+        :param size: Size of the dump.
+        :param mtime_ns: Modification time of the dump, in nanoseconds."""
+        pods: Dict[_RawPodKey, PodRanges] = {}
+        # Timestamps only get parsed for the first and last lines of each pod, once all lines are in.
+        first_timestamps: Dict[_RawPodKey, bytes] = {}
+        last_timestamps: Dict[_RawPodKey, bytes] = {}
+        for key, offset, line, timestamp in _pod_lines(lines, app_name):
+            if timestamp is not None:
+                last_timestamps[key] = timestamp
+                if key not in first_timestamps:
+                    first_timestamps[key] = timestamp
+
+            end = offset + len(line)
+            pod = pods.get(key)
+            if pod is None:
+                group_id, experiment_id, pod_name = _decode_key(key)
+                pods[key] = PodRanges(
+                    group_id=group_id,
+                    experiment_id=experiment_id,
+                    pod_name=pod_name,
+                    ranges=[(offset, end)],
+                    lines=1,
+                )
+                continue
+
+            last_start, last_end = pod.ranges[-1]
+            if offset - last_end <= INDEX_RANGE_GAP:
+                pod.ranges[-1] = (last_start, end)
+            else:
+                pod.ranges.append((offset, end))
+            pod.lines += 1
+
+        for key, timestamp in first_timestamps.items():
+            pods[key].first_timestamp = parse_epoch_ns(timestamp.decode("utf-8"))
+        for key, timestamp in last_timestamps.items():
+            pods[key].last_timestamp = parse_epoch_ns(timestamp.decode("utf-8"))
+
+        return VectorFileIndex(
+            app_name=app_name, size=size, mtime_ns=mtime_ns, pods=list(pods.values())
+        )
+
+    def select(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> List[PodRanges]:
+        """Returns the pods in a group, or in a specific experiment within it."""
+        return [
+            pod
+            for pod in self.pods
+            if pod.group_id == group_id
+            and (experiment_id is None or pod.experiment_id == experiment_id)
+        ]
+
+    def experiments(self, group_id: str) -> List[str]:
+        """Returns the IDs of the experiments in a group, in the order in which they first appear in the dump."""
+        first_seen: Dict[str, int] = {}
+        for pod in self.select(group_id):
+            start = pod.ranges[0][0]
+            if start < first_seen.get(pod.experiment_id, start + 1):
+                first_seen[pod.experiment_id] = start
+        return sorted(first_seen, key=lambda experiment_id: first_seen[experiment_id])
+
+    def ranges(
+        self, group_id: str, experiment_id: Optional[str] = None
+    ) -> List[Tuple[int, int]]:
+        """Returns the byte ranges, in file order and without overlaps, which hold the lines for a group or for a
+        specific experiment within it."""
+        merged: List[Tuple[int, int]] = []
+        for start, end in sorted(
+            byte_range
+            for pod in self.select(group_id, experiment_id)
+            for byte_range in pod.ranges
+        ):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+
+def sidecar_path(dump: Path) -> Path:
+    """Returns where the sidecar index for a dump gets stored."""
+    return dump.with_name(f"{dump.name}{INDEX_SUFFIX}")
+
+
+def load_or_build_index(
+    reader: "MappedLineReader", index_file: Path, app_name: str
+) -> VectorFileIndex:
+    """Loads the sidecar index for the dump open in `reader` from `index_file`, or builds and stores a new one
+    if there is no index there yet, or if the one there is stale."""
+    stat = os.fstat(reader.fileno)
+    if index_file.exists():
+        try:
+            index = VectorFileIndex.model_validate_json(index_file.read_bytes())
+            if (index.app_name, index.size, index.mtime_ns) == (
+                app_name,
+                stat.st_size,
+                stat.st_mtime_ns,
+            ):
+                return index
+            logger.info(f"Index {index_file} is stale, rebuilding it.")
+        except ValidationError:
+            logger.warning(f"Ignoring malformed index {index_file}.")
+
+    logger.info(f"Building index {index_file}.")
+    index = VectorFileIndex.build(
+        reader.lines(), app_name, size=stat.st_size, mtime_ns=stat.st_mtime_ns
+    )
+    try:
+        # Writes to a temporary file first, so that we never end up with a partially written index.
+        scratch = index_file.with_name(f"{index_file.name}.tmp")
+        scratch.write_text(index.model_dump_json(), encoding="utf-8")
+        scratch.replace(index_file)
+    except OSError as err:
+        logger.warning(f"Could not store index {index_file}: {err}")
+    return index
+
+
+class LineReader(AbstractContextManager, ABC):
+    """Reads lines off of a text file, both sequentially and at arbitrary offsets."""
+
+    @abstractmethod
+    def lines(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[Tuple[int, bytes]]:
+        """Iterates over the lines in the file, as `(offset, line)` pairs.
+
+        :param start: Offset to start reading from. Must be at a line boundary.
+        :param end: Offset to stop reading at. Reads until the end of the file if omitted."""
+        pass
+
+    @abstractmethod
+    def line_at(self, offset: int) -> str:
+        """Reads the line starting at an offset previously returned by :meth:`LineReader.lines`."""
+        pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class MappedLineReader(LineReader):
+    """Memory-maps a file, so that reading lines at arbitrary offsets costs no more than reading them
+    sequentially."""
+
+    def __init__(self, fileno: int) -> None:
+        self.fileno = fileno
+        self.size = io.FileIO(fileno, closefd=False).seek(0, io.SEEK_END)
+        # Empty files cannot be memory-mapped.
+        self.buffer = (
+            mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) if self.size > 0 else None
+        )
+
+    def lines(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[Tuple[int, bytes]]:
+        for offset, chunk in self._chunks(start, end):
+            for line in io.BytesIO(chunk):
+                yield offset, line
+                offset += len(line)
+
+    def text(self, start: int = 0, end: Optional[int] = None) -> Iterator[str]:
+        """Iterates over the lines in the file, decoded. Faster than decoding the lines returned by
+        :meth:`MappedLineReader.lines` one by one."""
+        for _, chunk in self._chunks(start, end):
+            yield from io.StringIO(chunk.decode("utf-8"))
+
+    def line_at(self, offset: int) -> str:
+        assert self.buffer is not None
+        end = self.buffer.find(b"\n", offset)
+        end = self.size if end == -1 else end + 1
+        return self.buffer[offset:end].decode("utf-8")
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.buffer is not None:
+            self.buffer.close()
+
+    def _chunks(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[Tuple[int, bytes]]:
+        """Splitting lines off of larger chunks is a lot faster than reading them one by one. Chunks end at line
+        boundaries, unless a single line does not fit in them."""
+        if self.buffer is None:
+            return
+        end = self.size if end is None else min(end, self.size)
+        offset = start
+        while offset < end:
+            chunk_end = (
+                self.buffer.rfind(b"\n", offset, min(offset + _CHUNK_SIZE, end)) + 1
+            )
+            if chunk_end <= offset:
+                chunk_end = self.buffer.find(b"\n", offset, end) + 1 or end
+            yield offset, self.buffer[offset:chunk_end]
+            offset = chunk_end
+
+
+class StreamLineReader(LineReader):
+    """Reads lines off of a seekable text stream. Works with any stream, but can be slow if seeking is
+    expensive, as it is for compressed files."""
+
+    def __init__(self, file: IO[str]) -> None:
+        self.file = file
+
+    def lines(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[Tuple[int, bytes]]:
+        self.file.seek(start)
+        while True:
+            offset = self.file.tell()
+            if end is not None and offset >= end:
+                return
+            line = self.file.readline()
+            if not line:
+                return
+            yield offset, line.encode("utf-8")
+
+    def line_at(self, offset: int) -> str:
+        self.file.seek(offset)
+        return self.file.readline()
+
+
+def line_reader(file: IO[str]) -> LineReader:
+    """Returns a :class:`MappedLineReader` for text files which sit directly on top of a file on disk,
+    and a :class:`StreamLineReader` for anything else (e.g. in-memory or compressed files)."""
+    raw = getattr(getattr(file, "buffer", None), "raw", None)
+    if isinstance(raw, io.FileIO):
+        return MappedLineReader(raw.fileno())
+    return StreamLineReader(file)
+
+
+#: The raw (undecoded) group ID, experiment ID, and pod name for a line.
+type _RawPodKey = Tuple[bytes, bytes, bytes]
+
+
+def _pod_lines(
+    lines: Iterable[Tuple[int, bytes]], app_name: str
+) -> Iterator[Tuple[_RawPodKey, int, bytes, Optional[bytes]]]:
+    """Picks out the lines for an app, along with their pods and timestamps. Labels and timestamps are left
+    undecoded, so that callers can key on labels and decode them only once per pod, and parse only the
+    timestamps they need. Lines without a timestamp get `None` instead.
+
+    :return: An iterator over `(pod key, offset, line, timestamp)` tuples."""
+    app_label = f'"app.kubernetes.io/name":"{app_name}"'.encode("utf-8")
+    # This runs over every line in a dump, so fields get picked out with plain searches rather than regular
+    # expressions. A pod carries the same labels on all of its lines, so those (the app's name included) only
+    # get read once per pod, off of the raw label object.
+    keys: Dict[bytes, Optional[_RawPodKey]] = {}
+    for offset, line in lines:
+        labels_start = line.find(_POD_LABELS)
+        name_start = line.find(_POD_NAME)
+        if labels_start < 0 or name_start < 0:
+            if app_label in line:
+                logger.error(f"Log line is missing pod labels {line!r}")
+            continue
+
+        # The span holding both the label object and the pod name.
+        pod = line[
+            min(labels_start, name_start) : max(
+                line.find(b"}", labels_start),
+                line.find(b'"', name_start + len(_POD_NAME)) + 1,
+            )
+        ]
+        if pod in keys:
+            key = keys[pod]
+        else:
+            key = keys[pod] = _raw_key(pod, app_label)
+        if key is None:
+            continue
+
+        # Vector writes fields in alphabetical order, so the timestamp is usually the last one.
+        timestamp_start = line.rfind(_TIMESTAMP) + len(_TIMESTAMP)
+        yield (
+            key,
+            offset,
+            line,
+            line[timestamp_start : line.find(b'"', timestamp_start)]
+            if timestamp_start >= len(_TIMESTAMP)
+            else None,
+        )
+
+
+def _raw_key(pod: bytes, app_label: bytes) -> Optional[_RawPodKey]:
+    """Reads the key for a pod off of the span of a line holding its labels and name, or returns `None` if the
+    pod is not for the app, or if its labels are incomplete. The latter gets logged, once per pod."""
+    if app_label not in pod:
+        return None
+
+    pod_name = _POD_NAME_VALUE.search(pod)
+    experiment_id = _EXPERIMENT_ID.search(pod)
+    group_id = _GROUP_ID.search(pod)
+    if not (pod_name and experiment_id and group_id):
+        logger.error(f"Pod is missing labels {pod!r}")
+        return None
+    return (
+        group_id.group("value"),
+        experiment_id.group("value"),
+        pod_name.group("value"),
+    )
+
+
+def _decode_key(key: _RawPodKey) -> PodKey:
+    group_id, experiment_id, pod_name = key
+    return (
+        group_id.decode("utf-8"),
+        experiment_id.decode("utf-8"),
+        pod_name.decode("utf-8"),
+    )
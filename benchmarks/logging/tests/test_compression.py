@@ -0,0 +1,37 @@
+from pathlib import Path
+
+import pytest
+
+from benchmarks.logging.compression import Compression, open_file
+
+
+def test_should_pick_compression_by_extension():
+    assert Compression.from_path(Path("raw-logs.log.gz")) == Compression.gzip
+    assert Compression.from_path(Path("raw-logs.log.ZST")) == Compression.zstd
+    assert Compression.from_path(Path("raw-logs.log")) is None
+
+
+@pytest.mark.parametrize("name", ["log.jsonl.gz", "log.jsonl.zst", "log.jsonl"])
+def test_should_read_back_what_was_written_and_appended(tmp_path, name):
+    if name.endswith(".zst"):
+        pytest.importorskip("zstandard")
+
+    path = tmp_path / name
+    with open_file(path, "w") as ostream:
+        ostream.write("línea 1\nline 2\n")
+    with open_file(path, "a") as ostream:
+        ostream.write("line 3\n")
+
+    with open_file(path) as istream:
+        assert list(istream) == ["línea 1\n", "line 2\n", "line 3\n"]
+
+    with open_file(path, "rb", encoding=None) as istream:
+        assert istream.read() == "línea 1\nline 2\nline 3\n".encode("utf-8")
+
+
+def test_should_compress_output(tmp_path):
+    path = tmp_path / "log.jsonl.gz"
+    with open_file(path, "w") as ostream:
+        ostream.write("line\n" * 10000)
+
+    assert path.stat().st_size < 1000
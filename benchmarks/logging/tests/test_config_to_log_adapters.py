@@ -1,5 +1,7 @@
+import pickle
+
 from benchmarks.core.pydantic import SnakeCaseModel
-from benchmarks.logging.logging import LogEntry, ConfigToLogAdapters
+from benchmarks.logging.logging import LogEntry, ConfigToLogAdapters, LogParser
 
 
 class MyConfig(SnakeCaseModel):
@@ -36,3 +38,17 @@ def test_should_adapt_instance_by_type():
 
     assert isinstance(adapted1, Adapted1)
     assert isinstance(adapted2, Adapted2)
+
+
+def test_should_pickle_parsers_for_adapted_types():
+    adapters = ConfigToLogAdapters()
+    parser = LogParser()
+    parser.register(adapters.adapt(MyConfig))
+
+    unpickled, (Adapted,) = pickle.loads(pickle.dumps((parser, [adapters[MyConfig]])))
+
+    (entry,) = unpickled.parse(
+        ['>>{"my_key":"key","my_value":1,"entry_type":"my_config_log_entry"}']
+    )
+    assert isinstance(entry, Adapted)
+    assert entry.recover_instance() == MyConfig(my_key="key", my_value=1)
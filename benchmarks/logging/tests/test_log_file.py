@@ -0,0 +1,311 @@
+import datetime
+from pathlib import Path
+
+import pytest
+
+from benchmarks.logging.compression import Compression, open_file
+from benchmarks.logging.log_file import (
+    CHECKPOINT_FILE,
+    marked_lines,
+    shard_boundaries,
+    split_log_file,
+)
+from benchmarks.logging.logging import LogEntry, LogParser, LogSplitterFormats
+
+
+class MetricsEvent(LogEntry):
+    name: str
+    timestamp: datetime.datetime
+    value: float
+    node: str
+
+
+class Person(LogEntry):
+    name: str
+    surname: str
+
+
+def _log_parser() -> LogParser:
+    parser = LogParser()
+    parser.register(MetricsEvent)
+    parser.register(Person)
+    return parser
+
+
+def _write_log(path: Path, lines: int) -> Path:
+    with path.open("w", encoding="utf-8") as ostream:
+        for i in range(lines):
+            ostream.write(f"DBG some unstructured line number {i}\n")
+            ostream.write(
+                f'INF >>{{"name":"download","timestamp":"2021-01-01T00:00:00Z","value":{i},'
+                f'"node":"node{i % 3}","entry_type":"metrics_event"}}\n'
+            )
+            if i % 10 == 0:
+                ostream.write(
+                    f'>>{{"name":"John{i}","surname":"Doe","entry_type":"person"}}\n'
+                )
+    return path
+
+
+def test_should_cut_log_into_line_aligned_shards(tmp_path):
+    log = _write_log(tmp_path / "raw-logs.log", 100)
+    shards = shard_boundaries(log, 7)
+
+    assert shards[0][0] == 0
+    assert shards[-1][1] == log.stat().st_size
+    for (_, end), (start, _) in zip(shards, shards[1:]):
+        assert end == start
+
+    contents = log.read_bytes()
+    assert b"".join(contents[start:end] for start, end in shards) == contents
+    for start, _ in shards:
+        assert start == 0 or contents[start - 1 : start] == b"\n"
+
+
+def test_should_not_produce_empty_shards_for_small_files(tmp_path):
+    log = tmp_path / "raw-logs.log"
+    log.write_text("line 1\nline 2\n", encoding="utf-8")
+
+    assert shard_boundaries(log, 10) == [(0, 7), (7, 14)]
+
+
+def test_should_only_return_lines_with_marker_within_range(tmp_path):
+    log = tmp_path / "raw-logs.log"
+    log.write_text(
+        "line 1\n"
+        "line 2 >> marked\n"
+        ">> line 3 >> marked twice\n"
+        "línea 4\n"
+        "line 5 >>",
+        encoding="utf-8",
+    )
+
+    assert list(marked_lines(log)) == [
+        "line 2 >> marked\n",
+        ">> line 3 >> marked twice\n",
+        "line 5 >>",
+    ]
+
+    # Lines belong to the range they start in.
+    assert list(marked_lines(log, 7, 24)) == ["line 2 >> marked\n"]
+    assert list(marked_lines(log, 24, 25)) == [">> line 3 >> marked twice\n"]
+    assert list(marked_lines(log, 0, 7)) == []
+
+
+def test_should_return_no_lines_for_empty_files(tmp_path):
+    log = tmp_path / "raw-logs.log"
+    log.touch()
+
+    assert list(marked_lines(log)) == []
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_should_produce_same_output_in_parallel_as_in_single_process(tmp_path, workers):
+    log = _write_log(tmp_path / "raw-logs.log", 1000)
+    (tmp_path / "single").mkdir()
+    (tmp_path / "parallel").mkdir()
+
+    split_log_file(
+        log,
+        tmp_path / "single",
+        _log_parser,
+        formats=[(Person, LogSplitterFormats.jsonl)],
+    )
+    split_log_file(
+        log,
+        tmp_path / "parallel",
+        _log_parser,
+        formats=[(Person, LogSplitterFormats.jsonl)],
+        workers=workers,
+    )
+
+    assert sorted(path.name for path in (tmp_path / "parallel").iterdir()) == [
+        "metrics_event.csv",
+        "person.jsonl",
+    ]
+
+    for name in ["metrics_event.csv", "person.jsonl"]:
+        assert (tmp_path / "parallel" / name).read_text() == (
+            tmp_path / "single" / name
+        ).read_text()
+
+
+def test_should_merge_parquet_shards_in_order(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    log = _write_log(tmp_path / "raw-logs.log", 1000)
+    (tmp_path / "parallel").mkdir()
+
+    split_log_file(
+        log,
+        tmp_path / "parallel",
+        _log_parser,
+        default_format=LogSplitterFormats.parquet,
+        workers=3,
+    )
+
+    table = pq.read_table(tmp_path / "parallel" / "metrics_event.parquet")
+    assert table.column("value").to_pylist() == [float(i) for i in range(1000)]
+
+
+def test_should_cut_byte_range_into_line_aligned_shards(tmp_path):
+    log = _write_log(tmp_path / "raw-logs.log", 100)
+    contents = log.read_bytes()
+    start = contents.index(b"\n", 1000) + 1
+    end = contents.index(b"\n", 5000) + 1
+
+    shards = shard_boundaries(log, 5, start, end)
+
+    assert shards[0][0] == start
+    assert shards[-1][1] == end
+    assert b"".join(contents[s:e] for s, e in shards) == contents[start:end]
+
+
+def _split_incrementally(log: Path, output: Path, workers: int = 1) -> None:
+    split_log_file(
+        log,
+        output,
+        _log_parser,
+        formats=[(Person, LogSplitterFormats.jsonl)],
+        workers=workers,
+        incremental=True,
+    )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_should_only_parse_appended_lines_when_incremental(tmp_path, workers):
+    full = _write_log(tmp_path / "full.log", 300)
+    contents = full.read_bytes()
+    (tmp_path / "single").mkdir()
+    (tmp_path / "incremental").mkdir()
+
+    split_log_file(
+        full,
+        tmp_path / "single",
+        _log_parser,
+        formats=[(Person, LogSplitterFormats.jsonl)],
+    )
+
+    # Grows the log in steps, some of which end mid-line.
+    log = tmp_path / "raw-logs.log"
+    log.write_bytes(b"")
+    for cut in [0, 1000, 1010, 1010, 7000, len(contents) - 5, len(contents)]:
+        with log.open("ab") as ostream:
+            ostream.write(contents[log.stat().st_size : cut])
+        _split_incrementally(log, tmp_path / "incremental", workers)
+
+    for name in ["metrics_event.csv", "person.jsonl"]:
+        assert (tmp_path / "incremental" / name).read_text() == (
+            tmp_path / "single" / name
+        ).read_text()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_should_not_duplicate_rows_when_interrupted_before_saving_checkpoint(
+    tmp_path, monkeypatch, workers
+):
+    log = tmp_path / "raw-logs.log"
+    output = tmp_path / "output"
+    output.mkdir()
+
+    # The first run only sees people, so metrics outputs first show up in the run which gets interrupted.
+    log.write_text('>>{"name":"Jane","surname":"Doe","entry_type":"person"}\n')
+    _split_incrementally(log, output, workers)
+
+    appended = _write_log(tmp_path / "appended.log", 100).read_text()
+    with log.open("a") as ostream:
+        ostream.write(appended)
+
+    def interrupt(*_):
+        raise KeyboardInterrupt()
+
+    with monkeypatch.context() as patch:
+        patch.setattr("benchmarks.logging.log_file._save_checkpoint", interrupt)
+        with pytest.raises(KeyboardInterrupt):
+            _split_incrementally(log, output, workers)
+
+    _split_incrementally(log, output, workers)
+
+    expected = tmp_path / "expected"
+    expected.mkdir()
+    split_log_file(
+        log, expected, _log_parser, formats=[(Person, LogSplitterFormats.jsonl)]
+    )
+    for name in ["metrics_event.csv", "person.jsonl"]:
+        assert (output / name).read_text() == (expected / name).read_text()
+
+
+def test_should_not_leave_checkpoint_on_full_reparse(tmp_path):
+    log = _write_log(tmp_path / "raw-logs.log", 10)
+    _split_incrementally(log, tmp_path)
+    assert (tmp_path / CHECKPOINT_FILE).exists()
+
+    split_log_file(log, tmp_path, _log_parser)
+    assert not (tmp_path / CHECKPOINT_FILE).exists()
+
+
+def test_should_parse_from_the_start_when_log_no_longer_matches_checkpoint(tmp_path):
+    log = tmp_path / "raw-logs.log"
+    output = tmp_path / "output"
+    output.mkdir()
+
+    log.write_text('>>{"name":"John","surname":"Doe","entry_type":"person"}\n')
+    _split_incrementally(log, output)
+
+    log.write_text(
+        '>>{"name":"Jane","surname":"Doe","entry_type":"person"}\n'
+        '>>{"name":"Mary","surname":"Doe","entry_type":"person"}\n'
+    )
+    _split_incrementally(log, output)
+
+    assert (output / "person.jsonl").read_text().splitlines() == [
+        '{"name":"Jane","surname":"Doe"}',
+        '{"name":"Mary","surname":"Doe"}',
+    ]
+
+
+def test_should_refuse_to_parse_parquet_incrementally(tmp_path):
+    log = _write_log(tmp_path / "raw-logs.log", 10)
+
+    with pytest.raises(ValueError):
+        split_log_file(
+            log,
+            tmp_path,
+            _log_parser,
+            default_format=LogSplitterFormats.parquet,
+            incremental=True,
+        )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_should_parse_compressed_logs_onto_compressed_outputs(tmp_path, workers):
+    log = _write_log(tmp_path / "raw-logs.log", 100)
+    compressed = tmp_path / "raw-logs.log.gz"
+    with open_file(compressed, "wb", encoding=None) as ostream:
+        ostream.write(log.read_bytes())
+
+    (tmp_path / "plain").mkdir()
+    (tmp_path / "compressed").mkdir()
+
+    split_log_file(log, tmp_path / "plain", _log_parser, workers=workers)
+    split_log_file(
+        compressed,
+        tmp_path / "compressed",
+        _log_parser,
+        workers=workers,
+        compression=Compression.gzip,
+    )
+
+    for name in ["metrics_event.csv", "person.csv"]:
+        with open_file(tmp_path / "compressed" / f"{name}.gz") as istream:
+            assert istream.read() == (tmp_path / "plain" / name).read_text()
+
+
+def test_should_refuse_byte_ranges_on_compressed_logs(tmp_path):
+    log = tmp_path / "raw-logs.log.gz"
+    with open_file(log, "w") as ostream:
+        ostream.write(">> line 1\n")
+
+    assert list(marked_lines(log)) == [">> line 1\n"]
+    with pytest.raises(ValueError):
+        list(marked_lines(log, 0, 5))
@@ -1,7 +1,9 @@
 import datetime
 from collections import defaultdict
 from io import StringIO
+from typing import Optional
 
+import pytest
 from pydantic import BaseModel
 
 from benchmarks.logging.logging import (
@@ -9,6 +11,8 @@ from benchmarks.logging.logging import (
     LogParser,
     LogSplitter,
     LogSplitterFormats,
+    EventBoundary,
+    entry_type_tag,
 )
 from benchmarks.core.pydantic import SnakeCaseModel
 from benchmarks.tests.utils import compact
@@ -96,6 +100,41 @@ def test_should_skip_unparseable_lines():
     ]
 
 
+def test_should_parse_entries_regardless_of_type_tag_position_and_spacing():
+    log = StringIO("""
+    >>{"entry_type": "metrics_event", "name": "download", "timestamp": "2021-01-01T00:00:00Z", "value": 0.245, "node": "node1"}
+    """)
+
+    parser = LogParser()
+    parser.register(MetricsEvent)
+
+    assert list(parser.parse(log)) == [
+        MetricsEvent(
+            name="download",
+            timestamp=datetime.datetime(
+                2021, 1, 1, 0, 0, 0, tzinfo=datetime.timezone.utc
+            ),
+            value=0.245,
+            node="node1",
+        ),
+    ]
+
+
+def test_should_warn_on_schema_errors_for_registered_types_only(caplog):
+    log = StringIO("""
+    >>{"name":"download","timestamp":"2021-01-01T00:00:00Z","value":"high","node":"node1","entry_type":"metrics_event"}
+    >>{"name":"download","timestamp":"2021-01-01T00:00:00Z","value":"high","node":"node1","entry_type":"other_event"}
+    >>{"name":"download","timestamp":"2021-01-01T00:00:00Z","value":0.1,"node":"node1","entry_type":"metrics_event"
+    """)
+
+    parser = LogParser()
+    parser.register(MetricsEvent)
+
+    assert list(parser.parse(log)) == []
+    assert len(caplog.records) == 1
+    assert "metrics_event" in caplog.records[0].getMessage()
+
+
 class StateChangeEvent(LogEntry):
     old: str
     new: str
@@ -266,3 +305,193 @@ def test_should_preserve_methods_in_adapted_entries():
     instance = BModel(a=1, b=2)
 
     assert BModelLogEntry.adapt_instance(instance).hello() == "world 1 2"
+
+
+class Download(LogEntry):
+    timestamp: datetime.datetime
+    node: str
+    bytes: int
+    rate: int | float
+    note: Optional[str] = None
+    boundary: EventBoundary
+
+
+def test_should_store_split_logs_as_parquet_with_typed_columns(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    pa = pytest.importorskip("pyarrow")
+
+    entries = [
+        Download(
+            timestamp=datetime.datetime(
+                2021, 1, 1, 0, 0, i, tzinfo=datetime.timezone.utc
+            ),
+            node=f"node{i}",
+            bytes=i * (1 << 40),
+            rate=i,
+            note=None if i % 2 else "even",
+            boundary=EventBoundary.start,
+        )
+        for i in range(5)
+    ]
+
+    with LogSplitter(
+        output_factory=lambda entry_type, output_format: (
+            tmp_path / f"{entry_type}.{output_format.value}"
+        ).open("wb"),
+        default_format=LogSplitterFormats.parquet,
+    ) as splitter:
+        splitter.split(entries)
+
+    table = pq.read_table(tmp_path / "download.parquet")
+
+    assert table.schema.field("timestamp").type == pa.timestamp("ns", tz="UTC")
+    assert table.schema.field("bytes").type == pa.int64()
+    assert table.schema.field("rate").type == pa.float64()
+    assert table.schema.names == [
+        "timestamp",
+        "node",
+        "bytes",
+        "rate",
+        "note",
+        "boundary",
+    ]
+
+    assert table.to_pylist() == [
+        {
+            "timestamp": entry.timestamp,
+            "node": entry.node,
+            "bytes": entry.bytes,
+            "rate": float(entry.rate),
+            "note": entry.note,
+            "boundary": "start",
+        }
+        for entry in entries
+    ]
+
+
+def test_should_pass_raw_payloads_through_to_jsonl_outputs():
+    log = StringIO("""
+    >>{"name":"download","timestamp":"2021-01-01T00:00:00.000+00:00","value":0.246,"node":"node2","entry_type":"metrics_event"}
+    >>{"name":"start","timestamp":"2021-01-01T00:00:00Z","entry_type":"simple_event"}
+    >>{"entry_type":"simple_event","name":"start2","timestamp":"2021-01-01T00:00:00Z"}
+    >>{"name":"start3","timestamp":"2021-01-01T00:00:00Z","entry_type":"simple_event"
+    """)
+
+    parser = LogParser()
+    parser.register(MetricsEvent)
+    parser.register(SimpleEvent)
+
+    outputs = defaultdict(StringIO)
+
+    splitter = LogSplitter(
+        output_factory=lambda entry_type, _: outputs[entry_type],
+        default_format=LogSplitterFormats.jsonl,
+        passthrough=True,
+    )
+
+    splitter.split_lines(log, parser)
+
+    assert compact(outputs["metrics_event"].getvalue()) == (
+        compact("""
+        {"name":"download","timestamp":"2021-01-01T00:00:00.000+00:00","value":0.246,"node":"node2"}
+    """)
+    )
+
+    assert compact(outputs["simple_event"].getvalue()) == (
+        compact("""
+        {"name":"start","timestamp":"2021-01-01T00:00:00Z"}
+        {"name":"start2","timestamp":"2021-01-01T00:00:00Z"}
+    """)
+    )
+
+
+def test_should_validate_sampled_payloads_in_passthrough_mode():
+    log = StringIO("""
+    >>{"name":"start","timestamp":"not a timestamp","entry_type":"simple_event"}
+    >>{"name":"start2","timestamp":"not a timestamp","entry_type":"simple_event"}
+    >>{"name":"start3","timestamp":"not a timestamp","entry_type":"simple_event"}
+    """)
+
+    parser = LogParser()
+    parser.register(SimpleEvent)
+
+    outputs = defaultdict(StringIO)
+
+    splitter = LogSplitter(
+        output_factory=lambda entry_type, _: outputs[entry_type],
+        default_format=LogSplitterFormats.jsonl,
+        passthrough=True,
+        validate_every=2,
+    )
+
+    splitter.split_lines(log, parser)
+
+    assert compact(outputs["simple_event"].getvalue()) == (
+        compact("""
+        {"name":"start2","timestamp":"not a timestamp"}
+    """)
+    )
+
+
+def test_should_validate_entries_for_non_jsonl_outputs_in_passthrough_mode():
+    log = StringIO("""
+    >>{"name":"download","timestamp":"2021-01-01T00:00:00Z","value":0.246,"node":"node2","entry_type":"metrics_event"}
+    >>{"name":"download","timestamp":"2021-01-01T00:00:00Z","value":"high","node":"node2","entry_type":"metrics_event"}
+    """)
+
+    parser = LogParser()
+    parser.register(MetricsEvent)
+
+    outputs = defaultdict(StringIO)
+
+    splitter = LogSplitter(
+        output_factory=lambda entry_type, _: outputs[entry_type],
+        passthrough=True,
+    )
+
+    splitter.split_lines(log, parser)
+
+    assert compact(outputs["metrics_event"].getvalue()) == (
+        compact("""
+        name,timestamp,value,node
+        download,2021-01-01 00:00:00+00:00,0.246,node2
+    """)
+    )
+
+
+@pytest.mark.parametrize(
+    "output_format", [LogSplitterFormats.csv, LogSplitterFormats.jsonl]
+)
+def test_should_not_open_outputs_for_entries_dropped_in_passthrough_mode(
+    output_format,
+):
+    log = StringIO("""
+    >>{"name":"download","timestamp":"2021-01-01T00:00:00Z","value":"high","node":"node2","entry_type":"metrics_event"}
+    >>{"name":"download","timestamp":"2021-01-01T00:00:00Z","value":0.246,"node":"node2","entry_type":"metrics_event"
+    >>{"name":"start","timestamp":"2021-01-01T00:00:00Z","entry_type":"simple_event"}
+    """)
+
+    parser = LogParser()
+    parser.register(MetricsEvent)
+    parser.register(SimpleEvent)
+
+    outputs = defaultdict(StringIO)
+
+    splitter = LogSplitter(
+        output_factory=lambda entry_type, _: outputs[entry_type],
+        default_format=output_format,
+        passthrough=True,
+    )
+
+    splitter.split_lines(log, parser)
+
+    assert list(outputs) == ["simple_event"]
+
+
+def test_should_read_type_tags_of_entries_in_raw_lines():
+    assert (
+        entry_type_tag('INFO >>{"a":1,"entry_type":"unknown_type"}') == "unknown_type"
+    )
+    assert entry_type_tag('>>{"entry_type": "metric"}') == "metric"
+    assert entry_type_tag("an unstructured line") is None
+    assert entry_type_tag('{"entry_type":"metric"} without a marker') is None
@@ -0,0 +1,38 @@
+import datetime
+
+import pytest
+
+from benchmarks.logging.timestamps import (
+    datetime_to_epoch_ns,
+    parse_epoch_ns,
+)
+
+
+@pytest.mark.parametrize(
+    "timestamp,expected",
+    [
+        ("1970-01-01T00:00:00Z", 0),
+        ("1970-01-01T00:00:01.5+00:00", 1_500_000_000),
+        ("1970-01-01 00:00:01", 1_000_000_000),
+        ("1970-01-01T01:00:00+01:00", 0),
+        ("1969-12-31T23:59:59.999999Z", -1_000),
+        ("2025-04-22T13:37:43.001886404Z", 1_745_329_063_001_886_000),
+        ("2025-01-21T12:47:57.098167-03:30", 1_737_476_277_098_167_000),
+    ],
+)
+def test_should_parse_iso_timestamps_into_epoch_ns(timestamp, expected):
+    assert parse_epoch_ns(timestamp) == expected
+
+
+def test_should_reject_invalid_timestamps():
+    with pytest.raises(ValueError):
+        parse_epoch_ns("yesterday")
+
+
+def test_should_convert_datetimes_to_epoch_ns():
+    value = datetime.datetime(2025, 1, 21, 12, 47, 57, 98167, tzinfo=datetime.UTC)
+
+    assert datetime_to_epoch_ns(value) == 1_737_463_677_098_167_000
+    assert datetime_to_epoch_ns(value.replace(tzinfo=None)) == datetime_to_epoch_ns(
+        value
+    )
@@ -0,0 +1,125 @@
+import datetime
+from csv import DictWriter, reader
+from io import StringIO
+from typing import List, Optional
+
+from benchmarks.logging.logging import EventBoundary, LogEntry
+from benchmarks.logging.writers import CSVWriter, JSONLWriter
+
+
+class Peer(LogEntry):
+    address: str
+    port: int
+
+
+class Exchange(LogEntry):
+    timestamp: datetime.datetime
+    node: str
+    value: int | float
+    boundary: EventBoundary
+    error: Optional[str] = None
+    peers: List[Peer] = []
+
+
+ENTRIES = [
+    Exchange(
+        timestamp=datetime.datetime(2021, 1, 1, 0, 0, 0, tzinfo=datetime.UTC),
+        node="node1",
+        value=1,
+        boundary=EventBoundary.start,
+    ),
+    Exchange(
+        timestamp=datetime.datetime(
+            2021,
+            1,
+            1,
+            0,
+            0,
+            0,
+            123456,
+            tzinfo=datetime.timezone(-datetime.timedelta(hours=3)),
+        ),
+        node='"quoted", node',
+        value=0.25,
+        boundary=EventBoundary.end,
+        error="çava",
+        peers=[Peer(address="10.0.0.1", port=8080)],
+    ),
+    Exchange(
+        timestamp=datetime.datetime(2021, 1, 1, 0, 0, 1),
+        node="node\n3",
+        value=1 << 40,
+        boundary=EventBoundary.end,
+    ),
+]
+
+
+def test_csv_writer_should_produce_same_output_as_model_dump():
+    expected = StringIO()
+    writer = DictWriter(
+        expected, fieldnames=ENTRIES[0].model_dump(exclude={"entry_type"}).keys()
+    )
+    writer.writeheader()
+    for entry in ENTRIES:
+        writer.writerow(entry.model_dump(exclude={"entry_type"}))
+
+    actual = StringIO()
+    csv_writer = CSVWriter(actual, Exchange, exclude={"entry_type"}, batch_size=2)
+    for entry in ENTRIES:
+        csv_writer.write(entry)
+    csv_writer.flush()
+
+    assert actual.getvalue() == expected.getvalue()
+
+
+def test_jsonl_writer_should_produce_same_output_as_model_dump_json():
+    actual = StringIO()
+    jsonl_writer = JSONLWriter(actual, Exchange, exclude=set(), batch_size=2)
+    for entry in ENTRIES:
+        jsonl_writer.write(entry)
+    jsonl_writer.flush()
+
+    assert actual.getvalue() == "".join(
+        entry.model_dump_json() + "\n" for entry in ENTRIES
+    )
+
+
+def test_writers_should_buffer_until_flushed():
+    output = StringIO()
+    jsonl_writer = JSONLWriter(output, Exchange, exclude=set(), batch_size=10)
+    jsonl_writer.write(ENTRIES[0])
+
+    assert output.getvalue() == ""
+
+    jsonl_writer.flush()
+
+    assert output.getvalue() == ENTRIES[0].model_dump_json() + "\n"
+
+
+def test_csv_writer_should_not_repeat_header_when_appending():
+    output = StringIO()
+    for entry in ENTRIES:
+        csv_writer = CSVWriter(output, Exchange, exclude={"entry_type"})
+        csv_writer.write(entry)
+        csv_writer.flush()
+
+    rows = list(reader(StringIO(output.getvalue())))
+    assert len(rows) == len(ENTRIES) + 1
+    assert rows[0][0] == "timestamp"
+
+
+def test_csv_writer_should_write_compact_timestamps_when_requested():
+    output = StringIO()
+    csv_writer = CSVWriter(
+        output, Exchange, exclude={"entry_type"}, compact_timestamps=True
+    )
+    for entry in ENTRIES:
+        csv_writer.write(entry)
+    csv_writer.flush()
+
+    rows = list(reader(StringIO(output.getvalue())))
+    assert [int(row[0]) for row in rows[1:]] == [
+        1_609_459_200_000_000_000,
+        1_609_470_000_123_456_000,
+        1_609_459_201_000_000_000,
+    ]
@@ -1,13 +1,22 @@
 from io import StringIO
+from typing import Optional
 
 from benchmarks.logging.sources.sources import OutputManager
 
 
+class InMemoryFile(StringIO):
+    """A :class:`StringIO` which keeps its contents around after being closed, so they can be
+    inspected after splitting."""
+
+    def close(self):
+        pass
+
+
 class InMemoryOutputManager(OutputManager):
     def __init__(self):
         self.fs = {}
 
-    def _open(self, relative_path, mode: str, encoding: str):
+    def _open(self, relative_path, mode: str, encoding: Optional[str]):
         root = self.fs
         for element in relative_path.parts[:-1]:
             subtree = root.get(element)
@@ -16,7 +25,7 @@ class InMemoryOutputManager(OutputManager):
                 root[element] = subtree
             root = subtree
 
-        output = StringIO()
+        output = InMemoryFile()
         root[relative_path.parts[-1]] = output
         return output
 
@@ -0,0 +1,33 @@
+"""Compact representation for timestamps as integer nanoseconds since the Unix epoch (UTC). Integers are much
+cheaper to compare, sort, and join on than timezone-aware datetimes, and are what columnar formats store
+timestamps as anyway."""
+
+import datetime
+
+NANOS_PER_SECOND = 1_000_000_000
+
+_NANOS_PER_DAY = 86_400 * NANOS_PER_SECOND
+_UNIX_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.UTC)
+
+
+def parse_epoch_ns(timestamp: str) -> int:
+    """Parses an ISO-8601 timestamp into epoch nanoseconds. Timestamps without an offset are taken to be in UTC.
+    Precision is that of :class:`datetime.datetime`; i.e., digits past microseconds get dropped.
+
+    This goes through :meth:`datetime.datetime.fromisoformat`, which is implemented in C and beats reading
+    the fields off of fixed positions in Python, even with the date part cached, by a factor of 3-4.
+
+    :raises ValueError: if the timestamp is not a valid ISO-8601 timestamp."""
+    return datetime_to_epoch_ns(datetime.datetime.fromisoformat(timestamp))
+
+
+def datetime_to_epoch_ns(value: datetime.datetime) -> int:
+    """Converts a datetime into epoch nanoseconds. Naive datetimes are taken to be in UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.UTC)
+    delta = value - _UNIX_EPOCH
+    return (
+        delta.days * _NANOS_PER_DAY
+        + delta.seconds * NANOS_PER_SECOND
+        + delta.microseconds * 1_000
+    )
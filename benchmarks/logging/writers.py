@@ -0,0 +1,331 @@
+"""Output writers used by :class:`~benchmarks.logging.logging.LogSplitter`. A writer takes care of serializing
+entries of a single type onto an output stream."""
+
+import csv
+import datetime
+from abc import ABC, abstractmethod
+from enum import Enum
+from functools import partial
+from operator import attrgetter
+from types import UnionType
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    TypeAliasType,
+    Union,
+    get_args,
+    get_origin,
+)
+
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import to_json
+
+from benchmarks.logging.timestamps import datetime_to_epoch_ns
+
+#: Number of rows buffered before a record batch (and a row group) gets written out to columnar outputs.
+COLUMNAR_BATCH_SIZE = 64 * 1024
+
+#: Number of rows buffered before being written out to row-oriented (text) outputs.
+ROW_BATCH_SIZE = 8 * 1024
+
+_SCALARS = {str, int, float, bool, datetime.datetime}
+_NUMBER = int | float
+
+type Converter = Callable[[Any], Any]
+type Extractor = Callable[[BaseModel], Tuple[Any, ...]]
+
+
+class EntryWriter(ABC):
+    """Writes entries of a single type onto an output stream. Writers may buffer entries, so they must be
+    flushed or closed for their output to be complete."""
+
+    def __init__(self, output: IO) -> None:
+        self.output = output
+
+    @abstractmethod
+    def write(self, entry: BaseModel) -> None:
+        pass
+
+    def flush(self) -> None:
+        """Writes out any buffered entries."""
+        pass
+
+    def close(self) -> None:
+        """Writes out any buffered entries and closes the underlying output."""
+        self.flush()
+        self.output.close()
+
+
+class CSVWriter(EntryWriter):
+    """Writes entries as CSV rows. Values are read straight off the entries' attributes, and rows are written
+    out in batches. The output is the same as what we would get by writing rows from
+    :meth:`BaseModel.model_dump`.
+
+    The header only gets written if the output is empty, so that rows can be appended onto existing outputs.
+
+    With `compact_timestamps` set, datetimes get written as integer nanoseconds since the Unix epoch (see
+    :mod:`benchmarks.logging.timestamps`) instead of as ISO-8601 strings."""
+
+    def __init__(
+        self,
+        output: IO,
+        model: Type[BaseModel],
+        exclude: Set[str],
+        batch_size: int = ROW_BATCH_SIZE,
+        compact_timestamps: bool = False,
+    ) -> None:
+        super().__init__(output)
+        names, annotations = _columns(model, exclude)
+        self.extract = _extractor(
+            names, [_python_converter(a, compact_timestamps) for a in annotations]
+        )
+        self.batch_size = batch_size
+        self.rows: List[Tuple[Any, ...]] = []
+        self.writer = csv.writer(output)
+        if _at_start(output):
+            self.writer.writerow(names)
+
+    def write(self, entry: BaseModel) -> None:
+        self.rows.append(self.extract(entry))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.rows:
+            self.writer.writerows(self.rows)
+            self.rows = []
+
+
+class JSONLWriter(EntryWriter):
+    """Writes entries as JSON lines, in batches. Entries are serialized by their type's compiled pydantic
+    serializer, which beats assembling JSON from attribute values in Python, while skipping the overhead of
+    going through :meth:`BaseModel.model_dump_json` for every entry."""
+
+    def __init__(
+        self,
+        output: IO,
+        model: Type[BaseModel],
+        exclude: Set[str],
+        batch_size: int = ROW_BATCH_SIZE,
+    ) -> None:
+        super().__init__(output)
+        self.serialize = partial(
+            model.__pydantic_serializer__.to_json, exclude=exclude or None
+        )
+        self.batch_size = batch_size
+        self.lines: List[bytes] = []
+
+    def write(self, entry: BaseModel) -> None:
+        self.lines.append(self.serialize(entry))
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def write_raw(self, line: str) -> None:
+        """Writes out an already serialized JSON line, as is."""
+        self.lines.append(line.encode("utf-8"))
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.lines:
+            self.lines.append(b"")
+            self.output.write(b"\n".join(self.lines).decode("utf-8"))
+            self.lines = []
+
+
+class ParquetWriter(EntryWriter):
+    """Writes entries as rows into a Parquet file. Rows are buffered column-wise into typed record batches,
+    each of which gets written out as a row group. Column types are derived from the model's fields, so that
+    timestamps and integers get stored as proper timestamp and int64 columns. Fields with complex types (e.g.
+    nested models) get stored as JSON strings.
+
+    This requires `pyarrow` to be installed."""
+
+    def __init__(
+        self,
+        output: IO,
+        model: Type[BaseModel],
+        exclude: Set[str],
+        batch_size: int = COLUMNAR_BATCH_SIZE,
+    ) -> None:
+        super().__init__(output)
+        pa, pq = _pyarrow()
+
+        self.batch_size = batch_size
+        self.names, annotations = _columns(model, exclude)
+        self.extract = _extractor(self.names, [None] * len(self.names))
+        self.converters: List[Optional[Converter]] = []
+        fields = []
+        for name, annotation in zip(self.names, annotations):
+            arrow_type, converter = _arrow_column(annotation)
+            self.converters.append(converter)
+            fields.append(pa.field(name, arrow_type))
+
+        self.schema = pa.schema(fields)
+        self.columns: List[List[Any]] = [[] for _ in self.names]
+        self.rows = 0
+        self.writer = pq.ParquetWriter(output, self.schema, compression="zstd")
+
+    def write(self, entry: BaseModel) -> None:
+        for column, value in zip(self.columns, self.extract(entry)):
+            column.append(value)
+        self.rows += 1
+        if self.rows >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.rows:
+            return
+
+        pa, _ = _pyarrow()
+        arrays = [
+            pa.array(
+                column if converter is None else _convert(column, converter),
+                type=field.type,
+            )
+            for column, converter, field in zip(
+                self.columns, self.converters, self.schema
+            )
+        ]
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+
+        self.columns = [[] for _ in self.names]
+        self.rows = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+        self.output.close()
+
+
+def _at_start(output: IO) -> bool:
+    try:
+        return output.tell() == 0
+    # Non-seekable outputs are taken to be fresh.
+    except (OSError, ValueError):
+        return True
+
+
+def model_fields(model: Type[BaseModel]) -> Iterable[Tuple[str, Any]]:
+    """Returns the names and type annotations of the fields in a model, in serialization order; i.e., regular
+    fields first, followed by computed fields."""
+    for name, field in model.model_fields.items():
+        yield name, field.annotation
+    for name, computed in model.model_computed_fields.items():
+        yield name, computed.return_type
+
+
+def _columns(model: Type[BaseModel], exclude: Set[str]) -> Tuple[List[str], List[Any]]:
+    columns = [
+        (name, annotation)
+        for name, annotation in model_fields(model)
+        if name not in exclude
+    ]
+    return [name for name, _ in columns], [annotation for _, annotation in columns]
+
+
+def _extractor(names: List[str], converters: List[Optional[Converter]]) -> Extractor:
+    """Builds a function which reads the values for a set of fields off of a model instance as a tuple,
+    applying converters to the values of fields which have them."""
+    getter = attrgetter(*names)
+    plain: Extractor = (lambda entry: (getter(entry),)) if len(names) == 1 else getter
+
+    if all(converter is None for converter in converters):
+        return plain
+
+    def extract(entry: BaseModel) -> Tuple[Any, ...]:
+        return tuple(
+            value if converter is None or value is None else converter(value)
+            for value, converter in zip(plain(entry), converters)
+        )
+
+    return extract
+
+
+def _unwrap(annotation: Any) -> Any:
+    """Resolves type aliases and strips `None` out of optional types."""
+    while isinstance(annotation, TypeAliasType):
+        annotation = annotation.__value__
+
+    if get_origin(annotation) in (Union, UnionType):
+        args = tuple(arg for arg in get_args(annotation) if arg is not type(None))
+        return _unwrap(args[0]) if len(args) == 1 else Union[args]
+
+    return annotation
+
+
+def _is_scalar(annotation: Any) -> bool:
+    return (
+        annotation in _SCALARS
+        or annotation == _NUMBER
+        or (isinstance(annotation, type) and issubclass(annotation, Enum))
+    )
+
+
+def _python_converter(
+    annotation: Any, compact_timestamps: bool = False
+) -> Optional[Converter]:
+    """Values of scalar fields are the same in Python mode dumps as they are as attributes, so only complex
+    fields (and timestamps, when those are to be made compact) need converting."""
+    annotation = _unwrap(annotation)
+    if compact_timestamps and annotation is datetime.datetime:
+        return datetime_to_epoch_ns
+    if _is_scalar(annotation):
+        return None
+    return TypeAdapter(annotation).dump_python
+
+
+def _convert(column: List[Any], converter: Converter) -> List[Any]:
+    return [None if value is None else converter(value) for value in column]
+
+
+def _arrow_column(annotation: Any) -> Tuple[Any, Optional[Converter]]:
+    """Maps a field's type annotation onto an Arrow type, and a converter for values which Arrow
+    cannot take as they are."""
+    pa, _ = _pyarrow()
+
+    annotation = _unwrap(annotation)
+    if annotation == _NUMBER:
+        return pa.float64(), None
+    if annotation is datetime.datetime:
+        return pa.timestamp("ns", tz="UTC"), None
+    if annotation is bool:
+        return pa.bool_(), None
+    if annotation is int:
+        return pa.int64(), None
+    if annotation is float:
+        return pa.float64(), None
+    if annotation is str:
+        return pa.string(), None
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return pa.string(), _enum_value
+
+    return pa.string(), _to_json_string
+
+
+def _enum_value(value: Enum) -> Any:
+    return value.value
+
+
+def _to_json_string(value: Any) -> str:
+    return to_json(value).decode("utf-8")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError(
+            "Columnar output formats require pyarrow to be installed "
+            "(e.g. with `poetry install --extras columnar`)."
+        ) from err
+
+    return pyarrow, pyarrow.parquet